@@ -6,23 +6,92 @@ User interface code for the contrarian strategy tester.
 
 # Import necessary libraries and functions.
 import os
+import time
+from functools import partial
 import dash
 from dash import dcc, html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State
+from flask_compress import Compress
+from dash.dependencies import Input, Output, State, MATCH
+from dash.exceptions import PreventUpdate
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
+import pandas as pd
 from functions import daily_return, contrarian_portfolio_ret, contrarian_portfolio_tbl_fmt, lin_plt, summary_stats, \
-                      sum_stat_tbl_fmt, generic_tbl_fmt, yearly_summaries, yrly_sum_stat_tbl_fmt, ann_plt
-import math
+                      sum_stat_tbl_fmt, generic_tbl_fmt, period_summaries, yrly_sum_stat_tbl_fmt, ann_plt, \
+                      rolling_stats, roll_plt, page_frame, GL_THRESHOLD, validity_mask, \
+                      coverage_report, coverage_tbl_fmt, corr_heatmap, pairs_tbl_fmt
+from correlation import correlation_summary, HEATMAP_MAX_TICKERS
+from price_store import PriceStore, DelayedSource
+from result_cache import ResultCache, cache_key
+from jobs import JobQueue, FINISHED
+import metrics
+import export
+from export import export_url, EXPORT_FORMATS
+from metrics import timed, collect, record_time
 
 # Set the external stylesheet reference.
 external_stylesheets = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
 
-# Initialize the app, not calling the callbacks upon initialization.
-app = dash.Dash(__name__, prevent_initial_callbacks=True, external_stylesheets=external_stylesheets)
+# Initialize the app, not calling the callbacks upon initialization. Callback exceptions are suppressed since the paged
+# DataTables the callbacks refer to are only created once the strategy is run.
+app = dash.Dash(__name__, prevent_initial_callbacks=True, external_stylesheets=external_stylesheets,
+                suppress_callback_exceptions=True)
 server = app.server
 
+# Compress responses (ie. callback responses and the app's scripts) with brotli or gzip. The table downloads on /export
+# are streamed as they are (See export.py), since their mimetypes are not compressed and they must not be buffered.
+server.config['COMPRESS_STREAMS'] = False
+Compress(server)
+
+# Serve per-stage timings and payload sizes on /metrics and in Server-Timing response headers. These are added after
+# compression is, so they are recorded before each response is compressed.
+metrics.init_app(server)
+
+# Local on-disk price store. Prices already collected from Yahoo Finance are served from disk, and only missing date
+# ranges are collected again. If PRICE_SOURCE is 'synthetic', seeded synthetic prices (See synthetic.SyntheticSource),
+# delayed by SYNTHETIC_DELAY seconds a ticker, are collected instead, so the app runs without a network connection (ie.
+# for load testing, See benchmarks/load_test.py).
+price_source = None
+if os.environ.get('PRICE_SOURCE') == 'synthetic':
+    from synthetic import SyntheticSource
+    price_source = DelayedSource(SyntheticSource(gap_fraction=float(os.environ.get('SYNTHETIC_GAP_FRACTION', 0.0))),
+                                 float(os.environ.get('SYNTHETIC_DELAY', 0.0)))
+price_store = PriceStore(os.environ.get('PRICE_STORE_DIR', 'price_store'), price_source)
+
+# Result cache shared by all the app's worker processes, bounded to RESULT_CACHE_MAX_BYTES in total.
+result_cache = ResultCache(os.environ.get('RESULT_CACHE_PATH', 'result_cache.sqlite3'),
+                           max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', 512 * 1024 ** 2)))
+
+# Number of seconds results for date ranges ending within the last few days are kept in the result cache, since the
+# latest prices may still change.
+RESULT_CACHE_RECENT_TTL = int(os.environ.get('RESULT_CACHE_RECENT_TTL', 3600))
+
+# Function that returns the time to live to keep results for a date range ending on end_date in the result cache with:
+# RESULT_CACHE_RECENT_TTL seconds if the range ends within the last few days, otherwise None (no expiry). Every part of
+# a run's results is kept with the same time to live, so none of them outlives the others.
+def result_ttl(end_date):
+    recent = datetime.strptime(str(end_date)[:10], '%Y-%m-%d') >= datetime.now() - relativedelta(days=5)
+    return RESULT_CACHE_RECENT_TTL if recent else None
+
+# Serve downloads of the result tables kept in the result cache on /export (See export_links).
+export.init_app(server, result_cache)
+
+# Background job queue shared by all the app's worker processes. Strategy runs are submitted to it rather than run in
+# the request, so they never hold a worker or hit the worker timeout. Each worker runs jobs on JOB_PROCESSES processes,
+# started from a fork server which has already imported this module (and in preload mode, loaded the price store, See
+# job_preload.py), so a new job process does not import it again.
+job_queue = JobQueue(os.environ.get('JOB_DB_PATH', 'jobs.sqlite3'), processes=int(os.environ.get('JOB_PROCESSES', 2)),
+                     preload=['job_preload'])
+
+# Number of bootstrap resamples used for the confidence intervals of the summary statistics (See core.bootstrap_ci), or
+# 0 to leave them out.
+BOOTSTRAP_RESAMPLES = int(os.environ.get('BOOTSTRAP_RESAMPLES', 2000))
+
+# Descriptions of the stages of a running strategy run, shown while it runs.
+JOB_STAGES = {'queued': 'Queued', 'fetching': 'Collecting prices', 'computing': 'Running the strategy',
+              'formatting': 'Formatting results'}
+
 # Define the app layout.
 app.layout = html.Div(children=[
              # Header with "Contrarian Strategy Tester" header.
@@ -55,7 +124,18 @@ app.layout = html.Div(children=[
                  html.H5('Trading Days per Year'),
                  dcc.Input(id='trading_days', style={'display': 'block'}),
                  # Button to press in order to initiate callback.
-                 dbc.Button("Run Contrarian Strategy", id='run', outline=True)
+                 dbc.Button("Run Contrarian Strategy", id='run', outline=True),
+                 # Button to press in order to cancel a strategy run in progress, and the progress of the run.
+                 dbc.Button("Cancel", id='cancel', outline=True),
+                 html.Div(id='job_status'),
+                 # The strategy run in progress, which is polled every half second until it finishes, and the finished
+                 # run whose results are displayed.
+                 dcc.Store(id='job'),
+                 dcc.Store(id='job_done'),
+                 # The cache keys of the two stages of the finished run's results (See update_views).
+                 dcc.Store(id='strategy_view'),
+                 dcc.Store(id='stats_view'),
+                 dcc.Interval(id='job_poll', interval=500, disabled=True)
              ]
              ),
              # The first (right-most) column where output from the callback will be displayed.
@@ -68,9 +148,11 @@ app.layout = html.Div(children=[
                  html.H3('Historic Strategy Returns'),
                  dcc.Loading(id='load-graph', children=[
                          dcc.Tabs([
-                             dcc.Tab(label='Daily Strategy Returns', children=[dcc.Graph(id='dret_graph')]),
+                             dcc.Tab(label='Daily Strategy Returns', children=[dcc.Graph(id='dret_graph'),
+                                                                               dcc.Store(id='dret_key')]),
                              dcc.Tab(label='Annualized Daily Strategy Returns and Standard Deviations of Daily Strategy Returns',
                                      children=[dcc.Graph(id='ann_graph')]),
+                             dcc.Tab(label='Rolling Strategy Performance', children=[dcc.Graph(id='roll_graph')]),
                      ])], type='circle'),
                  # Historical data tables display. Displays a loading circle while callback is running.
                  html.H3('Historical Data'),
@@ -79,93 +161,483 @@ app.layout = html.Div(children=[
                          dcc.Tab(label='Daily Stock Returns', id='dret'),
                          dcc.Tab(label='Pearson Correlations of Daily Stock Returns', id='retcorr'),
                          dcc.Tab(label='Daily Weights, Collateral, and Strategy Returns', id='dwcr'),
-                         dcc.Tab(label='Summary Statistics by Year', id='ssby')
+                         dcc.Tab(label='Summary Statistics by Month', id='ssbm'),
+                         dcc.Tab(label='Summary Statistics by Quarter', id='ssbq'),
+                         dcc.Tab(label='Summary Statistics by Year', id='ssby'),
+                         dcc.Tab(label='Ticker Coverage', id='cover')
                      ])
                  ], type='circle')],
                  )
              ])
 '''
-Callback which calls function update dashboard that takes user input tickers, date range, and trading days per year and 
-outputs the results of using a contrarian strategy with said inputs to the dash app. Results include:
+Callback which calls function manage_job whenever the run or cancel button is pressed, and every half second while a
+strategy run is in progress. Pressing the run button submits a strategy run with the user input tickers, date range, and
+trading days per year to the background job queue, cancelling any run of the user's still in progress, and starts
+polling it. Pressing the cancel button cancels the run in progress. While polling, the stage the run is in (ie.
+collecting prices for N of M tickers, running the strategy, or formatting results) is displayed under the buttons. Once
+the run finishes, polling stops, and unless the run was cancelled, it is set as the finished run so its results are
+displayed (See update_views).
+'''
+@app.callback(
+    [Output(component_id='job', component_property='data'),
+     Output(component_id='job_poll', component_property='disabled'),
+     Output(component_id='job_status', component_property='children'),
+     Output(component_id='job_done', component_property='data')],
+    [Input(component_id='run', component_property='n_clicks'),
+     Input(component_id='cancel', component_property='n_clicks'),
+     Input(component_id='job_poll', component_property='n_intervals')],
+    [State(component_id='ticker_list', component_property='value'),
+     State(component_id='date_range', component_property='start_date'),
+     State(component_id='date_range', component_property='end_date'),
+     State(component_id='trading_days', component_property='value'),
+     State(component_id='job', component_property='data')]
+)
+def manage_job(run_click, cancel_click, n_intervals, ticker_list, start_date, end_date, trading_days, job):
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+    if 'run.n_clicks' in triggered:
+        if job is not None:
+            job_queue.cancel(job['id'])
+
+        # Take user-entered string of tickers and convert it to a list, dropping repeated tickers, then submit the run.
+        ticks = list(dict.fromkeys(str(ticker_list).replace(' ', '').upper().split(',')))
+        job = {'ticks': ticks, 'start_date': start_date, 'end_date': end_date, 'trading_days': trading_days}
+        job['id'] = job_queue.submit(run_strategy_job, ticks, start_date, end_date, trading_days)
+        return job, False, JOB_STAGES['queued'], dash.no_update
+
+    if job is None:
+        raise PreventUpdate
+    if 'cancel.n_clicks' in triggered:
+        job_queue.cancel(job['id'])
+    status = job_queue.status(job['id'])
+    if status is None:
+        return dash.no_update, True, '', dash.no_update
+    return dash.no_update, status['status'] in FINISHED, job_status_text(status), \
+           job if status['status'] in ('done', 'failed') else dash.no_update
+
+# Function that returns a description of the state of a strategy run (See JobQueue.status) for display.
+def job_status_text(status):
+    if status['status'] == 'done':
+        return 'Finished in {:.1f} seconds'.format(status['updated'] - status['created'])
+    if status['status'] in ('failed', 'cancelled'):
+        return status['status'].capitalize()
+    if status['stage'] == 'fetching':
+        return '{}: {} of {} tickers'.format(JOB_STAGES['fetching'], status['done'], status['total'])
+    return JOB_STAGES.get(status['stage'], '')
+
+'''
+Callback which calls function update_views whenever a strategy run finishes. The run's results are kept in the shared
+result cache in two stages (See dashboard_results): the strategy stage, which depends only on the tickers and date
+range, and the statistics stage, which also depends on the trading days per year. The cache keys of the two stages
+(along with the inputs they were made from) are set in the strategy_view and stats_view stores, which the callbacks
+drawing the results are triggered by. A stage's store is only set when its key changes, so the outputs of a stage that
+did not change (ie. everything but the statistics when only the trading days per year change) are not rebuilt or sent to
+the browser again. If the run failed, its error message is set in both stores instead.
+'''
+@app.callback(
+    [Output(component_id='strategy_view', component_property='data'),
+     Output(component_id='stats_view', component_property='data')],
+    [Input(component_id='job_done', component_property='data')],
+    [State(component_id='strategy_view', component_property='data'),
+     State(component_id='stats_view', component_property='data')]
+)
+def update_views(job, strategy_view, stats_view):
+    # If the run failed, set its error. Otherwise, count the time the run spent in each stage towards this request's
+    # timings.
+    status = job_queue.status(job['id'])
+    if status is None or status['status'] != 'done':
+        error = {'error': 'ERROR - The strategy run could not be found. Please run the strategy again.'
+                 if status is None else status['error']}
+        return error, error
+    for name, seconds in status['result']:
+        record_time(name, seconds)
+
+    # Set the key of each stage, unless it is already set.
+    strategy_inputs = [job['ticks'], job['start_date'], job['end_date']]
+    stats_inputs = strategy_inputs + [job['trading_days']]
+    new_strategy_view = {'key': stage_key('strategy', *strategy_inputs), 'inputs': strategy_inputs}
+    new_stats_view = {'key': stage_key('stats', *stats_inputs), 'inputs': stats_inputs}
+    return new_strategy_view if new_strategy_view != strategy_view else dash.no_update, \
+           new_stats_view if new_stats_view != stats_view else dash.no_update
+
+'''
+Callback which calls function update_strategy_outputs whenever the strategy stage of the results changes (See
+update_views) and outputs the results which depend only on the tickers and date range:
+    - Exportable tables with 
+            > The chosen stocks' daily returns
+            > The daily calculated weights for each stock, required collateral, and strategy return
+            > When each chosen stock entered or left the universe over the date range.
+      The rows of the daily calculated weights for each stock, required collateral, and strategy return table are
+      highlighted red when there is a loss that day and green when there is a gain that day.
+    - A heatmap of the Pearson correlations of the chosen stocks' daily returns, with the stocks clustered so groups of
+      highly correlated stocks sit together, and tables of the most and least correlated pairs of stocks.
+    - The cache key of the contrarian strategy returns, which the line plot of the strategy's daily returns is drawn
+      from (See update_dret_graph).
+The large tables are paged on the server, so only their first pages are sent to the browser, with links to download them
+(and the full correlation matrix) in full from the server. If the run failed, its error message is displayed instead.
+'''
+@app.callback(
+    [Output(component_id='dret', component_property='children'),
+     Output(component_id='retcorr', component_property='children'),
+     Output(component_id='dwcr', component_property='children'),
+     Output(component_id='cover', component_property='children'),
+     Output(component_id='dret_key', component_property='data')],
+    [Input(component_id='strategy_view', component_property='data')]
+)
+def update_strategy_outputs(strategy_view):
+    # Establish error handling with try/except block.
+    try:
+        if 'error' in strategy_view:
+            raise Exception(strategy_view['error'])
+
+        # Load the strategy stage of the results, or compute it again here if it has been evicted from the cache since.
+        with timed('cache_get'):
+            view, frames = load_stage(strategy_view, strategy_stage)
+        keys = view['keys']
+        with timed('format'):
+            return [export_links('returns', keys['dret']),
+                    paged_table(generic_tbl_fmt, frames['dret'], keys['dret'])], \
+                   [export_links('correlations', keys['dret'])] + correlation_tab(view['correlations']), \
+                   [export_links('weights', keys['dwcr']),
+                    paged_table(contrarian_portfolio_tbl_fmt, frames['dwcr'], keys['dwcr'])], \
+                   [coverage_tbl_fmt(view['coverage'])], \
+                   keys['dwcr']
+
+    # If an exception is raised, print the exception message to the dash app and leave the plot blank.
+    except Exception as e:
+        return [str(e)], [str(e)], [str(e)], [str(e)], None
+
+'''
+Callback which calls function update_stats_outputs whenever the statistics stage of the results changes (See
+update_views) and outputs the results which depend on the trading days per year:
     - A summary statistics table with average daily return, standard deviation of daily returns, annualized daily 
       returns, annualized standard deviation of daily returns, and sharpe ratio of the strategy
-    - A line plot of the strategy's daily returns
     - A line plot of the strategy's annualized standard deviation of the strategy's daily returns overlaid on a bar plot
       of the strategy's annualized average daily returns for each year of the selected date range.
-    - Exportable tables with 
-            > The chosen stocks' daily returns
-            > The Pearson correlations of the chosen stocks' daily returns
-            > The daily calculated weights for each stock, required collateral, and strategy return
-            > The summary statistics from before by year. 
-      These tables export in csv format. The rows of the daily calculated weights for each stock, required collateral, 
-      and strategy return and the summary statistics from before by year tables are highlighted red when there is a loss
-      that day and green when there is a gain that day.
+    - Line plots of the strategy's rolling 21, 63, and 252 day annualized average daily returns, annualized standard 
+      deviations of daily returns, annualized sharpe ratios, and maximum drawdowns.
+    - Exportable tables of the summary statistics from before by month, quarter, and year, whose rows are highlighted
+      red for periods with a loss and green for periods with a gain.
+If the run failed, its error message is displayed instead.
 '''
 @app.callback(
     [Output(component_id='summary-stats', component_property='children'),
-     Output(component_id='dret_graph', component_property='figure'),
      Output(component_id='ann_graph', component_property='figure'),
-     Output(component_id='dret', component_property='children'),
-     Output(component_id='retcorr', component_property='children'),
-     Output(component_id='dwcr', component_property='children'),
+     Output(component_id='roll_graph', component_property='figure'),
+     Output(component_id='ssbm', component_property='children'),
+     Output(component_id='ssbq', component_property='children'),
      Output(component_id='ssby', component_property='children')],
-    [Input(component_id='run', component_property='n_clicks')],
-    [State(component_id='ticker_list', component_property='value'),
-     State(component_id='date_range', component_property='start_date'),
-     State(component_id='date_range', component_property='end_date'),
-     State(component_id='trading_days', component_property='value')]
+    [Input(component_id='stats_view', component_property='data')]
 )
-def update_dashboard(click, ticker_list, start_date, end_date, trading_days):
+def update_stats_outputs(stats_view):
     # Establish error handling with try/except block.
     try:
-        # Take user-entered string of tickers and convert it to a list. If the resulting list only has a length of 1,
-        # raise an exception.
-        ticks = str(ticker_list).replace(' ', '').split(',')
-        if len(ticks) <= 1:
-            raise Exception('ERROR - More than 1 ticker must be used')
-
-        # Call function daily_return to collect the return data for all input tickers. Then test whether there are any
-        # NaN values in the return data collected. If there are, raise an exception and let the user know which tickers
-        # have missing or incomplete data (Have NaNs or blanks in their returns).
-        dr = daily_return(ticks, start_date, end_date)
-        ret_test = {l: any(math.isnan(i) for i in dr[l]) for l in ticks}
-        if True in ret_test.values():
-            ticks_missing_data = [i for i in ret_test if ret_test[i] is True]
-            raise ValueError('ERROR - Missing or incomplete data found for the following tickers: ' + \
-                             str(ticks_missing_data).replace('[', '').replace(']', '').replace("'",'') + \
-                             '. Please confirm these tickers existed for all dates in the date range specified and try again.')
-
-        # Run the contrarian strategy using the daily returns collected and stored into dr.
-        res_wts_ret = contrarian_portfolio_ret(dr)
-        # Take the returns of the contrarian strategy and calculate the overall summary statistics. These include
-        # average daily return, standard deviation of daily returns, annualized daily returns, annualized standard
-        # deviation of daily returns, and annualized sharpe ratio of the strategy.
-        sum_stats = summary_stats(res_wts_ret[2], trading_days)
-        # Take the returns of the contrarian strategy and calculate the summary statistics for each year. These include
-        # average daily return, standard deviation of daily returns, annualized daily returns, annualized standard
-        # deviation of daily returns, and annualized sharpe ratio of the strategy.
-        yrly_sum_stats = yearly_summaries(res_wts_ret[2], trading_days)
-
-        # Determine the Pearson correlation between the returns of each ticker.
-        res_wts_ret[2]['Date'] = res_wts_ret[2]['Date'].dt.date
-        dcorr = dr.corr(method = 'pearson', min_periods = 1).reset_index()
-        dcorr = dcorr.rename(columns = {'index': ''})
-
-        # Return the summary statistics table, contrarian strategy daily return line plot, contrarian strategy
-        # annualized daily returns and annualized standard deviations of the contrarian strategy daily returns plot,
-        # the tickers' daily stock returns table, the Pearson correlations table, the daily weights, collateral, and
-        # contrarian strategy returns table, and the summary statistics by year table.
-        return [sum_stat_tbl_fmt(sum_stats)], lin_plt(res_wts_ret[2]), ann_plt(yrly_sum_stats), \
-               [generic_tbl_fmt(res_wts_ret[0])], [generic_tbl_fmt(dcorr)], \
-               [contrarian_portfolio_tbl_fmt(res_wts_ret[2])], [yrly_sum_stat_tbl_fmt(yrly_sum_stats)]
+        if 'error' in stats_view:
+            raise Exception(stats_view['error'])
+
+        # Load the statistics stage of the results, or compute it again here if it has been evicted from the cache
+        # since.
+        with timed('cache_get'):
+            view, frames = load_stage(stats_view, stats_stage)
+        keys = view['keys']
+        with timed('format'):
+            return [sum_stat_tbl_fmt(view['sum_stats'])], ann_plt(view['yrly_sum_stats']), \
+                   roll_plt(view['roll_stats']), \
+                   [export_links('monthly_summaries', keys['ssbm']),
+                    paged_table(partial(yrly_sum_stat_tbl_fmt, period='Month'), frames['ssbm'], keys['ssbm'])], \
+                   [export_links('quarterly_summaries', keys['ssbq']),
+                    paged_table(partial(yrly_sum_stat_tbl_fmt, period='Quarter'), frames['ssbq'], keys['ssbq'])], \
+                   [export_links('yearly_summaries', keys['ssby']),
+                    paged_table(yrly_sum_stat_tbl_fmt, frames['ssby'], keys['ssby'])]
 
     # If an exception is raised, print the exception message to the dash app and leave the plot elements blank.
     except Exception as e:
-        return [str(e)], {}, {}, \
-               [str(e)], \
-               [str(e)], \
-               [str(e)], \
-               [str(e)]
+        return [str(e)], {}, {}, [str(e)], [str(e)], [str(e)]
+
+# Function run by the background job queue for each strategy run. Runs the strategy (See dashboard_results), reporting
+# its progress through progress, and returns the time spent in each stage of the run as (name, seconds) pairs.
+def run_strategy_job(progress, ticks, start_date, end_date, trading_days):
+    with collect() as timings:
+        dashboard_results(ticks, start_date, end_date, trading_days, progress)
+    return timings
+
+# Function that returns the cache key of a stage ('strategy' or 'stats') of the results for the input tickers, date
+# range, and (for the statistics stage) trading days per year.
+def stage_key(stage, ticks, *inputs):
+    return cache_key('dashboard-' + stage, tuple(ticks), *(str(i) for i in inputs))
+
+# Function that computes everything the dashboard displays for a list of tickers, date range, and trading days per year,
+# and keeps it in the shared result cache in two stages (See strategy_stage and stats_stage) for the callbacks drawing
+# the results to load. Stages already in the cache are not computed again, so a run with only the trading days per year
+# changed only computes the statistics. If progress is given (See jobs.JobProgress), the stage of the run is reported
+# through it.
+def dashboard_results(ticks, start_date, end_date, trading_days, progress=None):
+    # If the list of tickers only has a length of 1, raise an exception.
+    if len(ticks) <= 1:
+        raise Exception('ERROR - More than 1 ticker must be used')
+    with timed('cache_get'):
+        cached = [result_cache.get(stage_key('strategy', ticks, start_date, end_date)),
+                  result_cache.get(stage_key('stats', ticks, start_date, end_date, trading_days))]
+
+    # Both stages are made from the same strategy results, so they are only loaded once. The statistics are computed
+    # first, since the strategy stage reformats the dates of the results.
+    if cached[0] is None or cached[1] is None:
+        results = strategy_results(ticks, start_date, end_date, progress)
+        if cached[1] is None:
+            stats_stage(ticks, start_date, end_date, trading_days, progress, results)
+        if cached[0] is None:
+            strategy_stage(ticks, start_date, end_date, progress, results)
+
+# Function that computes the strategy stage of the results for a list of tickers and date range, which does not depend
+# on the trading days per year, and keeps it in the shared result cache. The stage's DataFrames of the paged tables
+# (frames: the daily returns and the contrarian strategy weights, collateral, and returns) are kept under their own
+# keys, where update_table_page serves their pages from, and the rest of the stage (view: the correlation summary and
+# ticker coverage report, along with the cache keys of the paged tables, view['keys']) under the stage's key. Returns
+# view and frames. The strategy results (See strategy_results) are collected here unless given as results.
+def strategy_stage(ticks, start_date, end_date, progress=None, results=None):
+    # Collect the daily returns, run the contrarian strategy on them, summarize the Pearson correlations between
+    # the returns of each ticker, and report which tickers entered or left during the date range, or reuse the
+    # results of an earlier run with the same tickers and dates.
+    if results is None:
+        results = strategy_results(ticks, start_date, end_date, progress)
+    dr, res_wts_ret, correlations, coverage = results
+
+    # Reformat the dates of the contrarian strategy returns for display.
+    if progress is not None:
+        progress.stage('formatting')
+    res_wts_ret[2]['Date'] = pd.to_datetime(res_wts_ret[2]['Date']).dt.date
+
+    run_key = (tuple(ticks), str(start_date), str(end_date))
+    frames = {'dret': res_wts_ret[0], 'dwcr': res_wts_ret[2]}
+    view = {'correlations': correlations, 'coverage': coverage,
+            'keys': {'dret': cache_key('table-dret', *run_key), 'dwcr': cache_key('table-dwcr', *run_key)}}
+    ttl = result_ttl(end_date)
+    with timed('cache_set'):
+        for name, df in frames.items():
+            result_cache.set(view['keys'][name], df, ttl=ttl)
+        result_cache.set(stage_key('strategy', ticks, start_date, end_date), view, ttl=ttl)
+    return view, frames
+
+# Function that computes the statistics stage of the results for a list of tickers, date range, and trading days per
+# year, and keeps it in the shared result cache the same way as strategy_stage. The stage holds the summary statistics,
+# summary statistics by year, and rolling statistics (view), and the summary statistics by month, quarter, and year as
+# paged tables (frames). Returns view and frames. The strategy results (See strategy_results) are collected here
+# unless given as results.
+def stats_stage(ticks, start_date, end_date, trading_days, progress=None, results=None):
+    if results is None:
+        results = strategy_results(ticks, start_date, end_date, progress)
+    res_wts_ret = results[1]
+
+    if progress is not None:
+        progress.stage('computing')
+    with timed('stats'):
+        # Take the returns of the contrarian strategy and calculate the overall summary statistics. These include
+        # average daily return, standard deviation of daily returns, annualized daily returns, annualized standard
+        # deviation of daily returns, and annualized sharpe ratio of the strategy, with bootstrap confidence intervals
+        # for the annualized statistics.
+        sum_stats = summary_stats(res_wts_ret[2], trading_days, n_resamples=BOOTSTRAP_RESAMPLES)
+        # Take the returns of the contrarian strategy and calculate the summary statistics for each month, quarter,
+        # and year. These include average daily return, standard deviation of daily returns, annualized daily returns,
+        # annualized standard deviation of daily returns, and annualized sharpe ratio of the strategy, with bootstrap
+        # confidence intervals for the annualized statistics of each year.
+        period_sum_stats = period_summaries(res_wts_ret[2], trading_days, n_resamples=BOOTSTRAP_RESAMPLES,
+                                            ci_periods=('Y',))
+        yrly_sum_stats = period_sum_stats['Y']
+        # Take the returns of the contrarian strategy and calculate the rolling 21, 63, and 252 day annualized
+        # average daily returns, annualized standard deviations of daily returns, annualized sharpe ratios, and
+        # maximum drawdowns of the strategy.
+        roll_stats = rolling_stats(res_wts_ret[2], trading_days)
+
+    run_key = (tuple(ticks), str(start_date), str(end_date), str(trading_days))
+    frames = {'ssbm': period_sum_stats['M'], 'ssbq': period_sum_stats['Q'], 'ssby': yrly_sum_stats}
+    view = {'sum_stats': sum_stats, 'yrly_sum_stats': yrly_sum_stats, 'roll_stats': roll_stats,
+            'keys': {name: cache_key('table-' + name, *run_key) for name in frames}}
+    ttl = result_ttl(end_date)
+    with timed('cache_set'):
+        for name, df in frames.items():
+            result_cache.set(view['keys'][name], df, ttl=ttl)
+        result_cache.set(stage_key('stats', ticks, start_date, end_date, trading_days), view, ttl=ttl)
+    return view, frames
+
+# Function that loads a stage of the results from the shared result cache, given the stage's key and inputs (See
+# update_views), returning its view and frames. If any part of the stage has been evicted, the stage is computed again
+# by compute (ie. strategy_stage) from its inputs.
+def load_stage(stage, compute):
+    view = result_cache.get(stage['key'])
+    frames = {} if view is None else {name: result_cache.get(key) for name, key in view['keys'].items()}
+    if view is None or any(df is None for df in frames.values()):
+        return compute(*stage['inputs'])
+    return view, frames
+
+# Function that returns the contents of the correlations tab from a correlation summary (See correlation_summary): a
+# heatmap of the correlation matrix in clustered order, if there is one, and tables of the most and least correlated
+# pairs of tickers.
+def correlation_tab(correlations):
+    if correlations['matrix'] is None:
+        heatmap = html.P('The correlation heatmap is only drawn for up to {} tickers.'.format(HEATMAP_MAX_TICKERS))
+    else:
+        heatmap = dcc.Graph(figure=corr_heatmap(correlations['matrix']))
+    return [heatmap,
+            html.H5('Most Correlated Pairs'), pairs_tbl_fmt(correlations['most']),
+            html.H5('Least Correlated Pairs'), pairs_tbl_fmt(correlations['least'])]
+
+# Function that returns links to download a table kept in the shared result cache under key, as a file named name, in
+# each export format. The files are streamed from the server (See export.py), so the table never has to be sent to the
+# browser as a whole first.
+def export_links(name, key):
+    links = [html.A(fmt.upper() if fmt != 'csv' else 'CSV (gzip)', href=export_url(name, key, fmt),
+                    style={'marginLeft': '10px'}) for fmt in EXPORT_FORMATS]
+    return html.Div(['Download:'] + links)
+
+# Function that returns a DataTable made by the formatting function fmt which shows the first page of an input DataFrame
+# (df) kept on the server, in the shared result cache under key. The DataTable's id holds the cache key of the
+# DataFrame, so the update_table_page callback can serve its other pages from whichever worker gets the request.
+def paged_table(fmt, df, key):
+    return fmt(df, table_id={'type': 'paged-table', 'key': key})
+
+'''
+Callback which calls function update_table_page whenever the page, sort order, or filter of a paged DataTable changes.
+It loads the DataTable's DataFrame from the shared result cache, then filters, sorts, and pages it on the server, and
+sends only the requested page to the browser.
+'''
+@app.callback(
+    [Output(component_id={'type': 'paged-table', 'key': MATCH}, component_property='data'),
+     Output(component_id={'type': 'paged-table', 'key': MATCH}, component_property='page_count')],
+    [Input(component_id={'type': 'paged-table', 'key': MATCH}, component_property='page_current'),
+     Input(component_id={'type': 'paged-table', 'key': MATCH}, component_property='page_size'),
+     Input(component_id={'type': 'paged-table', 'key': MATCH}, component_property='sort_by'),
+     Input(component_id={'type': 'paged-table', 'key': MATCH}, component_property='filter_query')],
+    [State(component_id={'type': 'paged-table', 'key': MATCH}, component_property='id')]
+)
+def update_table_page(page_current, page_size, sort_by, filter_query, table_id):
+    # If the DataFrame has been evicted from the cache since the table was made, leave the table as it is.
+    df = result_cache.get(table_id['key'])
+    if df is None:
+        raise PreventUpdate
+    return list(page_frame(df, page_current or 0, page_size, sort_by, filter_query))
+
+'''
+Callback which calls function update_dret_graph to draw the daily strategy returns plot whenever the strategy is run
+(which sets the cache key of the strategy returns in dret_key) or the user zooms or pans the plot. Long return series
+are drawn from a downsampled copy of the returns (See lin_plt), so on zooming or panning the plot is redrawn with more
+detail for the newly visible date range.
+'''
+@app.callback(
+    Output(component_id='dret_graph', component_property='figure'),
+    [Input(component_id='dret_key', component_property='data'),
+     Input(component_id='dret_graph', component_property='relayoutData')]
+)
+def update_dret_graph(key, relayout):
+    # Leave the plot blank if the strategy run failed.
+    df = result_cache.get(key) if key else None
+    if df is None:
+        return {}
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+    if 'dret_key.data' in triggered:
+        return lin_plt(df, uirevision=key)
+
+    # Otherwise, work out the visible date range from the relayout event. Autoranging shows the whole date range again.
+    # Short return series are drawn in full, so they never need redrawing.
+    if not relayout or len(df) <= GL_THRESHOLD:
+        raise PreventUpdate
+    if 'xaxis.range[0]' in relayout:
+        x_range = (relayout['xaxis.range[0]'], relayout['xaxis.range[1]'])
+    elif 'xaxis.range' in relayout:
+        x_range = tuple(relayout['xaxis.range'])
+    elif relayout.get('xaxis.autorange'):
+        x_range = None
+    else:
+        raise PreventUpdate
+    return lin_plt(df, x_range=x_range, uirevision=key)
+
+# Function that returns the daily returns, contrarian strategy results (See contrarian_portfolio_ret), summary of the
+# Pearson correlations (See correlation_summary), and ticker coverage report (See coverage_report) for a list of
+# tickers and a date range. Results are kept in the shared result cache under the sorted ticker list and date range, so
+# any worker can reuse them for a later request with the same tickers and dates, whatever the order the tickers were
+# entered in or the trading days per year. Results for ranges ending within the last few days expire after
+# RESULT_CACHE_RECENT_TTL seconds (See result_ttl), since the latest prices may still change. If progress is given (See
+# jobs.JobProgress), the number of tickers collected so far is reported through it.
+def strategy_results(ticks, start_date, end_date, progress=None):
+    key = cache_key('strategy_results', tuple(sorted(ticks)), str(start_date), str(end_date))
+    with timed('cache_get'):
+        cached = result_cache.get(key)
+    if cached is None:
+        sorted_ticks = sorted(ticks)
+
+        # Call function daily_return to collect the return data for all input tickers. Then work out which tickers are
+        # live on each day. If fewer than 2 tickers have any data, raise an exception. Otherwise, tickers which entered
+        # or left during the date range (Have NaNs or blanks in their returns) are handled by running the strategy over
+        # a dynamic universe, and are listed in the coverage report.
+        if progress is not None:
+            progress.stage('fetching', 0, len(sorted_ticks))
+        with timed('fetch'):
+            dr = daily_return(sorted_ticks, start_date, end_date, source=price_store,
+                              progress=None if progress is None else progress.update)
+        mask = validity_mask(dr)
+        coverage = coverage_report(dr, mask)
+        if (coverage['Status'] != 'No data').sum() <= 1:
+            raise ValueError('ERROR - Data was found for fewer than 2 of the tickers in the date range specified. '
+                             'Please confirm the tickers are correct and try again.')
+
+        # Run the contrarian strategy using the daily returns collected and stored into dr, and summarize the Pearson
+        # correlations between the returns of each ticker as the most and least correlated pairs and, for up to
+        # HEATMAP_MAX_TICKERS tickers, the correlation matrix in clustered order.
+        if progress is not None:
+            progress.stage('computing')
+        with timed('strategy'):
+            res_wts_ret = contrarian_portfolio_ret(dr, dynamic_universe=not mask.to_numpy().all())
+        with timed('corr'):
+            correlations = correlation_summary(dr)
+        cached = (dr, res_wts_ret, correlations, coverage)
+        with timed('cache_set'):
+            result_cache.set(key, cached, ttl=result_ttl(end_date))
+
+    # Put the tickers back in the order they were entered in. The correlation matrix stays in clustered order.
+    dr, (daily_ret, excess_ret, results_df), correlations, coverage = cached
+    return dr[ticks], \
+           (daily_ret[['Date'] + ticks], excess_ret[['Date'] + ticks],
+            results_df[['Date'] + ticks + [c for c in results_df.columns if c not in ticks and c != 'Date']].copy()), \
+           correlations, \
+           coverage.set_index('Ticker').loc[ticks].reset_index()
+
+# Function that loads the whole price store into memory (See PriceStore.preload), mapping the snapshot of it in the
+# directory snapshot if given. It is called in each job fork server in preload mode (See job_preload.py), since every
+# strategy run reads its prices in a job process, so every job process the fork server starts shares the prices
+# copy-on-write, and every fork server mapping the same snapshot shares them too. Returns the number of tickers and
+# bytes of prices loaded and the seconds taken.
+def preload(snapshot=None):
+    started = time.perf_counter()
+    n_tickers, n_bytes = price_store.preload(snapshot)
+    return {'tickers': n_tickers, 'bytes': n_bytes, 'load_seconds': time.perf_counter() - started}
+
+# Function that runs the strategy and draws every output of the dashboard once on a small canned input of synthetic
+# prices, so the first real request served does not pay for work done only on first use (ie. plotly loading its figure
+# classes and validators, or pandas and numpy loading the code paths the strategy uses). It also serves the page,
+# layout, and callback list once through Flask's test client, which runs the setup Dash does on its first request before
+# any real request can race it. Nothing is read from or written to the price store or result cache, and no threads or
+# processes are started. Returns the seconds taken.
+def warm_up():
+    started = time.perf_counter()
+    with server.test_client() as client:
+        for path in ('/', '/_dash-layout', '/_dash-dependencies'):
+            client.get(path)
+    from synthetic import synthetic_closes
+    from plotly.io.json import to_json_plotly
+    closes = synthetic_closes(5, 300, gap_fraction=0.05)
+    dr = closes.ffill().pct_change(1).where(closes.bfill().notna()).iloc[1:]
+    mask = validity_mask(dr)
+    coverage = coverage_report(dr, mask)
+    daily_ret, excess_ret, results_df = contrarian_portfolio_ret(dr, dynamic_universe=not mask.to_numpy().all())
+    sum_stats = summary_stats(results_df, 252, n_resamples=min(BOOTSTRAP_RESAMPLES, 100))
+    period_sum_stats = period_summaries(results_df, 252, n_resamples=min(BOOTSTRAP_RESAMPLES, 100), ci_periods=('Y',))
+    roll_stats = rolling_stats(results_df, 252)
+    results_df['Date'] = pd.to_datetime(results_df['Date']).dt.date
+    outputs = [generic_tbl_fmt(daily_ret), contrarian_portfolio_tbl_fmt(results_df), coverage_tbl_fmt(coverage),
+               correlation_tab(correlation_summary(dr)), sum_stat_tbl_fmt(sum_stats), ann_plt(period_sum_stats['Y']),
+               roll_plt(roll_stats), lin_plt(results_df),
+               partial(yrly_sum_stat_tbl_fmt, period='Month')(period_sum_stats['M'], table_id={'key': 'warm-up'}),
+               list(page_frame(results_df, 0, 20, [{'column_id': 'Date', 'direction': 'desc'}], None))]
+    to_json_plotly(outputs)
+    return time.perf_counter() - started
 
 
 # Run the app.
@@ -0,0 +1,119 @@
+'''
+Daniel McNulty II
+
+Headless batch runner for the contrarian strategy tester. Runs the strategy for a file of tickers over a date range
+without the dashboard, and writes the daily returns, correlations, weights, and summary tables as Parquet or Arrow
+files. Only the computational core (See core.py) is imported, so no dash or plotly code is loaded.
+
+Run from the repository root:
+    python batch.py tickers.txt --start 2015-01-01 --end 2020-01-01 --output results
+    python batch.py tickers.txt --start 2015-01-01 --end 2020-01-01 --trading-days 252 --format arrow --output results
+'''
+
+# Import necessary libraries and functions.
+import argparse
+import os
+import sys
+from core import daily_return, contrarian_portfolio_ret, validity_mask, coverage_report, summary_stats, \
+                 period_summaries, rolling_stats, multi_lookback_ret, lookback_comparison
+from correlation import corr_matrix
+from price_store import PriceStore
+
+# File extension used for each output format.
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Function that reads the tickers from a file, separated by commas, spaces, or new lines, dropping repeated tickers.
+def read_tickers(path):
+    with open(path) as f:
+        return list(dict.fromkeys(t.upper() for t in f.read().replace(',', ' ').split()))
+
+# Function that runs the contrarian strategy for a list of tickers over a date range, collecting prices through source
+# (ie. a PriceStore), and returns a dictionary of the resulting tables by name:
+#       - daily_returns: The daily returns of each ticker.
+#       - correlations: The Pearson correlations of the tickers' daily returns.
+#       - weights: The daily weights of each ticker, collateral needed, and strategy return.
+#       - summary_stats: The summary statistics of the strategy.
+#       - monthly_summaries, quarterly_summaries, and yearly_summaries: The summary statistics of the strategy for each
+#         month, quarter, and year.
+#       - rolling_stats: The rolling 21, 63, and 252 day statistics of the strategy.
+#       - coverage: When each ticker entered or left the universe over the date range.
+# Tickers which entered or left during the date range are handled the same way the dashboard handles them (See
+# core.contrarian_portfolio_ret). If lookbacks are given, the strategy is also run for every combination of those
+# lookbacks and holdings (See core.multi_lookback_ret), adding the tables:
+#       - lookback_returns: The daily collateral needed and strategy return of each combination.
+#       - lookback_comparison: The summary statistics of each combination.
+# If n_resamples is above 0, the summary_stats and yearly_summaries tables include bootstrap confidence intervals for
+# the annualized statistics from that many resamples (See core.bootstrap_ci).
+def run(tickers, start_date, end_date, trading_days, source=None, lookbacks=None, holdings=(1,), n_resamples=0):
+    if len(tickers) <= 1:
+        raise ValueError('ERROR - More than 1 ticker must be used')
+    dr = daily_return(tickers, start_date, end_date, source=source)
+    mask = validity_mask(dr)
+    coverage = coverage_report(dr, mask)
+    if (coverage['Status'] != 'No data').sum() <= 1:
+        raise ValueError('ERROR - Data was found for fewer than 2 of the tickers in the date range specified. '
+                         'Please confirm the tickers are correct and try again.')
+
+    daily_ret, excess_ret, results_df = contrarian_portfolio_ret(dr, dynamic_universe=not mask.to_numpy().all())
+    periods = period_summaries(results_df, trading_days, n_resamples=n_resamples, ci_periods=('Y',))
+    tables = {'daily_returns': dr,
+              'correlations': corr_matrix(dr),
+              'weights': results_df,
+              'summary_stats': summary_stats(results_df, trading_days, n_resamples=n_resamples),
+              'monthly_summaries': periods['M'],
+              'quarterly_summaries': periods['Q'],
+              'yearly_summaries': periods['Y'],
+              'rolling_stats': rolling_stats(results_df, trading_days),
+              'coverage': coverage}
+    if lookbacks:
+        lookback_ret = multi_lookback_ret(dr, lookbacks, holdings)[1]
+        tables['lookback_returns'] = lookback_ret
+        tables['lookback_comparison'] = lookback_comparison(lookback_ret, trading_days, lookbacks, holdings)
+    return tables
+
+# Function that writes a DataFrame to path in the input format ('parquet' or 'arrow', the Arrow IPC file format).
+def write_table(df, path, fmt):
+    if fmt == 'parquet':
+        df.to_parquet(path)
+        return
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df)
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the contrarian strategy without the dashboard.')
+    parser.add_argument('tickers', help='Path of a file of tickers separated by commas, spaces, or new lines.')
+    parser.add_argument('--start', required=True, help='Start date (inclusive) as YYYY-MM-DD.')
+    parser.add_argument('--end', required=True, help='End date (exclusive) as YYYY-MM-DD.')
+    parser.add_argument('--trading-days', type=float, default=252, help='Trading days per year (default: 252).')
+    parser.add_argument('--output', default='.', help='Directory to write the tables to (default: %(default)s).')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='parquet',
+                        help='Format of the tables written (default: %(default)s).')
+    parser.add_argument('--lookbacks', help='Comma separated lookbacks in days (ie. 1,5,10,21,63) to also run and '
+                                            'compare the strategy for.')
+    parser.add_argument('--holdings', default='1',
+                        help='Comma separated holding periods in days to run each lookback for (default: %(default)s).')
+    parser.add_argument('--resamples', type=int, default=0,
+                        help='Bootstrap resamples for confidence intervals of the summary statistics (default: none).')
+    parser.add_argument('--price-store', default=os.environ.get('PRICE_STORE_DIR', 'price_store'),
+                        help='Directory of the on-disk price store (default: %(default)s).')
+    args = parser.parse_args()
+
+    try:
+        tables = run(read_tickers(args.tickers), args.start, args.end, args.trading_days,
+                     source=PriceStore(args.price_store),
+                     lookbacks=[int(k) for k in args.lookbacks.split(',')] if args.lookbacks else None,
+                     holdings=[int(h) for h in args.holdings.split(',')], n_resamples=args.resamples)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    os.makedirs(args.output, exist_ok=True)
+    for name, df in tables.items():
+        path = os.path.join(args.output, name + FORMATS[args.format])
+        write_table(df, path, args.format)
+        print(path)
+
+if __name__ == '__main__':
+    main()
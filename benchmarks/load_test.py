@@ -0,0 +1,237 @@
+'''
+Daniel McNulty II
+
+Load test harness for the contrarian strategy tester. Starts the app under gunicorn with seeded synthetic prices in
+place of Yahoo Finance (PRICE_SOURCE=synthetic, See app.py), so it runs without a network connection, then has many
+simulated users run the strategy at once, each with their own ticker lists and date ranges. Each run replays the
+callback requests the browser makes: submitting the run, polling it every half second until it finishes, and loading its
+results. The throughput and latency percentiles of the runs, and of each kind of request, are reported for each gunicorn
+configuration, to show where the CPU bound strategy runs saturate the server.
+
+Configurations are given as CLASS:WORKERS[xTHREADS][:JOB_PROCESSES], where CLASS is a gunicorn worker class (ie. sync
+or gthread), and JOB_PROCESSES is the number of processes each worker runs strategy runs on (See jobs.JobQueue).
+
+Run from the repository root:
+    python -m benchmarks.load_test --configs sync:2,gthread:2x4,gthread:2x4:4 --users 8 --runs 4
+    python -m benchmarks.load_test --configs gthread:4x4 --users 16 --tickers 50,200 --output load.json
+'''
+
+# Import necessary libraries and functions.
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import requests
+
+# Outputs of each callback the simulated users call, in the order the app declares them.
+MANAGE_JOB = ['job.data', 'job_poll.disabled', 'job_status.children', 'job_done.data']
+UPDATE_VIEWS = ['strategy_view.data', 'stats_view.data']
+STRATEGY_OUTPUTS = ['dret.children', 'retcorr.children', 'dwcr.children', 'cover.children', 'dret_key.data']
+STATS_OUTPUTS = ['summary-stats.children', 'ann_graph.figure', 'roll_graph.figure', 'ssbm.children', 'ssbq.children',
+                 'ssby.children']
+
+# Function that parses a configuration (See the module docstring) into a dictionary.
+def parse_config(config):
+    parts = config.split(':')
+    workers, _, threads = parts[1].partition('x')
+    return {'config': config, 'worker_class': parts[0], 'workers': int(workers), 'threads': int(threads or 1),
+            'job_processes': int(parts[2]) if len(parts) > 2 else 2}
+
+# Function that starts gunicorn serving the app on a free local port with a configuration, keeping the price store,
+# result cache, and job database in directory, and returns the process and the app's base URL once it is serving.
+def start_server(config, directory, fetch_delay, gap_fraction):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, PRICE_STORE_DIR=os.path.join(directory, 'price_store'),
+               RESULT_CACHE_PATH=os.path.join(directory, 'result_cache.sqlite3'),
+               JOB_DB_PATH=os.path.join(directory, 'jobs.sqlite3'), JOB_PROCESSES=str(config['job_processes']),
+               PRICE_SOURCE='synthetic', SYNTHETIC_DELAY=str(fetch_delay), SYNTHETIC_GAP_FRACTION=str(gap_fraction))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--bind', '127.0.0.1:{}'.format(port),
+                               '--workers', str(config['workers']), '--threads', str(config['threads']),
+                               '--worker-class', config['worker_class'], '--timeout', '300', '--log-level', 'warning',
+                               'app:server'], env=env)
+    url = 'http://127.0.0.1:{}'.format(port)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('gunicorn exited with code {}'.format(server.returncode))
+        try:
+            if requests.get(url + '/_dash-layout', timeout=5).ok:
+                return server, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start serving within 60 seconds')
+
+# Simulated user of the dashboard. Each run draws a ticker list and date range from the user's own seeded random
+# generator and replays the callback requests of a strategy run through the app at url, recording the time each request
+# and the whole run took. Between runs, the user waits an exponentially distributed think time.
+class SimulatedUser:
+    def __init__(self, url, seed, n_runs, tickers, universe, years, think_time):
+        self.url = url
+        self.rng = np.random.default_rng(seed)
+        self.n_runs = n_runs
+        self.tickers = tickers
+        self.universe = universe
+        self.years = years
+        self.think_time = think_time
+        self.session = requests.Session()
+        self.run_seconds = []
+        self.request_seconds = {}
+        self.errors = []
+
+    # Function that posts a callback request to the app, returning the response's outputs, and records its time under
+    # kind.
+    def callback(self, kind, outputs, inputs, state=(), changed=None):
+        body = {'output': '..' + '...'.join(outputs) + '..',
+                'outputs': [dict(zip(('id', 'property'), o.split('.'))) for o in outputs],
+                'inputs': [dict(zip(('id', 'property', 'value'), i)) for i in inputs],
+                'state': [dict(zip(('id', 'property', 'value'), s)) for s in state],
+                'changedPropIds': changed or ['{}.{}'.format(*inputs[0][:2])]}
+        start = time.perf_counter()
+        response = self.session.post(self.url + '/_dash-update-component', json=body, timeout=300)
+        self.request_seconds.setdefault(kind, []).append(time.perf_counter() - start)
+        if response.status_code == 204:
+            return {}
+        response.raise_for_status()
+        return response.json()['response']
+
+    # Function that runs the strategy once, from pressing the run button to receiving every result.
+    def run_once(self):
+        n_tickers = int(self.rng.integers(self.tickers[0], self.tickers[1] + 1))
+        ticks = ['T{:04d}'.format(i) for i in self.rng.choice(self.universe, n_tickers, replace=False)]
+        n_years = int(self.rng.integers(self.years[0], self.years[1] + 1))
+        start_year = int(self.rng.integers(1991, 2019 - n_years))
+        state = [('ticker_list', 'value', ','.join(ticks)), ('date_range', 'start_date', '{}-01-01'.format(start_year)),
+                 ('date_range', 'end_date', '{}-01-01'.format(start_year + n_years)),
+                 ('trading_days', 'value', '252')]
+        buttons = [('run', 'n_clicks', 1), ('cancel', 'n_clicks', None), ('job_poll', 'n_intervals', 0)]
+
+        start = time.perf_counter()
+        job = self.callback('submit', MANAGE_JOB, buttons, state + [('job', 'data', None)],
+                            ['run.n_clicks'])['job']['data']
+        while True:
+            time.sleep(0.5)
+            response = self.callback('poll', MANAGE_JOB, buttons, state + [('job', 'data', job)],
+                                     ['job_poll.n_intervals'])
+            if 'job_done' in response:
+                break
+            if response.get('job_poll', {}).get('disabled'):
+                raise RuntimeError(response['job_status']['children'])
+        views = self.callback('views', UPDATE_VIEWS, [('job_done', 'data', response['job_done']['data'])],
+                              [('strategy_view', 'data', None), ('stats_view', 'data', None)])
+        if 'error' in views['strategy_view']['data']:
+            raise RuntimeError(views['strategy_view']['data']['error'])
+        self.callback('strategy_outputs', STRATEGY_OUTPUTS, [('strategy_view', 'data', views['strategy_view']['data'])])
+        self.callback('stats_outputs', STATS_OUTPUTS, [('stats_view', 'data', views['stats_view']['data'])])
+        self.run_seconds.append(time.perf_counter() - start)
+
+    def run(self):
+        for _ in range(self.n_runs):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.errors.append(str(e) or type(e).__name__)
+            time.sleep(self.rng.exponential(self.think_time) if self.think_time else 0)
+
+# Function that returns the count and 50th, 95th, and 99th percentile of a list of times in seconds.
+def percentiles(seconds):
+    if not seconds:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None}
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+    return {'count': len(seconds), 'p50': p50, 'p95': p95, 'p99': p99}
+
+# Function that load tests one configuration (See parse_config) with n_users simulated users, each running the strategy
+# n_runs times, and returns a dictionary of the configuration, throughput, and latencies of the runs and of each kind of
+# request.
+def run_config(config, n_users, n_runs, tickers, universe, years, think_time, fetch_delay, gap_fraction, seed):
+    directory = tempfile.mkdtemp(prefix='load_test_')
+    server = None
+    try:
+        server, url = start_server(config, directory, fetch_delay, gap_fraction)
+        users = [SimulatedUser(url, (seed, i), n_runs, tickers, universe, years, think_time) for i in range(n_users)]
+        threads = [threading.Thread(target=user.run) for user in users]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    run_seconds = [s for user in users for s in user.run_seconds]
+    request_seconds = {}
+    for user in users:
+        for kind, seconds in user.request_seconds.items():
+            request_seconds.setdefault(kind, []).extend(seconds)
+    return dict(config, users=n_users, seconds=elapsed, runs_per_second=len(run_seconds) / elapsed,
+                requests_per_second=sum(len(s) for s in request_seconds.values()) / elapsed,
+                errors=[e for user in users for e in user.errors], runs=percentiles(run_seconds),
+                requests={kind: percentiles(seconds) for kind, seconds in sorted(request_seconds.items())})
+
+# Function that prints the results of one configuration.
+def print_result(result):
+    print('\n{} ({} workers x {} threads, {} job processes each), {} users: {:.2f} runs/s, {:.1f} requests/s, {} '
+          'errors'.format(result['config'], result['workers'], result['threads'], result['job_processes'],
+                          result['users'], result['runs_per_second'], result['requests_per_second'],
+                          len(result['errors'])))
+    print('  {:<18} {:>6} {:>9} {:>9} {:>9}'.format('', 'count', 'p50 (s)', 'p95 (s)', 'p99 (s)'))
+    for kind, stats in [('run', result['runs'])] + list(result['requests'].items()):
+        if stats['count']:
+            print('  {:<18} {:>6} {:>9.3f} {:>9.3f} {:>9.3f}'.format(kind, stats['count'], stats['p50'], stats['p95'],
+                                                                    stats['p99']))
+    for error in sorted(set(result['errors'])):
+        print('  error: {}'.format(error))
+    sys.stdout.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the contrarian strategy tester with simulated users.')
+    parser.add_argument('--configs', default='sync:2,gthread:2x4',
+                        help='Comma separated gunicorn configurations as CLASS:WORKERS[xTHREADS][:JOB_PROCESSES] '
+                             '(default: %(default)s).')
+    parser.add_argument('--users', type=int, default=8, help='Simulated users at once (default: %(default)s).')
+    parser.add_argument('--runs', type=int, default=4, help='Strategy runs per user (default: %(default)s).')
+    parser.add_argument('--tickers', default='5,50',
+                        help='Smallest and largest number of tickers in a run (default: %(default)s).')
+    parser.add_argument('--universe', type=int, default=500,
+                        help='Number of synthetic tickers runs draw from (default: %(default)s).')
+    parser.add_argument('--years', default='1,10',
+                        help='Shortest and longest date range in years (default: %(default)s).')
+    parser.add_argument('--think-time', type=float, default=1.0,
+                        help='Average seconds a user waits between runs (default: %(default)s).')
+    parser.add_argument('--fetch-delay', type=float, default=0.0,
+                        help='Seconds of simulated network latency per ticker fetched (default: %(default)s).')
+    parser.add_argument('--gap-fraction', type=float, default=0.0,
+                        help='Fraction of tickers entering or leaving, and of prices missing (default: 0).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the simulated users (default: %(default)s).')
+    parser.add_argument('--output', help='Path of a JSON file to save the results in.')
+    args = parser.parse_args()
+
+    tickers = [int(t) for t in args.tickers.split(',')]
+    years = [int(y) for y in args.years.split(',')]
+    results = []
+    for config in args.configs.split(','):
+        result = run_config(parse_config(config), args.users, args.runs, tickers, args.universe, years,
+                            args.think_time, args.fetch_delay, args.gap_fraction, args.seed)
+        print_result(result)
+        results.append(result)
+
+    if args.output:
+        from benchmarks.run_benchmarks import run_metadata
+        with open(args.output, 'w') as f:
+            json.dump({'meta': run_metadata(), 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
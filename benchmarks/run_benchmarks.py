@@ -0,0 +1,131 @@
+'''
+Daniel McNulty II
+
+Benchmark suite for the contrarian strategy tester. Runs each stage of a dashboard run against seeded synthetic market
+data, without a network connection, across a matrix of sizes (tickers x days), and records the time and peak memory of
+each stage as JSON so results can be compared between commits.
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --sizes 5x500,50x2500 --compare bench.json
+'''
+
+# Import necessary libraries and functions.
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from functions import daily_return, contrarian_portfolio_ret, summary_stats, yearly_summaries, period_summaries, \
+                      rolling_stats, \
+                      generic_tbl_fmt, contrarian_portfolio_tbl_fmt, yrly_sum_stat_tbl_fmt, lin_plt, ann_plt
+from correlation import corr_matrix, correlation_summary
+from synthetic import SyntheticSource
+
+# Default matrix of sizes, as (number of tickers, number of days).
+DEFAULT_SIZES = [(5, 500), (50, 2500), (200, 5000), (500, 7500), (2000, 7500)]
+
+# Function that returns the stages of a dashboard run, in order, as (name, function) pairs. Each function takes the
+# dictionary of results from the stages before it and returns its own result.
+def stages(n_tickers, n_days, gap_fraction, trading_days=252):
+    tickers = ['T{:04d}'.format(i) for i in range(n_tickers)]
+    source = SyntheticSource(n_days=n_days + 1, gap_fraction=gap_fraction, start='2000-01-03')
+    end_date = pd.bdate_range('2000-01-03', periods=n_days + 1)[-1] + pd.Timedelta(days=1)
+    return [
+        ('daily_return', lambda r: daily_return(tickers, '2000-01-03', end_date, source=source)),
+        ('contrarian_portfolio_ret',
+         lambda r: contrarian_portfolio_ret(r['daily_return'],
+                                            dynamic_universe=bool(r['daily_return'].isna().to_numpy().any()))),
+        ('summary_stats', lambda r: summary_stats(r['contrarian_portfolio_ret'][2], trading_days)),
+        ('yearly_summaries', lambda r: yearly_summaries(r['contrarian_portfolio_ret'][2], trading_days)),
+        ('period_summaries', lambda r: period_summaries(r['contrarian_portfolio_ret'][2], trading_days)),
+        ('rolling_stats', lambda r: rolling_stats(r['contrarian_portfolio_ret'][2], trading_days)),
+        ('corr_matrix', lambda r: corr_matrix(r['daily_return'])),
+        ('correlation_summary', lambda r: correlation_summary(r['daily_return'])),
+        ('generic_tbl_fmt', lambda r: generic_tbl_fmt(r['contrarian_portfolio_ret'][0])),
+        ('contrarian_portfolio_tbl_fmt', lambda r: contrarian_portfolio_tbl_fmt(r['contrarian_portfolio_ret'][2])),
+        ('yrly_sum_stat_tbl_fmt', lambda r: yrly_sum_stat_tbl_fmt(r['yearly_summaries'])),
+        ('lin_plt', lambda r: lin_plt(r['contrarian_portfolio_ret'][2])),
+        ('ann_plt', lambda r: ann_plt(r['yearly_summaries'])),
+    ]
+
+# Function that runs every stage for one size and returns a list of result dictionaries, one per stage. Each stage is
+# timed repeat times without memory tracing (keeping the fastest time), then run once more under tracemalloc to find
+# its peak memory use.
+def run_size(n_tickers, n_days, gap_fraction=0.0, repeat=3):
+    results, rows = {}, []
+    for name, stage in stages(n_tickers, n_days, gap_fraction):
+        times = []
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            results[name] = stage(results)
+            times.append(time.perf_counter() - start)
+
+        gc.collect()
+        tracemalloc.start()
+        stage(results)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        rows.append({'tickers': n_tickers, 'days': n_days, 'gap_fraction': gap_fraction, 'stage': name,
+                     'seconds': min(times), 'peak_bytes': peak})
+        print('{:>5} x {:<5} {:<30} {:>10.4f}s {:>10.1f}MB'.format(n_tickers, n_days, name, min(times),
+                                                                    peak / 1024 ** 2), flush=True)
+    return rows
+
+# Function that returns details of the machine, library versions, and commit the benchmarks ran on.
+def run_metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'time': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'machine': platform.machine(), 'processor': platform.processor()}
+
+# Function that prints the time and peak memory of each stage and size in results relative to an earlier benchmark run
+# saved in baseline_path.
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r['tickers'], r['days'], r['gap_fraction'], r['stage']): r for r in json.load(f)['results']}
+    print('\n{:<14} {:<30} {:>10} {:>10} {:>8} {:>10}'.format('size', 'stage', 'old (s)', 'new (s)', 'time x',
+                                                              'memory x'))
+    for r in results:
+        old = baseline.get((r['tickers'], r['days'], r['gap_fraction'], r['stage']))
+        if old is None:
+            continue
+        print('{:<14} {:<30} {:>10.4f} {:>10.4f} {:>8.2f} {:>10.2f}'.format(
+            '{}x{}'.format(r['tickers'], r['days']), r['stage'], old['seconds'], r['seconds'],
+            r['seconds'] / old['seconds'] if old['seconds'] else float('nan'),
+            r['peak_bytes'] / old['peak_bytes'] if old['peak_bytes'] else float('nan')))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the contrarian strategy tester on synthetic data.')
+    parser.add_argument('--sizes', default=','.join('{}x{}'.format(t, d) for t, d in DEFAULT_SIZES),
+                        help='Comma separated sizes as TICKERSxDAYS (default: %(default)s).')
+    parser.add_argument('--gap-fraction', type=float, default=0.0,
+                        help='Fraction of tickers entering or leaving, and of prices missing (default: 0).')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage (default: 3).')
+    parser.add_argument('--output', help='Path of a JSON file to save the results in.')
+    parser.add_argument('--compare', help='Path of an earlier results JSON file to compare against.')
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in s.lower().split('x')) for s in args.sizes.split(',')]
+    results = []
+    for n_tickers, n_days in sizes:
+        results.extend(run_size(n_tickers, n_days, args.gap_fraction, args.repeat))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': run_metadata(), 'results': results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,605 @@
+'''
+Daniel McNulty II
+
+Computational core of the contrarian strategy tester: daily returns, the contrarian strategy, and summary statistics.
+Imports nothing from dash or plotly, so batch jobs (See batch.py) can run the strategy without loading the dashboard.
+'''
+
+# Import necessary libraries and functions.
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import numpy as np
+from price_store import YahooSource, fetch_histories
+
+# Function that takes an input list of tickers, a start date, and an end date. It collects the historical closing price
+# data for each ticker from the start date to the end date from a price source and then calculates the daily returns for
+# each ticker from these closing prices. The source can be any PriceSource, such as a PriceStore which serves repeat
+# requests from disk. If no source is given, prices are collected directly from Yahoo Finance. Tickers are collected
+# concurrently on up to max_workers threads (See fetch_histories), which calls progress, if given, with the number of
+# tickers collected so far and the total number of tickers as collection goes on.
+def daily_return(tickers, start_date, end_date, source=None, max_workers=8, progress=None):
+    if source is None:
+        source = YahooSource()
+
+    # Collect the closing prices for each ticker from the input start date to the input end date from the source and
+    # store each in a list. Then use this list to create a DataFrame containing all the tickers closing prices.
+    histories = fetch_histories(source, tickers, start_date, end_date, max_workers=max_workers, progress=progress)
+    hist_list = [histories[i] for i in tickers]
+    hist_df = pd.DataFrame(hist_list).transpose()
+    hist_df.columns = tickers
+
+    # Calculate the daily returns for each ticker, carrying prices forward over any gaps. Returns after a ticker's last
+    # closing price (ie. once it has been delisted) are left missing rather than carried forward as 0.
+    daily_ret = hist_df.ffill().pct_change(1).where(hist_df.bfill().notna()).iloc[1:]
+
+    # Return the daily returns for each ticker.
+    return daily_ret
+
+# Function that takes daily returns of tickers in as input and runs the contrarian strategy on it. It returns the daily
+# returns input, the daily excess returns for each ticker, and the a table containing the calculated weights for each
+# ticker, collateral collateral needed, and contrarian strategy daily return for each day in the input daily returns
+# DataFrame. The engine argument selects the implementation used:
+#       - 'numpy': The default. Computes everything with a handful of array operations over the whole return panel.
+#       - 'pandas': The original row-by-row implementation. Kept so the two engines can be cross-checked numerically.
+# If dynamic_universe is True, tickers only count towards the portfolio on days they have a return (See validity_mask),
+# so tickers can enter (ie. IPOs) and leave (ie. delistings) the portfolio during the date range. Each day's weights are
+# then spread over the tickers live on the day before, and the results gain a Universe Size column holding that number
+# of tickers. Only the 'numpy' engine supports dynamic universes.
+def contrarian_portfolio_ret(daily_ret, engine='numpy', dynamic_universe=False):
+    if engine == 'numpy':
+        return _contrarian_portfolio_ret_numpy(daily_ret, dynamic_universe)
+    if engine == 'pandas' and not dynamic_universe:
+        return _contrarian_portfolio_ret_pandas(daily_ret)
+    if engine == 'pandas':
+        raise ValueError("The 'pandas' contrarian portfolio engine does not support dynamic universes.")
+    raise ValueError("Unknown contrarian portfolio engine '{}'. Use 'numpy' or 'pandas'.".format(engine))
+
+# Pure array implementation of contrarian_portfolio_ret. Returns exactly the same three DataFrames as the pandas
+# implementation below.
+def _contrarian_portfolio_ret_numpy(daily_ret, dynamic_universe=False):
+    # Pull the daily returns out into a dates x tickers float array.
+    ret = daily_ret.to_numpy(dtype=float)
+    n_tickers = ret.shape[1]
+    if dynamic_universe:
+        return _dynamic_universe_ret(daily_ret, ret)
+
+    # Calculate the average return for each day (row), skipping missing values the same way DataFrame.mean does, then
+    # the daily excess returns over that average.
+    valid = ~np.isnan(ret)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        row_mean = np.where(valid, ret, 0.0).sum(axis=1) / valid.sum(axis=1)
+    excess = ret - row_mean[:, None]
+
+    # Calculate the weight to put on each ticker for each day (row) from the previous day's excess returns, and the
+    # collateral needed for each day (row).
+    weights = -excess[:-1] / n_tickers
+    collateral = np.abs(weights).sum(axis=1) / 2
+
+    # Calculate the contrarian strategy return for each day (row) as the dot product of that day's returns with the
+    # lagged weights, divided by the collateral. Days with zero collateral are masked to a return of 0.
+    no_collateral = collateral == 0.0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        strat_ret = np.einsum('ij,ij->i', ret[1:], weights) / np.where(no_collateral, 1.0, collateral)
+    strat_ret[no_collateral] = 0.0
+
+    # Create the results_df, which will contain the calculated weights for each ticker, collateral collateral needed,
+    # and contrarian strategy daily return for each day.
+    results_df = pd.DataFrame(weights, index=daily_ret.index[1:], columns=daily_ret.columns)
+    results_df['Collateral Needed'] = collateral
+    results_df['Strategy Daily Return'] = strat_ret
+    excess_ret = pd.DataFrame(excess, index=daily_ret.index, columns=daily_ret.columns)
+
+    # Return the daily_ret, excess_ret, and results_df DataFrames with Date as a column and not an index.
+    return _date_col(daily_ret), _date_col(excess_ret), _date_col(results_df)
+
+# Array implementation of contrarian_portfolio_ret over a dynamic universe, where each day's average return and excess
+# returns only cover the tickers live that day, and each day's weights are divided by the number of tickers live the
+# day before. Tickers not live on a day get a weight of 0 the next day, and a ticker's missing return on the day after
+# it was last live (ie. it was delisted) counts as 0.
+def _dynamic_universe_ret(daily_ret, ret):
+    excess, weights, universe_size, collateral, strat_ret = _dynamic_universe_arrays(ret)
+
+    # Create the results_df, adding the size of the universe each day's weights were spread over.
+    results_df = pd.DataFrame(weights, index=daily_ret.index[1:], columns=daily_ret.columns)
+    results_df['Universe Size'] = universe_size
+    results_df['Collateral Needed'] = collateral
+    results_df['Strategy Daily Return'] = strat_ret
+    excess_ret = pd.DataFrame(excess, index=daily_ret.index, columns=daily_ret.columns)
+
+    # Return the daily_ret, excess_ret, and results_df DataFrames with Date as a column and not an index.
+    return _date_col(daily_ret), _date_col(excess_ret), _date_col(results_df)
+
+# Function that runs the contrarian strategy over a dynamic universe on an array of returns (periods x tickers, with NaN
+# for tickers not live), returning the excess returns of every period, and for every period after the first, the
+# weights, the number of tickers the weights were spread over, the collateral needed, and the strategy return. Used by
+# _dynamic_universe_ret, and by the intraday engine (See intraday.py) on one chunk of bars at a time.
+def _dynamic_universe_arrays(ret):
+    # Calculate the number of tickers live each day, the average return of the live tickers, and their excess returns.
+    valid = ~np.isnan(ret)
+    n_live = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        row_mean = np.where(valid, ret, 0.0).sum(axis=1) / n_live
+    excess = ret - row_mean[:, None]
+
+    # Calculate the weights from the previous day's excess returns over that day's universe, and the collateral.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weights = np.where(valid[:-1], -excess[:-1] / n_live[:-1, None], 0.0)
+    collateral = np.abs(weights).sum(axis=1) / 2
+
+    # Calculate the contrarian strategy return for each day, masking days with zero collateral to a return of 0.
+    no_collateral = collateral == 0.0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        strat_ret = np.einsum('ij,ij->i', np.where(valid[1:], ret[1:], 0.0), weights) / \
+                    np.where(no_collateral, 1.0, collateral)
+    strat_ret[no_collateral] = 0.0
+    return excess, weights, n_live[:-1], collateral, strat_ret
+
+# Function that returns a DataFrame (the same shape as the input daily returns DataFrame) which is True where a ticker
+# is live on a day, meaning it has a return for that day.
+def validity_mask(daily_ret):
+    return daily_ret.notna()
+
+# Function that reports, for each ticker in an input daily returns DataFrame, when it entered and left the universe
+# over the date range. The returned DataFrame has a row per ticker holding its first and last dates with a return, the
+# number of days it was live, the number of days it was missing a return between its first and last dates, and a
+# status of 'Live for whole range', 'Entered', 'Left', 'Entered and left', or 'No data'. Every ticker is reported as
+# 'No data' if there are no dates at all (ie. the date range holds no trading days). The validity mask can be passed in
+# (mask) if it has already been computed.
+def coverage_report(daily_ret, mask=None):
+    if mask is None:
+        mask = validity_mask(daily_ret)
+    valid = mask.to_numpy()
+    n_dates, n_tickers = valid.shape
+    has_data = valid.any(axis=0)
+
+    # Find the positions of each ticker's first and last live days (0 for every ticker if there are no dates).
+    first = valid.argmax(axis=0) if n_dates else np.zeros(n_tickers, dtype=int)
+    last = n_dates - 1 - valid[::-1].argmax(axis=0) if n_dates else np.zeros(n_tickers, dtype=int)
+    days_live = valid.sum(axis=0)
+
+    entered = has_data & (first > 0)
+    left = has_data & (last < n_dates - 1)
+    status = np.select([~has_data, entered & left, entered, left],
+                       ['No data', 'Entered and left', 'Entered', 'Left'], 'Live for whole range')
+    dates = pd.Series(daily_ret.index).dt.date.to_numpy()
+    return pd.DataFrame({'Ticker': list(daily_ret.columns),
+                         'First Date': np.where(has_data, dates[first] if n_dates else None, None),
+                         'Last Date': np.where(has_data, dates[last] if n_dates else None, None),
+                         'Days Live': days_live,
+                         'Missing Days': np.where(has_data, last - first + 1 - days_live, 0),
+                         'Status': status})
+
+# Original row-by-row implementation of contrarian_portfolio_ret.
+def _contrarian_portfolio_ret_pandas(daily_ret):
+    # Calculate the daily excess returns over the average return for each day (row) in the input daily return DataFrame.
+    excess_ret = daily_ret.sub(daily_ret.mean(axis=1), axis=0)
+    er_dimensions = excess_ret.shape
+
+    # Calculate the weight to put on each ticker for each day (row)
+    weights = excess_ret.apply(lambda x: -x / er_dimensions[1], axis=1).shift(1).iloc[1:]
+    # Calculate the collateral needed for each day (row)
+    collateral = abs(weights).apply(sum, axis=1) / 2
+
+    # Calculate the contrarian strategy return for each day (row)
+    strat_ret = [daily_ret.iloc[i + 1].dot(weights.iloc[i]) / collateral.iloc[i] if collateral.iloc[i] != 0.0
+                 else 0.0 for i in range(0, er_dimensions[0] - 1)]
+
+    # Create the results_df, which will contain the calculated weights for each ticker, collateral collateral needed,
+    # and contrarian strategy daily return for each day.
+    results_df = weights
+    results_df['Collateral Needed'] = collateral
+    results_df['Strategy Daily Return'] = strat_ret
+
+    # Return the daily_ret, excess_ret, and results_df DataFrames with Date as a column and not an index.
+    return _date_col(daily_ret), _date_col(excess_ret), _date_col(results_df)
+
+# Function that reformats a Date indexed DataFrame such that it has Date as a column and not an index.
+def _date_col(df):
+    df = df.reset_index()
+    df['Date'] = df['Date'].dt.date
+    return df
+
+# Function that calculates the summary statistics for an input DataFrame (sel_hist) and number of trading days per year
+# (trading_days). Summary statistics include the Average Daily Return, Standard Deviation of Daily Returns, Annualized
+# Average Daily Return, Annualized Standard Deviation of Daily Returns, and Annualized Sharpe Ratio for the 'Strategy
+# Daily Return' column of the input DataFrame. As such, the input DataFrame must have a 'Strategy Daily Return' column.
+# If n_resamples is above 0, confidence intervals for the annualized statistics are added from that many bootstrap
+# resamples of the strategy returns, drawn from seed on up to processes processes (See bootstrap_ci).
+def summary_stats(sel_hist, trading_days, n_resamples=0, seed=0, processes=None):
+    # Convert input trading_days to a float to prevent any possible truncation later.
+    trading_days = float(trading_days)
+
+    # Calculate the Average Daily Return from the 'Strategy Daily Return' column using the average function from numpy.
+    # Likewise, calculate the Standard Deviation of Daily Return from the 'Strategy Daily Return' column using the
+    # std function from numpy.
+    avg_daily_ret = np.average(sel_hist['Strategy Daily Return'])
+    std_dev_daily_ret = np.std(sel_hist['Strategy Daily Return'], ddof=1)
+
+    # Create a DataFrame named sum_stats which holds:
+    #       - Average Daily Return: Calculated above.
+    #       - Standard Deviation of Daily Returns: Calculated above.
+    #       - Annualized Average Daily Return: Calculated by taking the Average Daily Return and multiplying it by the
+    #                                          trading days per year.
+    #       - Annualized Standard Deviation of Daily Returns: Calculated by taking the Standard Deviation of Daily
+    #                                                         Returns and multiplying it by the square root of the
+    #                                                         trading days per year.
+    #       - Annualized Sharpe Ratio: Calculated by dividing the Average Daily Return by the Standard Deviation of
+    #                                  Daily Returns and multiplying the quotient by the square root of the trading days
+    #                                  per year.
+    sum_stats = pd.DataFrame({'Average Daily Return': [avg_daily_ret],
+                              'Standard Deviation of Daily Returns': [std_dev_daily_ret],
+                              'Annualized Average Daily Return': [avg_daily_ret * trading_days],
+                              'Annualized Standard Deviation of Daily Returns': [std_dev_daily_ret*np.sqrt(trading_days)],
+                              'Annualized Sharpe Ratio': [(avg_daily_ret/std_dev_daily_ret)*np.sqrt(trading_days)]})
+
+    # Add the confidence intervals of the annualized statistics, if asked for.
+    if n_resamples:
+        ci = bootstrap_ci(sel_hist['Strategy Daily Return'], trading_days, n_resamples=n_resamples, seed=seed,
+                          processes=processes)
+        for name, values in ci.items():
+            sum_stats[name] = [values]
+
+    # Return the sum_stats DataFrame.
+    return sum_stats
+
+# Periods period_summaries can summarize the strategy returns by, with the name of each and the number of them in a
+# year.
+PERIODS = {'M': ('Month', 12), 'Q': ('Quarter', 4), 'Y': ('Year', 1)}
+
+# Function that calculates the summary statistics for an input DataFrame (sel_hist) and number of trading days per year
+# (trading_days) by month ('M'), quarter ('Q'), and year ('Y'), or whichever of those are in periods. Summary statistics
+# include the Average Daily Return, Standard Deviation of Daily Returns, Annualized Average Daily Return, Annualized
+# Standard Deviation of Daily Returns, and Annualized Sharpe Ratio for the 'Strategy Daily Return' column of the input
+# DataFrame, so the input DataFrame must have 'Date' and 'Strategy Daily Return' columns. It is not changed. Returns a
+# dictionary of a DataFrame for each period, whose Date column holds the periods (ie. 2015-03 for a month, 2015Q1 for a
+# quarter, or 2015 for a year).
+#
+# Each date is given an integer code for its month, and the count, sum, and sum of squares of the returns in every
+# month are computed together in one pass over the returns. Since quarters and years are made of whole months, their
+# sums are added up from the months', so every period's statistics come from the same pass. If n_resamples is above 0,
+# confidence intervals for each period's annualized statistics are added from that many bootstrap resamples of that
+# period's strategy returns (See bootstrap_ci), each drawn from its own seed made from seed and the period. Only the
+# periods in ci_periods (by default, all of periods) get confidence intervals, since resampling every month of a long
+# date range takes far longer than the rest.
+def period_summaries(sel_hist, trading_days, periods=('M', 'Q', 'Y'), n_resamples=0, seed=0, processes=None,
+                     ci_periods=None):
+    # Convert input trading_days to a float to prevent any possible truncation later.
+    trading_days = float(trading_days)
+    dates = pd.DatetimeIndex(pd.to_datetime(sel_hist['Date']))
+    ret = sel_hist['Strategy Daily Return'].to_numpy(dtype=float)
+
+    # The month of each date, counted from the first month, and the count, sum, and sum of squares of the returns in
+    # each month. The returns are centred on their overall mean to limit cancellation error in the variances. Missing
+    # returns are left out of the sums, the same way a pandas groupby skips them, so they only affect their own period.
+    month_code = dates.year.to_numpy() * 12 + dates.month.to_numpy() - 1
+    first = month_code.min() if len(ret) else 0
+    month = month_code - first
+    finite = np.isfinite(ret)
+    centre = np.nanmean(np.where(finite, ret, np.nan)) if finite.any() else 0.0
+    centred = np.where(finite, ret - centre, 0.0)
+    sums = np.stack([np.bincount(month, finite), np.bincount(month, centred), np.bincount(month, centred ** 2)])
+    days = np.bincount(month)
+    months = np.arange(sums.shape[1]) + first
+
+    summaries = {}
+    for period in periods:
+        name, per_year = PERIODS[period]
+        # The code of each month's period (ie. year * 4 + quarter for quarters), then each period's sums from the sums
+        # of its months. Periods without any dates are left out.
+        code = months // 12 * per_year + months % 12 // (12 // per_year)
+        present, group = np.unique(code[days > 0], return_inverse=True)
+        n, total, total_sq = (np.bincount(group, s[days > 0], minlength=len(present)) for s in sums)
+
+        # The mean and sample standard deviation of each period's returns from its sums. Periods whose returns are all
+        # missing get a missing mean.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / n + centre
+            std = np.sqrt(np.maximum(total_sq - total ** 2 / n, 0.0) / (n - 1))
+        std[n < 2] = np.nan
+
+        # Create a sum_stats DataFrame which holds:
+        #       - Date: The period.
+        #       - Average Daily Return and Standard Deviation of Daily Returns: Calculated above.
+        #       - Annualized Average Daily Return: Calculated by multiplying the Average Daily Return by the number of
+        #                                          trading days.
+        #       - Annualized Standard Deviation of Daily Returns: Calculated by multiplying the Standard Deviation of
+        #                                                         Daily Returns by the square root of the number of
+        #                                                         trading days.
+        #       - Annualized Sharpe Ratio: Calculated by dividing the Average Daily Return by the Standard Deviation of
+        #                                  Daily Returns, then multiplying the quotient by the square root of the number
+        #                                  of trading days.
+        sum_stats = pd.DataFrame({'Date': _period_labels(present, per_year),
+                                  'Average Daily Return': mean,
+                                  'Standard Deviation of Daily Returns': std,
+                                  'Annualized Average Daily Return': mean * trading_days,
+                                  'Annualized Standard Deviation of Daily Returns': std * np.sqrt(trading_days)})
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sum_stats['Annualized Sharpe Ratio'] = mean / std * np.sqrt(trading_days)
+
+        # Add the confidence intervals of each period's annualized statistics, if asked for. Yearly resamples are
+        # seeded by the year alone, so they do not change with the other periods summarized.
+        if n_resamples and (ci_periods is None or period in ci_periods):
+            date_code = month_code // 12 * per_year + month_code % 12 // (12 // per_year)
+            order = np.argsort(date_code, kind='stable')
+            groups = np.split(ret[order], np.flatnonzero(np.diff(date_code[order])) + 1)
+            ci = [bootstrap_ci(g, trading_days, n_resamples=n_resamples, processes=processes,
+                               seed=(seed, int(c)) if per_year == 1 else (seed, int(c), per_year))
+                  for c, g in zip(present, groups)]
+            for ci_name in ci[0] if ci else []:
+                sum_stats[ci_name] = [c[ci_name] for c in ci]
+        summaries[period] = sum_stats
+
+    # Return the summaries.
+    return summaries
+
+# Function that returns the labels of an array of period codes (See period_summaries) with per_year periods a year: the
+# year for years, like 2015Q1 for quarters, and like 2015-03 for months.
+def _period_labels(codes, per_year):
+    years, parts = codes // per_year, codes % per_year + 1
+    if per_year == 1:
+        return years
+    if per_year == 4:
+        return ['{}Q{}'.format(y, q) for y, q in zip(years, parts)]
+    return ['{}-{:02d}'.format(y, m) for y, m in zip(years, parts)]
+
+# Function that calculates the yearly summary statistics for an input DataFrame (sel_hist) and number of trading days
+# per year (trading_days) (See period_summaries). The returned DataFrame is indexed by year, like its Date column.
+def yearly_summaries(sel_hist, trading_days, n_resamples=0, seed=0, processes=None):
+    sum_stats = period_summaries(sel_hist, trading_days, ('Y',), n_resamples=n_resamples, seed=seed,
+                                 processes=processes)['Y']
+    sum_stats.index = pd.Index(sum_stats['Date'], name='Date')
+    return sum_stats
+
+# Function that calculates rolling performance statistics of the 'Strategy Daily Return' column of an input DataFrame
+# (sel_hist) over several trailing windows at once, given the number of trading days per year (trading_days) and the
+# window lengths in days (windows). For each window length w, the returned DataFrame holds the Date column and:
+#       - Rolling w-Day Annualized Average Daily Return
+#       - Rolling w-Day Annualized Standard Deviation of Daily Returns
+#       - Rolling w-Day Annualized Sharpe Ratio
+#       - Rolling w-Day Maximum Drawdown: The largest peak to trough fall in compounded strategy value within the
+#         window.
+# The first w - 1 rows of each window's columns are blank. Means and standard deviations come from cumulative sums and
+# drawdowns from block prefix/suffix scans, so the cost is O(n) per window no matter how long the window is.
+def rolling_stats(sel_hist, trading_days, windows=(21, 63, 252)):
+    # Convert input trading_days to a float to prevent any possible truncation later.
+    trading_days = float(trading_days)
+    ret = sel_hist['Strategy Daily Return'].to_numpy(dtype=float)
+    n = len(ret)
+
+    # Cumulative sums of the returns and squared returns, centred on the overall mean to limit cancellation error, with
+    # a leading 0 so the sum over any window is a difference of two entries. Likewise, the cumulative log value of the
+    # strategy with a leading 0 for its starting value.
+    centre = ret.mean() if n else 0.0
+    centred = ret - centre
+    cum_sum = np.concatenate([[0.0], np.cumsum(centred)])
+    cum_sq = np.concatenate([[0.0], np.cumsum(centred ** 2)])
+    log_value = np.concatenate([[0.0], np.cumsum(np.log1p(ret))])
+
+    roll_stats = pd.DataFrame({'Date': sel_hist['Date'].to_numpy()})
+    for w in windows:
+        label = 'Rolling {}-Day '.format(w)
+        mean = np.full(n, np.nan)
+        std = np.full(n, np.nan)
+        drawdown = np.full(n, np.nan)
+        if 1 < w <= n:
+            # Window sums ending on each day, then the mean and sample standard deviation from them.
+            win_sum = cum_sum[w:] - cum_sum[:-w]
+            win_sq = cum_sq[w:] - cum_sq[:-w]
+            mean[w - 1:] = win_sum / w + centre
+            std[w - 1:] = np.sqrt(np.maximum(win_sq - win_sum ** 2 / w, 0.0) / (w - 1))
+            # A window of w returns spans w + 1 strategy values, starting from the value the day before.
+            drawdown[w - 1:] = -np.expm1(-_rolling_max_drawdown(log_value, w + 1))
+
+        roll_stats[label + 'Annualized Average Daily Return'] = mean * trading_days
+        roll_stats[label + 'Annualized Standard Deviation of Daily Returns'] = std * np.sqrt(trading_days)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            roll_stats[label + 'Annualized Sharpe Ratio'] = mean / std * np.sqrt(trading_days)
+        roll_stats[label + 'Maximum Drawdown'] = drawdown
+
+    # Return the roll_stats DataFrame.
+    return roll_stats
+
+# Function that returns the largest fall (x[j] - x[k] for j <= k) within every window of m consecutive values of x, as
+# an array of len(x) - m + 1 values. x is split into blocks of m values. Running maxima, minima, and falls are scanned
+# forwards (prefixes) and backwards (suffixes) within each block, and every window is the suffix of one block joined to
+# the prefix of the next (van Herk/Gil-Werman), which takes O(len(x)) time for any m.
+def _rolling_max_drawdown(x, m):
+    n = len(x)
+    blocks = -(-n // m)
+    padded = np.full(blocks * m, x[-1])
+    padded[:n] = x
+    padded = padded.reshape(blocks, m)
+
+    # Prefix scans: running max, running min, and largest fall from the block start to each value.
+    pre_min = np.minimum.accumulate(padded, axis=1)
+    pre_fall = np.maximum.accumulate(np.maximum.accumulate(padded, axis=1) - padded, axis=1)
+
+    # Suffix scans: running max and largest fall from each value to the block end.
+    rev = padded[:, ::-1]
+    suf_max = np.maximum.accumulate(rev, axis=1)[:, ::-1]
+    suf_fall = np.maximum.accumulate(rev - np.minimum.accumulate(rev, axis=1), axis=1)[:, ::-1]
+
+    pre_min, pre_fall = pre_min.ravel(), pre_fall.ravel()
+    suf_max, suf_fall = suf_max.ravel(), suf_fall.ravel()
+
+    # Join the suffix starting at each window start to the prefix ending at its window end. Windows that line up
+    # exactly with a block are just that block's full suffix.
+    start = np.arange(n - m + 1)
+    end = start + m - 1
+    joined = np.maximum(np.maximum(suf_fall[start], pre_fall[end]), suf_max[start] - pre_min[end])
+    return np.where(start % m == 0, suf_fall[start], joined)
+
+# Function that runs the contrarian strategy for several lookbacks and holding periods at once over an input daily
+# returns DataFrame. For a lookback of k days, each ticker's weight comes from its cumulative (compounded) return over
+# the last k days in excess of the average over all tickers, instead of just the last day's excess return. For a
+# holding period of h days, each day's portfolio is the average of the portfolios formed on the last h days, so each
+# portfolio is held for h days, overlapping the others. With a 1-day lookback and 1-day holding period this is exactly
+# contrarian_portfolio_ret over a dynamic universe.
+#
+# The k-day returns for every lookback come from a single cumulative sum of the log returns over the panel (the
+# difference of two entries gives any window's return), and the h-day average portfolios for every holding period from
+# a single cumulative sum of the weights, so every combination is computed together as one batch of array operations.
+# A ticker missing a return within a lookback window is left out of that day's portfolio, with the weights spread over
+# the tickers that are not. Every combination covers the same dates: those after the first max(lookbacks) +
+# max(holdings) - 1 days, which every combination has a full lookback and holding period for.
+#
+# Returns the weights, as an array indexed by (lookback, holding period, date, ticker), and a DataFrame with the Date
+# and, for each combination, its Collateral Needed and Strategy Daily Return columns, named like '5-Day Lookback, 1-Day
+# Hold Strategy Daily Return'. Raises a ValueError if any lookback or holding period is under 1 day. Memory use grows
+# with the number of lookbacks x holding periods x dates x tickers.
+def multi_lookback_ret(daily_ret, lookbacks=(1, 5, 10, 21, 63), holdings=(1,)):
+    ret = daily_ret.to_numpy(dtype=float)
+    n_dates, n_tickers = ret.shape
+    ks = np.asarray(lookbacks, dtype=int)
+    hs = np.asarray(holdings, dtype=int)
+    if not len(ks) or not len(hs) or ks.min() < 1 or hs.min() < 1:
+        raise ValueError('ERROR - The lookbacks and holding periods must each be at least 1 day.')
+    start = ks.max() + hs.max() - 2
+    if start + 1 >= n_dates:
+        raise ValueError('ERROR - The date range must cover more than {} days for the lookbacks and holding periods '
+                         'chosen.'.format(start + 1))
+
+    # Cumulative sums of the log returns and of the number of returns present, with a leading 0, so the k-day return
+    # ending on day t is exp(log_cum[t + 1] - log_cum[t + 1 - k]) - 1, present if all k of its returns are.
+    valid = ~np.isnan(ret)
+    log_cum = np.concatenate([np.zeros((1, n_tickers)), np.cumsum(np.where(valid, np.log1p(ret), 0.0), axis=0)])
+    n_cum = np.concatenate([np.zeros((1, n_tickers), dtype=int), np.cumsum(valid, axis=0)])
+
+    # The k-day returns ending on every day for every lookback (lookback x date x ticker). Days too early for a full
+    # lookback are left out of the portfolio.
+    end = np.arange(1, n_dates + 1)
+    begin = np.maximum(end[None, :] - ks[:, None], 0)
+    k_ret = np.expm1(log_cum[end][None] - log_cum[begin])
+    k_valid = (n_cum[end][None] - n_cum[begin]) == ks[:, None, None]
+
+    # The excess k-day returns over each day's average over the tickers present, and from them the weights formed at
+    # the end of each day.
+    n_live = k_valid.sum(axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        row_mean = np.where(k_valid, k_ret, 0.0).sum(axis=2) / n_live
+        weights = np.where(k_valid, -(k_ret - row_mean[:, :, None]) / n_live[:, :, None], 0.0)
+
+    # The average of the last h days' weights, for each holding period (lookback x holding period x date x ticker),
+    # from the cumulative sum of the weights. Weights formed on day t are held on day t + 1, so only the weights formed
+    # on the days before each covered date are kept.
+    w_cum = np.concatenate([np.zeros((len(ks), 1, n_tickers)), np.cumsum(weights, axis=1)], axis=1)
+    days = np.arange(start, n_dates - 1)
+    held = (w_cum[:, days + 1][:, None] - w_cum[:, days[None, :] + 1 - hs[:, None]]) / hs[None, :, None, None]
+
+    # The collateral and strategy return for each combination and day, masking days with zero collateral to a return
+    # of 0. Missing returns on the day a weight is held (ie. the ticker was delisted) count as 0.
+    collateral = np.abs(held).sum(axis=3) / 2
+    no_collateral = collateral == 0.0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        strat_ret = np.einsum('lhtn,tn->lht', held, np.where(valid, ret, 0.0)[start + 1:]) / \
+                    np.where(no_collateral, 1.0, collateral)
+    strat_ret[no_collateral] = 0.0
+
+    # Create the results_df, which will contain the collateral needed and contrarian strategy daily return of each
+    # combination for each day.
+    results_df = pd.DataFrame({'Date': pd.DatetimeIndex(daily_ret.index[start + 1:]).date})
+    for i, k in enumerate(ks):
+        for j, h in enumerate(hs):
+            results_df[_lookback_label(k, h) + ' Collateral Needed'] = collateral[i, j]
+            results_df[_lookback_label(k, h) + ' Strategy Daily Return'] = strat_ret[i, j]
+    return held, results_df
+
+# Function that returns the label of the results of a lookback (k) and holding period (h) in multi_lookback_ret.
+def _lookback_label(k, h):
+    return '{}-Day Lookback, {}-Day Hold'.format(k, h)
+
+# Function that compares the lookbacks and holding periods run by multi_lookback_ret, returning a table with the
+# Lookback, Holding Period, and summary statistics (See summary_stats) of each combination, given its results DataFrame
+# (results_df), the same lookbacks and holdings it was run with, and the number of trading days per year.
+def lookback_comparison(results_df, trading_days, lookbacks=(1, 5, 10, 21, 63), holdings=(1,)):
+    rows = []
+    for k in lookbacks:
+        for h in holdings:
+            label = _lookback_label(k, h)
+            stats = summary_stats(pd.DataFrame({'Strategy Daily Return': results_df[label + ' Strategy Daily Return']}),
+                                  trading_days)
+            stats.insert(0, 'Holding Period', h)
+            stats.insert(0, 'Lookback', k)
+            rows.append(stats)
+    return pd.concat(rows, ignore_index=True)
+
+# Annualized statistics bootstrap_stats resamples, in the order of its columns.
+BOOTSTRAP_STATS = ['Annualized Average Daily Return', 'Annualized Standard Deviation of Daily Returns',
+                   'Annualized Sharpe Ratio']
+
+# Function that bootstraps the annualized average daily return, annualized standard deviation of daily returns, and
+# annualized Sharpe ratio of an input series of daily returns (ret), given the number of trading days per year. Returns
+# an n_resamples x 3 array of the statistics of each resample (See BOOTSTRAP_STATS). Resamples are made of blocks of
+# consecutive returns, so the autocorrelation of the returns is kept, wrapping around from the last return to the first:
+#       - 'stationary': The stationary bootstrap. Block lengths are random, with an average of block_length days.
+#       - 'block': The circular block bootstrap. Every block is block_length days long.
+# block_length defaults to the cube root of the number of returns. The resamples are drawn as arrays of positions,
+# chunk_elements positions at a time, so the memory used does not depend on n_resamples. If processes is above 1, the
+# chunks are shared out over that many processes. Each chunk is drawn from its own random generator spawned from seed,
+# so the same seed always gives the same resamples, whatever the number of processes.
+def bootstrap_stats(ret, trading_days, n_resamples=10000, block_length=None, method='stationary', seed=0,
+                    chunk_elements=2 ** 21, processes=None):
+    if method not in ('stationary', 'block'):
+        raise ValueError("Unknown bootstrap method '{}'. Use 'stationary' or 'block'.".format(method))
+    ret = np.asarray(ret, dtype=float)
+    n = len(ret)
+    if block_length is None:
+        block_length = max(int(round(n ** (1 / 3))), 1)
+
+    # Split the resamples into chunks of at most chunk_elements positions, each with its own seed.
+    chunk = max(chunk_elements // max(n, 1), 1)
+    sizes = [min(chunk, n_resamples - i) for i in range(0, n_resamples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(ret, block_length, method, chunk_seed, size) for chunk_seed, size in zip(seeds, sizes)]
+    if processes is None or processes <= 1 or len(args) <= 1:
+        results = [_bootstrap_chunk(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_bootstrap_chunk, *zip(*args)))
+
+    trading_days = float(trading_days)
+    mean = np.concatenate([r[0] for r in results])
+    std = np.concatenate([r[1] for r in results])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.column_stack([mean * trading_days, std * np.sqrt(trading_days),
+                                mean / std * np.sqrt(trading_days)])
+
+# Function that draws size bootstrap resamples (See bootstrap_stats) of the returns (ret) and returns the average and
+# standard deviation of each. Each resample position either starts a new block at a random position or carries on from
+# the position before it, so the positions are found from the start of the block each is in.
+def _bootstrap_chunk(ret, block_length, method, seed, size):
+    rng = np.random.default_rng(seed)
+    n = len(ret)
+    pos = np.arange(n)
+    if method == 'stationary':
+        new_block = rng.random((size, n)) < 1.0 / block_length
+        new_block[:, 0] = True
+    else:
+        new_block = np.broadcast_to(pos % block_length == 0, (size, n))
+    starts = np.zeros((size, n), dtype=np.int64)
+    starts[new_block] = rng.integers(0, n, size=int(new_block.sum()))
+
+    # The position each block starts at in the resample, carried forward over the block, then the position in ret of
+    # every resampled return.
+    block_start = np.maximum.accumulate(np.where(new_block, pos, 0), axis=1)
+    sample = ret[(np.take_along_axis(starts, block_start, axis=1) + pos - block_start) % n]
+    return sample.mean(axis=1), sample.std(axis=1, ddof=1)
+
+# Function that returns bootstrap confidence intervals (See bootstrap_stats, which is passed any other arguments) for
+# the annualized statistics of an input series of daily returns, as a dictionary of the lower and upper bound of each
+# statistic's interval, named like 'Annualized Sharpe Ratio 95% CI Lower'. The intervals are the percentiles of the
+# resampled statistics covering the middle confidence of them. Fewer than 2 returns give blank intervals.
+def bootstrap_ci(ret, trading_days, confidence=0.95, **kwargs):
+    ret = np.asarray(ret, dtype=float)
+    tail = (1 - confidence) / 2 * 100
+    if len(ret) < 2:
+        bounds = np.full((2, len(BOOTSTRAP_STATS)), np.nan)
+    else:
+        resampled = bootstrap_stats(ret, trading_days, **kwargs)
+        resampled[~np.isfinite(resampled)] = np.nan
+        bounds = np.nanpercentile(resampled, [tail, 100 - tail], axis=0)
+    ci = {}
+    for i, stat in enumerate(BOOTSTRAP_STATS):
+        ci['{} {:g}% CI Lower'.format(stat, confidence * 100)] = bounds[0, i]
+        ci['{} {:g}% CI Upper'.format(stat, confidence * 100)] = bounds[1, i]
+    return ci
@@ -0,0 +1,196 @@
+'''
+Daniel McNulty II
+
+Scalable correlation analysis of daily stock returns for the contrarian strategy tester.
+'''
+
+# Import necessary libraries and functions.
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# Function that returns the Pearson correlations between the columns of an input daily returns DataFrame (Dates x
+# tickers), matching daily_ret.corr(method='pearson', min_periods=1): each pair of tickers is correlated over the dates
+# both have a return on. The work is done by matrix products (See corr_blocks), in floating point type dtype (ie.
+# np.float32 to halve memory use and double speed, at the cost of about 7 significant digits).
+def corr_matrix(daily_ret, dtype=np.float64, block_size=2048):
+    n_tickers = daily_ret.shape[1]
+    corr = np.empty((n_tickers, n_tickers), dtype=dtype)
+    for rows, cols, block in corr_blocks(daily_ret, dtype=dtype, block_size=block_size):
+        corr[rows, cols] = block
+        corr[cols, rows] = block.T
+    return pd.DataFrame(corr, index=daily_ret.columns, columns=daily_ret.columns)
+
+# Function that computes the Pearson correlations between the columns of an input daily returns DataFrame block by
+# block, so the full tickers x tickers matrix never needs to be held in memory at once. Yields (rows, cols, block)
+# for every block on or above the diagonal (or every block, in row order, if upper is False), where rows and cols are
+# slices of the ticker positions and block holds their correlations. Each ticker's returns are first centred on their
+# mean.
+#       - If no returns are missing, the returns are also scaled to unit length, so each block is a single matrix
+#         product (Z[:, rows].T @ Z[:, cols]) run by BLAS.
+#       - Otherwise, each pair is correlated over the dates both tickers have a return on, from six matrix products of
+#         the returns (missing returns set to 0), squared returns, and the 0/1 mask of which returns are present.
+def corr_blocks(daily_ret, dtype=np.float64, block_size=2048, upper=True):
+    ret = daily_ret.to_numpy(dtype=np.float64)
+    mask = ~np.isnan(ret)
+    n_tickers = ret.shape[1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centred = np.where(mask, ret - np.nanmean(ret, axis=0), 0.0)
+
+    if mask.all():
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = (centred / np.sqrt((centred ** 2).sum(axis=0))).astype(dtype)
+        for i in range(0, n_tickers, block_size):
+            for j in range(i if upper else 0, n_tickers, block_size):
+                rows, cols = slice(i, i + block_size), slice(j, j + block_size)
+                yield rows, cols, np.clip(z[:, rows].T @ z[:, cols], -1.0, 1.0)
+        return
+
+    x = centred.astype(dtype)
+    xx = x * x
+    m = mask.astype(dtype)
+    for i in range(0, n_tickers, block_size):
+        for j in range(i if upper else 0, n_tickers, block_size):
+            rows, cols = slice(i, i + block_size), slice(j, j + block_size)
+            yield rows, cols, _pairwise_corr(m[:, rows].T @ m[:, cols], x[:, rows].T @ m[:, cols],
+                                             m[:, rows].T @ x[:, cols], xx[:, rows].T @ m[:, cols],
+                                             m[:, rows].T @ xx[:, cols], x[:, rows].T @ x[:, cols])
+
+# Function that returns the correlations of pairs of tickers from the number of dates both have a return on (n), and
+# over those dates, the sums of the first ticker's returns (sx) and the second's (sy), the sums of their squares (sxx
+# and syy), and the sum of their products (sxy). Pairs with fewer than 2 dates or no variation are left blank.
+def _pairwise_corr(n, sx, sy, sxx, syy, sxy):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(n < 2) | ~(var_x > 0) | ~(var_y > 0)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+# Function that returns the k most and k least correlated pairs of tickers in an input daily returns DataFrame, as two
+# DataFrames with Ticker 1, Ticker 2, and Correlation columns, ordered from the most and least correlated pair
+# respectively. The correlations are computed block by block (See corr_blocks), keeping only the best k candidates of
+# each kind between blocks, so the memory used does not grow with the square of the number of tickers.
+def top_pairs(daily_ret, k=10, dtype=np.float64, block_size=2048):
+    best = (np.empty(0), np.empty(0, dtype=int), np.empty(0, dtype=int))
+    worst = best
+    for rows, cols, block in corr_blocks(daily_ret, dtype=dtype, block_size=block_size):
+        # Each pair is counted once, from the upper triangle of the matrix.
+        i, j = np.indices(block.shape)
+        i, j = i.ravel() + rows.start, j.ravel() + cols.start
+        values = block.ravel().astype(np.float64)
+        keep = (i < j) & ~np.isnan(values)
+        values, i, j = values[keep], i[keep], j[keep]
+        best = _top_k(*(np.concatenate(c) for c in zip(best, (values, i, j))), k)
+        worst = _top_k(*(np.concatenate(c) for c in zip(worst, (-values, i, j))), k)
+
+    tickers = np.asarray(daily_ret.columns)
+    most = pd.DataFrame({'Ticker 1': tickers[best[1]], 'Ticker 2': tickers[best[2]], 'Correlation': best[0]})
+    least = pd.DataFrame({'Ticker 1': tickers[worst[1]], 'Ticker 2': tickers[worst[2]], 'Correlation': -worst[0]})
+    return most, least
+
+# Function that returns the k largest values, and their i and j positions, sorted from largest to smallest.
+def _top_k(values, i, j, k):
+    if len(values) > k:
+        keep = np.argpartition(-values, k - 1)[:k]
+        values, i, j = values[keep], i[keep], j[keep]
+    order = np.argsort(-values, kind='mergesort')
+    return values[order], i[order], j[order]
+
+# Function that returns the positions of the tickers of an input correlation matrix (DataFrame or array) in clustered
+# order, so that groups of highly correlated tickers sit next to each other (ie. for a heatmap). The tickers are
+# clustered by average linkage on the distance 1 - correlation, joining the two closest clusters until one is left,
+# and read off in the order the clusters were joined. Takes O(n^3) time for n tickers.
+def cluster_order(corr):
+    dist = 1.0 - np.asarray(corr, dtype=np.float64)
+    n = dist.shape[0]
+    dist[np.isnan(dist)] = 1.0
+    np.fill_diagonal(dist, np.inf)
+    members = [[i] for i in range(n)]
+    for _ in range(n - 1):
+        a, b = np.unravel_index(np.argmin(dist), dist.shape)
+        a, b = min(a, b), max(a, b)
+        # Join cluster b into cluster a, whose distance to each other cluster becomes the average of theirs.
+        size_a, size_b = len(members[a]), len(members[b])
+        joined = (size_a * dist[a] + size_b * dist[b]) / (size_a + size_b)
+        dist[a], dist[:, a] = joined, joined
+        dist[a, a] = np.inf
+        dist[b], dist[:, b] = np.inf, np.inf
+        members[a] += members[b]
+        members[b] = []
+    return [i for cluster in members for i in cluster]
+
+# Rolling window correlations of a fixed list of tickers, updated incrementally. Each update adds one date of returns
+# to the window and drops the oldest once there are more than window dates, adjusting running pairwise sums (See
+# _pairwise_corr) by the returns added and dropped instead of recomputing them over the whole window. That makes each
+# update O(n^2) for n tickers, whatever the window length. The sums are rebuilt from the window every recompute updates
+# so rounding errors cannot build up.
+class RollingCorrelation:
+    def __init__(self, tickers, window, recompute=None):
+        self.tickers = list(tickers)
+        self.window = window
+        self.recompute = recompute or window
+        self._rows = deque()
+        self._updates = 0
+        self._reset()
+
+    def _reset(self):
+        n_tickers = len(self.tickers)
+        self._sums = [np.zeros((n_tickers, n_tickers)) for _ in range(4)]
+
+    # Function that adds (sign=1) or removes (sign=-1) one date of returns from the running sums.
+    def _add(self, ret, sign):
+        present = ~np.isnan(ret)
+        x = np.where(present, ret, 0.0)
+        m = present.astype(np.float64)
+        n, sx, sxx, sxy = self._sums
+        n += sign * np.outer(m, m)
+        sx += sign * np.outer(x, m)
+        sxx += sign * np.outer(x * x, m)
+        sxy += sign * np.outer(x, x)
+
+    # Function that adds one date of returns (an array or Series in ticker order, with NaN for missing returns) to the
+    # window.
+    def update(self, ret):
+        ret = np.asarray(ret, dtype=np.float64)
+        self._rows.append(ret)
+        self._add(ret, 1)
+        if len(self._rows) > self.window:
+            self._add(self._rows.popleft(), -1)
+
+        self._updates += 1
+        if self._updates % self.recompute == 0:
+            self._reset()
+            for row in self._rows:
+                self._add(row, 1)
+
+    # Function that returns the correlations over the current window as an array.
+    def corr(self):
+        n, sx, sxx, sxy = self._sums
+        return _pairwise_corr(n, sx, sx.T, sxx, sxx.T, sxy)
+
+# Function that yields (date, correlations) for each date of an input daily returns DataFrame from the window-th on,
+# every step dates, where correlations is a DataFrame of the Pearson correlations over the window dates ending on that
+# date (See RollingCorrelation).
+def rolling_corr(daily_ret, window, step=1):
+    rolling = RollingCorrelation(daily_ret.columns, window)
+    for pos, (date, ret) in enumerate(zip(daily_ret.index, daily_ret.to_numpy(dtype=np.float64))):
+        rolling.update(ret)
+        if pos + 1 >= window and (pos + 1 - window) % step == 0:
+            yield date, pd.DataFrame(rolling.corr(), index=daily_ret.columns, columns=daily_ret.columns)
+
+# Number of tickers up to which correlation_summary includes the full correlation matrix.
+HEATMAP_MAX_TICKERS = 200
+
+# Function that summarizes the correlations of an input daily returns DataFrame for display, returning a dictionary of
+# the k most and least correlated pairs of tickers (most and least, See top_pairs) and, for up to max_tickers tickers,
+# the correlation matrix in clustered order (matrix, See cluster_order), or None for more tickers than that.
+def correlation_summary(daily_ret, k=10, max_tickers=HEATMAP_MAX_TICKERS, dtype=np.float32):
+    most, least = top_pairs(daily_ret, k=k, dtype=dtype)
+    matrix = None
+    if daily_ret.shape[1] <= max_tickers:
+        matrix = corr_matrix(daily_ret, dtype=dtype)
+        order = cluster_order(matrix)
+        matrix = matrix.iloc[order, order]
+    return {'matrix': matrix, 'most': most, 'least': least}
@@ -0,0 +1,119 @@
+'''
+Daniel McNulty II
+
+Streaming downloads of the contrarian strategy tester's result tables as Parquet, Arrow, or gzipped CSV files.
+'''
+
+# Import necessary libraries and functions.
+import re
+import zlib
+import numpy as np
+import pandas as pd
+from correlation import corr_blocks
+
+# Mimetype and file extension of each export format.
+EXPORT_FORMATS = {'parquet': ('application/vnd.apache.parquet', '.parquet'),
+                  'arrow': ('application/vnd.apache.arrow.file', '.arrow'),
+                  'csv': ('application/gzip', '.csv.gz')}
+
+# Number of cells (rows x columns) converted and sent at a time, which bounds the memory an export uses beyond the table
+# itself.
+CHUNK_CELLS = 2 ** 20
+
+# Function that returns the path a table kept in the result cache under key is downloaded from, as a file named name in
+# format fmt (See EXPORT_FORMATS). If name is 'correlations', the table must be a daily returns table, and the Pearson
+# correlations of its tickers' returns are downloaded instead.
+def export_url(name, key, fmt):
+    return '/export/{}/{}/{}'.format(name, key, fmt)
+
+# Function that yields the rows of an input DataFrame in chunks of about CHUNK_CELLS cells.
+def frame_chunks(df):
+    rows = max(CHUNK_CELLS // max(df.shape[1], 1), 1)
+    for i in range(0, len(df), rows):
+        yield df.iloc[i:i + rows]
+
+# Function that yields the Pearson correlations between the tickers of an input daily returns DataFrame (with or without
+# a Date column) as DataFrames of about CHUNK_CELLS cells, each holding the correlations of a block of tickers (Ticker)
+# with every ticker. The correlations are computed block by block (See correlation.corr_blocks), so the full tickers x
+# tickers matrix is never held in memory.
+def corr_chunks(daily_ret):
+    daily_ret = daily_ret.drop(columns='Date', errors='ignore')
+    tickers = np.asarray(daily_ret.columns)
+    block_size = max(CHUNK_CELLS // max(len(tickers), 1), 1)
+    row_blocks = []
+    for rows, cols, block in corr_blocks(daily_ret, block_size=block_size, upper=False):
+        row_blocks.append(block)
+        if cols.stop >= len(tickers):
+            chunk = pd.DataFrame(np.hstack(row_blocks), columns=tickers)
+            chunk.insert(0, 'Ticker', tickers[rows])
+            yield chunk
+            row_blocks = []
+
+# Writable file-like object which holds what is written to it until taken, so a file written by pyarrow can be sent as
+# it is written.
+class _ChunkSink:
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    # Function that returns everything written since it was last called.
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+# Function that yields the bytes of a file in format fmt (See EXPORT_FORMATS) holding the DataFrames yielded by chunks,
+# which must all have the same columns. Each chunk is encoded and yielded before the next one is made, so the file is
+# never held in memory as a whole.
+#       - parquet: Each chunk is written as a row group.
+#       - arrow: The Arrow IPC file format, with each chunk written as a record batch.
+#       - csv: Gzipped CSV, with the header written once.
+def stream_table(chunks, fmt):
+    if fmt == 'csv':
+        gzip = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for i, chunk in enumerate(chunks):
+            yield gzip.compress(chunk.to_csv(index=False, header=i == 0).encode())
+        yield gzip.flush()
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _ChunkSink()
+    writer = None
+    for chunk in chunks:
+        if writer is None:
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema) if fmt == 'parquet' else \
+                     pa.ipc.new_file(pa.PythonFile(sink, mode='w'), schema)
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield sink.take()
+    if writer is not None:
+        writer.close()
+    yield sink.take()
+
+# Function that adds a route to a Flask server (ie. a Dash app's server) streaming downloads of the tables kept in a
+# result cache (See export_url). Only the paged result tables (cache keys starting with 'table-') can be downloaded.
+def init_app(server, result_cache):
+    from flask import Response, abort
+
+    @server.route('/export/<name>/<key>/<fmt>')
+    def export_table(name, key, fmt):
+        if fmt not in EXPORT_FORMATS or not re.fullmatch(r'[\w-]+', name) or not key.startswith('table-'):
+            abort(404)
+        df = result_cache.get(key)
+        if df is None:
+            abort(404)
+        chunks = corr_chunks(df) if name == 'correlations' else frame_chunks(df)
+        mimetype, extension = EXPORT_FORMATS[fmt]
+        return Response(stream_table(chunks, fmt), mimetype=mimetype,
+                        headers={'Content-Disposition': 'attachment; filename={}{}'.format(name, extension)})
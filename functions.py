@@ -1,25 +1,34 @@
 '''
 Daniel McNulty II
 
-Functions needed for the contrarian strategy tester.
+Functions needed for the contrarian strategy tester's dashboard: table formatting, server-side paging, and plots.
 '''
 
 # Import necessary libraries and functions.
 import pandas as pd
 import numpy as np
-import yfinance as yf
 from dash.dash_table import DataTable, FormatTemplate
 import plotly.graph_objs as go
-
-# Function that takes in a dataframe and outputs it as a dash DataTable with a specific format.
-def generic_tbl_fmt(df):
+from plotly.subplots import make_subplots
+# The computational core lives in core.py, which imports nothing from dash or plotly. Its functions are imported here so
+# the dashboard can keep importing everything it needs from functions.
+from core import daily_return, contrarian_portfolio_ret, validity_mask, coverage_report, summary_stats, \
+                 yearly_summaries, period_summaries, rolling_stats
+
+# Number of rows shown on each page of the DataTables.
+PAGE_SIZE = 20
+
+# Function that takes in a dataframe and outputs it as a dash DataTable with a specific format. If table_id is given,
+# the DataTable is paged, sorted, and filtered on the server (See _table_data).
+def generic_tbl_fmt(df, table_id=None):
     # Return a DataTable
     return DataTable(
             # Create a column in the DataTable for each column in the input dataframe.
             columns=[{'name': i, 'id': i, 'type': 'numeric', 'format': FormatTemplate.percentage(4)} for i in
                      df.columns],
-            # Set the data of the DataTable to the data in the df.
-            data=df.to_dict('records'),
+            # Set the data of the DataTable to the data in the df, or just its first page if the table is paged on the
+            # server.
+            **_table_data(df, table_id),
             # Set cell formatting to use center aligned text, a gray background, and white font color.
             style_cell={
                 'textAlign': 'center',
@@ -43,23 +52,24 @@ def generic_tbl_fmt(df):
             # Style the DataTable like a list view, not putting borders between columns.
             style_as_list_view=True,
             # Show 20 rows of the DataTable at a time.
-            page_size=20,
-            # Allow for the DataTable to be exported to a csv file.
-            export_format='csv',
+            page_size=PAGE_SIZE,
             # Provide an X-axis scrollbar for desktop browsers if the content in a DataTable overflows.
             style_table={'overflowX': 'auto'}
     )
 
 # Function that takes in a dataframe and outputs it as a dash DataTable with a specific format designed for the daily
-# weights, collateral, and strategy returns table.
-def contrarian_portfolio_tbl_fmt(df):
+# weights, collateral, and strategy returns table. If table_id is given, the DataTable is paged, sorted, and filtered
+# on the server (See _table_data).
+def contrarian_portfolio_tbl_fmt(df, table_id=None):
     # Return a DataTable
     return DataTable(
             # Create a column in the DataTable for each column in the input dataframe.
-            columns=[{'name': i, 'id': i, 'type': 'numeric', 'format': FormatTemplate.percentage(4)} for i in
-                     df.columns],
-            # Set the data of the DataTable to the data in the df.
-            data=df.to_dict('records'),
+            # Universe Size is a count of tickers, so it is not shown as a percentage.
+            columns=[{'name': i, 'id': i, 'type': 'numeric', 'format': FormatTemplate.percentage(4)} if
+                     i != 'Universe Size' else {'name': i, 'id': i, 'type': 'numeric'} for i in df.columns],
+            # Set the data of the DataTable to the data in the df, or just its first page if the table is paged on the
+            # server.
+            **_table_data(df, table_id),
             # Set cell formatting to use center aligned text, a gray background, and white font color.
             style_cell={
                 'textAlign': 'center',
@@ -99,9 +109,7 @@ def contrarian_portfolio_tbl_fmt(df):
             # Style the DataTable like a list view, not putting borders between columns.
             style_as_list_view=True,
             # Show 20 rows of the DataTable at a time.
-            page_size=20,
-            # Allow for the DataTable to be exported to a csv file.
-            export_format='csv',
+            page_size=PAGE_SIZE,
             # Provide an X-axis scrollbar for desktop browsers if the content in a DataTable overflows.
             style_table={'overflowX': 'auto'}
     )
@@ -156,13 +164,15 @@ def sum_stat_tbl_fmt(df):
     )
 
 # Function that takes in a dataframe and outputs it as a dash DataTable with a specific format designed for the yearly
-# summary statistics table.
-def yrly_sum_stat_tbl_fmt(df):
+# summary statistics table, or the monthly or quarterly ones (See period_summaries) with period set to 'Month' or
+# 'Quarter'. If table_id is given, the DataTable is paged, sorted, and filtered on the server (See _table_data).
+def yrly_sum_stat_tbl_fmt(df, table_id=None, period='Year'):
     return DataTable(
         # Define the columns needed for the table. Here, the columns consist of year, average daily return, standard
         # deviation of daily returns, annualized average daily return, annualized standard deviation of daily returns,
-        # and and annualized Sharpe ratio.
-        columns=[{'name': 'Year', 'id': 'Date'},
+        # and and annualized Sharpe ratio, followed by the bootstrap confidence intervals of the annualized statistics
+        # if the df has them (See core.bootstrap_ci).
+        columns=[{'name': period, 'id': 'Date'},
                  {'name': 'Average Daily Return', 'id': 'Average Daily Return', 'type': 'numeric',
                   'format': FormatTemplate.percentage(4)},
                  {'name': 'Standard Deviation of Daily Returns', 'id': 'Standard Deviation of Daily Returns',
@@ -175,9 +185,11 @@ def yrly_sum_stat_tbl_fmt(df):
                  {'name': 'Annualized Sharpe Ratio',
                   'id': 'Annualized Sharpe Ratio',
                   'type': 'numeric', 'format': FormatTemplate.percentage(4)}
-                 ],
-        # Set the data of the DataTable to the data in the df.
-        data=df.to_dict('records'),
+                 ] + [{'name': i, 'id': i, 'type': 'numeric', 'format': FormatTemplate.percentage(4)}
+                      for i in df.columns if ' CI ' in i],
+        # Set the data of the DataTable to the data in the df, or just its first page if the table is paged on the
+        # server.
+        **_table_data(df, table_id),
         # Set cell formatting to use center aligned text, a gray background, and white font color.
         style_cell={
             'textAlign': 'center',
@@ -216,78 +228,207 @@ def yrly_sum_stat_tbl_fmt(df):
         # Style the DataTable like a list view, not putting borders between columns.
         style_as_list_view=True,
         # Show 20 rows of the DataTable at a time.
-        page_size=20,
+        page_size=PAGE_SIZE,
+        # Provide an X-axis scrollbar for desktop browsers if the content in a DataTable overflows.
+        style_table={'overflowX': 'auto'}
+    )
+
+# Function that takes in a coverage report DataFrame (See coverage_report) and outputs it as a dash DataTable with a
+# specific format designed for the ticker coverage table.
+def coverage_tbl_fmt(df):
+    return DataTable(
+        # Create a column in the DataTable for each column in the input dataframe.
+        columns=[{'name': i, 'id': i} for i in df.columns],
+        # Set the data of the DataTable to the data in the df.
+        data=df.to_dict('records'),
+        # Set cell formatting to use center aligned text, a gray background, and white font color.
+        style_cell={
+            'textAlign': 'center',
+            'whiteSpace': 'normal',
+            'height': 'auto',
+            'color': 'white',
+            'backgroundColor': '#696969',
+        },
+        # Make the DataTable header background black.
+        style_header={'backgroundColor': '#000000'},
+        style_data_conditional=[
+            {
+                # If the ticker had no data in the date range, make the DataTable row red.
+                'if': {
+                    'filter_query': '{Status} = "No data"',
+                },
+                'backgroundColor': '#FF4136',
+            },
+            {
+                # Style conditional that makes the background of any cell clicked on in the DataTable purple to
+                # differentiate it from the gray background of other cells.
+                'if': {
+                    'state': 'active'  # 'active' | 'selected'
+                },
+                'backgroundColor': '#8140CF'
+            }
+        ],
+        # Style the DataTable like a list view, not putting borders between columns.
+        style_as_list_view=True,
+        # Show 20 rows of the DataTable at a time.
+        page_size=PAGE_SIZE,
         # Allow for the DataTable to be exported to a csv file.
         export_format='csv',
         # Provide an X-axis scrollbar for desktop browsers if the content in a DataTable overflows.
         style_table={'overflowX': 'auto'}
     )
 
-# Function that takes an input list of tickers, a start date, and an end date. It collects the historical closing price
-# data for each ticker from the start date to the end date from Yahoo Finance and then calculates the daily returns for
-# each ticker from these closing prices.
-def daily_return(tickers, start_date, end_date):
-    # Create a Ticker object for each ticker in the input tickers list.
-    sel = [yf.Ticker(i) for i in tickers]
-
-    # Collect the closing prices for each ticker from the input start date to the input end date from Yahoo Finance and
-    # store each in a list. Then use this list to create a DataFrame containing all the tickers closing prices.
-    hist_list = [i.history(start=start_date, end=end_date)['Close'] for i in sel]
-    hist_df = pd.DataFrame(hist_list).transpose()
-    hist_df.columns = tickers
-
-    # Calculate the daily returns for each ticker.
-    daily_ret = hist_df.pct_change(1).iloc[1:]
-
-    # Return the daily returns for each ticker.
-    return daily_ret
-
-# Function that takes daily returns of tickers in as input and runs the contrarian strategy on it. It returns the daily
-# returns input, the daily excess returns for each ticker, and the a table containing the calculated weights for each
-# ticker, collateral collateral needed, and contrarian strategy daily return for each day in the input daily returns
-# DataFrame.
-def contrarian_portfolio_ret(daily_ret):
-    # Calculate the daily excess returns over the average return for each day (row) in the input daily return DataFrame.
-    excess_ret = daily_ret.sub(daily_ret.mean(axis=1), axis=0)
-    er_dimensions = excess_ret.shape
-
-    # Calculate the weight to put on each ticker for each day (row)
-    weights = excess_ret.apply(lambda x: -x / er_dimensions[1], axis=1).shift(1).iloc[1:]
-    # Calculate the collateral needed for each day (row)
-    collateral = abs(weights).apply(sum, axis=1) / 2
-
-    # Calculate the contrarian strategy return for each day (row)
-    strat_ret = [daily_ret.iloc[i + 1].dot(weights.iloc[i]) / collateral.iloc[i] if collateral.iloc[i] != 0.0
-                 else 0.0 for i in range(0, er_dimensions[0] - 1)]
-
-    # Create the results_df, which will contain the calculated weights for each ticker, collateral collateral needed,
-    # and contrarian strategy daily return for each day.
-    results_df = weights
-    results_df['Collateral Needed'] = collateral
-    results_df['Strategy Daily Return'] = strat_ret
-
-    # Reformat the daily_ret DataFrame such that it has Date as a column and not an index
-    daily_ret = daily_ret.reset_index()
-    daily_ret['Date'] = daily_ret['Date'].dt.date
-
-    # Reformat the excess_ret DataFrame such that it has Date as a column and not an index
-    excess_ret = excess_ret.reset_index()
-    excess_ret['Date'] = excess_ret['Date'].dt.date
-
-    # Reformat the results_df DataFrame such that it has Date as a column and not an index
-    results_df = results_df.reset_index()
-    results_df['Date'] = results_df['Date'].dt.date
-
-    # Return the daily_ret, excess_ret, and results_df DataFrames
-    return daily_ret, excess_ret, results_df
+# Function that returns the data arguments for a DataTable showing the input df. If table_id is None, the DataTable is
+# given all of the df and pages, sorts, and filters it in the browser, and it can be exported to a csv file. Otherwise,
+# the df is expected to be kept on the server, and the DataTable (with id table_id) is only given its first page, with
+# paging, sorting, and filtering done by a callback using page_frame. That way, the data sent to the browser depends on
+# the page size, not the table size. A DataTable paged on the server only holds the page shown, so it has no csv export
+# (the full results are available from the dashboard's download links instead).
+def _table_data(df, table_id):
+    if table_id is None:
+        return {'data': df.to_dict('records'), 'export_format': 'csv'}
+    data, page_count = page_frame(df, 0, PAGE_SIZE)
+    return {'id': table_id, 'data': data, 'page_current': 0, 'page_count': page_count, 'page_action': 'custom',
+            'sort_action': 'custom', 'sort_mode': 'multi', 'sort_by': [], 'filter_action': 'custom',
+            'filter_query': ''}
+
+# Operators which can appear in a DataTable filter query, in the order they need to be checked in. The first entry of
+# each list is the name the operator is handled by in page_frame.
+FILTER_OPERATORS = [['ge ', '>='], ['le ', '<='], ['lt ', '<'], ['gt ', '>'], ['ne ', '!='], ['eq ', '='],
+                    ['contains '], ['datestartswith ']]
+
+# Function that splits one part of a DataTable filter query (ie. '{AAPL} > 0.01') into its column name, operator, and
+# value. The column name is read from between the braces first, and the operator is only looked for after them, so a
+# column name containing an operator (ie. '{Average Daily Return}', which contains 'ge ') is never split.
+def _split_filter_part(filter_part):
+    open_at = filter_part.find('{')
+    close_at = filter_part.find('}', open_at + 1)
+    if open_at < 0 or close_at < 0:
+        return None, None, None
+    name = filter_part[open_at + 1:close_at]
+    rest = filter_part[close_at + 1:].strip()
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if rest.startswith(operator):
+                value_part = rest[len(operator):].strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                    value = value_part[1:-1].replace('\\' + v0, v0)
+                elif operator_type[0] in ('contains ', 'datestartswith '):
+                    value = value_part
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+                return name, operator_type[0].strip(), value
+    return None, None, None
+
+# Function that applies a DataTable filter query (filter_query) and sort order (sort_by) to an input DataFrame and
+# returns the records on page page_current (counting from 0) of page_size rows, along with the number of pages. Parts
+# of the filter query that cannot apply to their column (ie. '{AAPL} > abc', or a Date compared with something that is
+# not a date) are skipped.
+def page_frame(df, page_current, page_size, sort_by=None, filter_query=None):
+    # Filter the rows of the df by each part of the filter query.
+    for filter_part in (filter_query or '').split(' && '):
+        col_name, operator, value = _split_filter_part(filter_part)
+        if col_name not in df.columns:
+            continue
+        col = df[col_name]
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            col, value = _comparable(col, value)
+            if col is None:
+                continue
+            df = df.loc[getattr(col, operator)(value)]
+        elif operator == 'contains':
+            df = df.loc[col.astype(str).str.contains(str(value), regex=False)]
+        elif operator == 'datestartswith':
+            df = df.loc[col.astype(str).str.startswith(str(value))]
+
+    # Sort the rows of the df by each column in the sort order.
+    sort_by = [s for s in (sort_by or []) if s['column_id'] in df.columns]
+    if sort_by:
+        df = df.sort_values([s['column_id'] for s in sort_by],
+                            ascending=[s['direction'] == 'asc' for s in sort_by], kind='mergesort')
+
+    # Return the records on the requested page and the number of pages.
+    page_count = max(-(-len(df) // page_size), 1)
+    return df.iloc[page_current * page_size:(page_current + 1) * page_size].to_dict('records'), page_count
+
+# Function that returns a column and a filter value in a form they can be compared in, or None for the column if they
+# cannot be. Numeric columns are compared with numbers, date columns with the value read as a date (ie. 2020 as
+# 2020-01-01), and any other column (ie. Month or Quarter labels) as text.
+def _comparable(col, value):
+    if pd.api.types.is_numeric_dtype(col):
+        return (col, value) if not isinstance(value, str) else (None, None)
+    value = value if isinstance(value, str) else '{:g}'.format(value)
+    if pd.api.types.is_datetime64_any_dtype(col) or pd.api.types.infer_dtype(col, skipna=True) == 'date':
+        try:
+            return pd.to_datetime(col), pd.Timestamp(value)
+        except ValueError:
+            return None, None
+    return col.astype(str), value
+
+# Number of daily returns above which lin_plt switches to a downsampled line plot.
+GL_THRESHOLD = 5000
+
+# Function that downsamples a series of values (y) by splitting it into at most n_buckets equal, consecutive buckets and
+# keeping the position of the smallest and largest value in each bucket, along with the first and last positions. The
+# shape of the series, including every local extreme large enough to be seen, and its overall minimum and maximum are
+# always kept. Returns the sorted positions kept.
+def minmax_downsample(y, n_buckets):
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= 2 * n_buckets + 2:
+        return np.arange(n)
+
+    # Pad the values out to a whole number of buckets, with padding (and missing values) that is never picked as a
+    # minimum or maximum.
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    lows = np.full(n_buckets * size, np.inf)
+    highs = np.full(n_buckets * size, -np.inf)
+    lows[:n] = np.where(np.isnan(y), np.inf, y)
+    highs[:n] = np.where(np.isnan(y), -np.inf, y)
+
+    # Find the positions of the minimum and maximum in each bucket.
+    offsets = np.arange(n_buckets) * size
+    idx_min = lows.reshape(n_buckets, size).argmin(axis=1) + offsets
+    idx_max = highs.reshape(n_buckets, size).argmax(axis=1) + offsets
+    return np.unique(np.concatenate([[0, n - 1], np.minimum(idx_min, n - 1), np.minimum(idx_max, n - 1)]))
 
 # Function that returns a line plot figure object from an input DataFrame. The input DataFrame must have a Strategy
-# Daily Return column, as that is the y value for this line plot.
-def lin_plt(sel_hist):
+# Daily Return column, as that is the y value for this line plot. If the DataFrame has more than GL_THRESHOLD rows, the
+# line is drawn from a downsampled copy of the returns (See minmax_downsample) holding max_points points: a quarter of
+# them covering the whole date range, drawn as an ordinary (SVG) line so the range slider shows the full history, and
+# the rest covering the visible date range (x_range, a (start, end) pair) in more detail, drawn over it with WebGL.
+# uirevision identifies the data plotted (ie. the cache key of the strategy returns), so the user's zoom is kept when
+# the figure is redrawn with more detail, but reset when a new strategy run is plotted.
+def lin_plt(sel_hist, x_range=None, max_points=4000, uirevision='lin_plt'):
+    if len(sel_hist) > GL_THRESHOLD:
+        dates = pd.to_datetime(pd.Series(sel_hist.Date)).to_numpy()
+        ret = sel_hist['Strategy Daily Return'].to_numpy(dtype=float)
+
+        # Downsample the full history for the overview line. WebGL traces are not drawn in the range slider, so this
+        # one is not drawn with WebGL.
+        keep = minmax_downsample(ret, max_points // 8)
+        traces = [go.Scatter(x=dates[keep], y=ret[keep], name='Daily Strategy Return', line={'color': 'blue'},
+                             legendgroup='ret', showlegend=True, hoverinfo='skip' if x_range is not None else None)]
+
+        # Downsample the visible date range for the detail line, drawn over the overview line with WebGL.
+        if x_range is not None:
+            visible = np.flatnonzero((dates >= np.datetime64(pd.Timestamp(x_range[0]))) &
+                                     (dates <= np.datetime64(pd.Timestamp(x_range[1]))))
+            detail = visible[minmax_downsample(ret[visible], 3 * max_points // 8)]
+            traces.append(go.Scattergl(x=dates[detail], y=ret[detail], name='Daily Strategy Return',
+                                       line={'color': 'blue'}, legendgroup='ret', showlegend=False))
+    else:
+        traces = [go.Scatter(x=sel_hist.Date, y=sel_hist['Strategy Daily Return'], name='Daily Strategy Return',
+                             line={'color': 'blue'}, showlegend=True)]
+
     # Create a line plot where date is the X axis, Strategy Daily Return is the Y axis, the line color is blue, and a
     # legend is shown for the Daily Strategy Return line.
-    lin_cht = go.Figure(data=[go.Scatter(x=sel_hist.Date, y=sel_hist['Strategy Daily Return'],
-                                         name='Daily Strategy Return', line={'color': 'blue'}, showlegend=True)])
+    lin_cht = go.Figure(data=traces)
 
     # Put a horizontal black line at y=0 for reference (ie. Make it easier to see when Daily Strategy Return is
     # positive or negative.).
@@ -309,10 +450,14 @@ def lin_plt(sel_hist):
             b=50,  # bottom margin
             t=50,  # top margin
         ),
+        # Keep the user's zoom when the figure is redrawn with more detail, but not when a new run is plotted.
+        uirevision=uirevision,
     )
 
     # Provide a rangeslider for the X axis (Dates), so users can zoom in on periods they are most interested in.
     lin_cht.update_xaxes(rangeslider_visible=True)
+    if x_range is not None:
+        lin_cht.update_xaxes(range=list(x_range))
 
     # Return the figure object.
     return lin_cht
@@ -359,76 +504,102 @@ def ann_plt(sel_sum):
     # Return the figure object.
     return fig
 
-# Function that calculates the summary statistics for an input DataFrame (sel_hist) and number of trading days per year
-# (trading_days). Summary statistics include the Average Daily Return, Standard Deviation of Daily Returns, Annualized
-# Average Daily Return, Annualized Standard Deviation of Daily Returns, and Annualized Sharpe Ratio for the 'Strategy
-# Daily Return' column of the input DataFrame. As such, the input DataFrame must have a 'Strategy Daily Return' column.
-def summary_stats(sel_hist, trading_days):
-    # Convert input trading_days to a float to prevent any possible truncation later.
-    trading_days = float(trading_days)
-
-    # Calculate the Average Daily Return from the 'Strategy Daily Return' column using the average function from numpy.
-    # Likewise, calculate the Standard Deviation of Daily Return from the 'Strategy Daily Return' column using the
-    # std function from numpy.
-    avg_daily_ret = np.average(sel_hist['Strategy Daily Return'])
-    std_dev_daily_ret = np.std(sel_hist['Strategy Daily Return'], ddof=1)
-
-    # Create a DataFrame named sum_stats which holds:
-    #       - Average Daily Return: Calculated above.
-    #       - Standard Deviation of Daily Returns: Calculated above.
-    #       - Annualized Average Daily Return: Calculated by taking the Average Daily Return and multiplying it by the
-    #                                          trading days per year.
-    #       - Annualized Standard Deviation of Daily Returns: Calculated by taking the Standard Deviation of Daily
-    #                                                         Returns and multiplying it by the square root of the
-    #                                                         trading days per year.
-    #       - Annualized Sharpe Ratio: Calculated by dividing the Average Daily Return by the Standard Deviation of
-    #                                  Daily Returns and multiplying the quotient by the square root of the trading days
-    #                                  per year.
-    sum_stats = pd.DataFrame({'Average Daily Return': [avg_daily_ret],
-                              'Standard Deviation of Daily Returns': [std_dev_daily_ret],
-                              'Annualized Average Daily Return': [avg_daily_ret * trading_days],
-                              'Annualized Standard Deviation of Daily Returns': [std_dev_daily_ret*np.sqrt(trading_days)],
-                              'Annualized Sharpe Ratio': [(avg_daily_ret/std_dev_daily_ret)*np.sqrt(trading_days)]})
-
-    # Return the sum_stats DataFrame.
-    return sum_stats
-
-# Function that calculates the yearly summary statistics for an input DataFrame (sel_hist) and number of trading days
-# per year (trading_days). Summary statistics include the Average Daily Return, Standard Deviation of Daily Returns,
-# Annualized Average Daily Return, Annualized Standard Deviation of Daily Returns, and Annualized Sharpe Ratio for the
-# 'Strategy Daily Return' column of the input DataFrame. As such, the input DataFrame must have a 'Strategy Daily
-# Return' column.
-def yearly_summaries(sel_hist, trading_days):
-    # Convert input trading_days to a float to prevent any possible truncation later.
-    trading_days = float(trading_days)
-
-    # Make sure the dates in sel_hist['Date'] are of type datetime. Then, group the sel_hist Strategy Daily Returns by
-    # year.
-    sel_hist['Date'] = pd.to_datetime(sel_hist['Date'])
-    yr_groups = sel_hist['Strategy Daily Return'].groupby(sel_hist['Date'].dt.year)
-
-    # Create a sum_stats DataFrame. Initially, have it contain:
-    #       - Date: A column which holds the years.
-    #       - Average Daily Return: A column which holds the Average Daily Return for each year. Calculated using
-    #                               mean() for each year group.
-    #       - Standard Deviation of Daily Returns: A column which holds the Average Daily Return for each year.
-    #                                              Calculated using std() for each year group.
-    sum_stats = pd.DataFrame({'Date': yr_groups.mean().index,
-                              'Average Daily Return': yr_groups.mean(),
-                              'Standard Deviation of Daily Returns': yr_groups.std(ddof=1)})
-
-    # Add 3 more columns to sum_stats:
-    #       - Annualized Average Daily Return: Calculated by multiplying the Average Daily Return column by the number
-    #                                          of trading days.
-    #       - Annualized Standard Deviation of Daily Returns: Calculated by multiplying the Standard Deviation of Daily
-    #                                                         Returns column by the square root of the number of trading
-    #                                                         days.
-    #       - Annualized Sharpe Ratio: Calculated by dividing the Average Daily Return column values by their
-    #                                  corresponding Standard Deviation of Daily Returns column values, then multiplying
-    #                                  the quotients by the square root of the number of trading days.
-    sum_stats['Annualized Average Daily Return'] = sum_stats['Average Daily Return'] * trading_days
-    sum_stats['Annualized Standard Deviation of Daily Returns'] = sum_stats['Standard Deviation of Daily Returns'] * np.sqrt(trading_days)
-    sum_stats['Annualized Sharpe Ratio'] = sum_stats['Average Daily Return'].divide(sum_stats['Standard Deviation of Daily Returns'])*np.sqrt(trading_days)
-
-    # Return the sum_stats DataFrame.
-    return sum_stats
+# Function that returns a figure object with line plots of the rolling annualized average daily return, annualized
+# standard deviation of daily returns, annualized Sharpe ratio, and maximum drawdown for each window in an input
+# DataFrame made by rolling_stats. Each statistic gets its own row of the figure, with rows sharing the X axis (Dates).
+def roll_plt(roll_stats):
+    # Find the window lengths in the input DataFrame from its column names.
+    windows = [c.split(' ')[1] for c in roll_stats.columns if c.endswith('Maximum Drawdown')]
+    stats = ['Annualized Average Daily Return', 'Annualized Standard Deviation of Daily Returns',
+             'Annualized Sharpe Ratio', 'Maximum Drawdown']
+    colors = ['blue', 'red', 'green', 'orange', 'purple']
+
+    # Create a figure with one row per statistic, then add a line for each window to each row.
+    fig = make_subplots(rows=len(stats), cols=1, shared_xaxes=True, vertical_spacing=0.05, subplot_titles=stats)
+    for i, w in enumerate(windows):
+        for row, stat in enumerate(stats, start=1):
+            fig.add_trace(go.Scatter(x=roll_stats.Date, y=roll_stats['Rolling {} {}'.format(w, stat)],
+                                     name=w.replace('-', ' ').replace('Day', 'Days'), legendgroup=w,
+                                     line={'color': colors[i % len(colors)]}, showlegend=row == 1), row=row, col=1)
+
+    # Update the figure layout
+    fig.update_layout(
+        # Enable hover interaction, providing the values and date closest to where the mouse cursor is hovering over
+        # the line plots.
+        hovermode='x',
+        height=900,
+        # Set margins.
+        margin=go.layout.Margin(
+            l=0,  # left margin
+            r=0,  # right margin
+            b=50,  # bottom margin
+            t=50,  # top margin
+        ),
+    )
+    # Format the Y axes. The Sharpe ratio is a plain number, the rest are percentages.
+    for row, stat in enumerate(stats, start=1):
+        fig.update_yaxes(tickformat=',.2f' if stat == 'Annualized Sharpe Ratio' else ',.0%', row=row, col=1)
+    fig.update_xaxes(title_text='Date', row=len(stats), col=1)
+
+    # Return the figure object.
+    return fig
+
+# Function that returns a heatmap figure object of an input correlation matrix DataFrame (ie. one in clustered order,
+# See correlation.cluster_order). Correlations are rounded to 3 decimal places to keep the figure small.
+def corr_heatmap(corr):
+    # Create a heatmap with the tickers on both axes, coloring correlations from -1 (red) through 0 (white) to 1 (blue).
+    fig = go.Figure(data=[go.Heatmap(z=np.round(corr.to_numpy(dtype=float), 3), x=list(corr.columns),
+                                     y=list(corr.index), zmin=-1, zmax=1, colorscale='RdBu',
+                                     colorbar={'title': 'Correlation'})])
+
+    # Update the figure layout
+    fig.update_layout(
+        # Show the first ticker at the top, so the matrix reads like a table.
+        yaxis={'autorange': 'reversed'},
+        height=700,
+        # Set margins.
+        margin=go.layout.Margin(
+            l=0,  # left margin
+            r=0,  # right margin
+            b=50,  # bottom margin
+            t=50,  # top margin
+        ),
+    )
+
+    # Return the figure object.
+    return fig
+
+# Function that takes in a DataFrame of pairs of tickers and their correlations (See correlation.top_pairs) and outputs
+# it as a dash DataTable with a specific format designed for the most and least correlated pairs tables.
+def pairs_tbl_fmt(df):
+    return DataTable(
+        # Create a column in the DataTable for each column in the input dataframe, showing correlations to 4 decimals.
+        columns=[{'name': i, 'id': i, 'type': 'numeric', 'format': {'specifier': '.4f'}} if i == 'Correlation' else
+                 {'name': i, 'id': i} for i in df.columns],
+        # Set the data of the DataTable to the data in the df.
+        data=df.to_dict('records'),
+        # Set cell formatting to use center aligned text, a gray background, and white font color.
+        style_cell={
+            'textAlign': 'center',
+            'whiteSpace': 'normal',
+            'height': 'auto',
+            'color': 'white',
+            'backgroundColor': '#696969',
+        },
+        # Make the DataTable header background black.
+        style_header={'backgroundColor': '#000000'},
+        # Style conditional that makes the background of any cell clicked on in the DataTable purple to
+        # differentiate it from the gray background of other cells.
+        style_data_conditional=[
+            {
+                'if': {
+                    'state': 'active'  # 'active' | 'selected'
+                },
+                'backgroundColor': '#8140CF'
+            }
+        ],
+        # Style the DataTable like a list view, not putting borders between columns.
+        style_as_list_view=True,
+        # Allow for the DataTable to be exported to a csv file.
+        export_format='csv',
+    )
@@ -0,0 +1,90 @@
+'''
+Daniel McNulty II
+
+gunicorn settings for serving the contrarian strategy tester. gunicorn loads this file from the working directory, so
+"gunicorn app:server" (See Procfile) picks it up. Any setting given on the command line overrides the ones here.
+
+If PRELOAD_APP is set (ie. PRELOAD_APP=1), the app is imported once in the master process, which then warms the app
+up (See app.warm_up) and writes a snapshot of the price store (See price_store.PriceStore.snapshot) before forking the
+workers, so every worker starts with the imported modules already in memory, shared copy-on-write. Each worker's job
+fork server also maps the snapshot into memory (See job_preload.py), so the job processes that run the strategy share
+one copy of the prices across all workers rather than reading them from disk. The snapshot is removed as the master
+exits. Otherwise, each worker imports
+the app and warms it up itself as it boots, unless WARM_UP is 0. Either way, each worker starts its job fork server
+while it boots (See jobs.JobQueue.start), and the time the app took to load, each worker took to boot, and each worker
+took to serve its first request are logged and recorded in the metrics served on /metrics (See metrics.py).
+'''
+
+# Import necessary libraries and functions.
+import os
+import shutil
+import time
+
+# Time this file was loaded, which is as gunicorn starts.
+_started = time.time()
+
+preload_app = os.environ.get('PRELOAD_APP', '0') not in ('', '0')
+_warm_up = os.environ.get('WARM_UP', '1') not in ('', '0')
+
+# Function that runs in the master process once it is ready to fork the workers. In preload mode, the app has already
+# been imported, and is now warmed up (See app.warm_up), and a snapshot of the price store is written for the workers'
+# job fork servers to map (See job_preload.py), named to them by PRICE_STORE_SNAPSHOT.
+def when_ready(server):
+    if not preload_app:
+        return
+    loaded = time.time() - _started
+    import app
+    server.log.info('App imported in %.2fs and warmed up in %.2fs before forking workers.', loaded, app.warm_up())
+    started = time.time()
+    snapshot, n_tickers, n_bytes = app.price_store.snapshot()
+    os.environ['PRICE_STORE_SNAPSHOT'] = snapshot
+    server.log.info('Price store snapshot of %d tickers (%d bytes) written to %s in %.2fs.', n_tickers, n_bytes,
+                    snapshot, time.time() - started)
+
+# Function that runs in the master process as gunicorn exits, removing the price store snapshot written in
+# when_ready.
+def on_exit(server):
+    snapshot = os.environ.pop('PRICE_STORE_SNAPSHOT', None)
+    if snapshot:
+        shutil.rmtree(snapshot, ignore_errors=True)
+
+# Function that runs in the master process just before a worker is forked, recording when.
+def pre_fork(server, worker):
+    worker.forked_at = time.time()
+
+# Function that runs in each worker once it has loaded the app, before it serves any request. Warms the app up (unless
+# the master already did), starts the worker's job fork server, and reports how long the worker took to boot.
+def post_worker_init(worker):
+    import app
+    from metrics import record_time
+    detail = ' (preloaded)' if preload_app else ''
+    if _warm_up and not preload_app:
+        detail = ' (warmed up in {:.2f}s)'.format(app.warm_up())
+    app.job_queue.start()
+    boot = time.time() - worker.forked_at
+    record_time('worker_boot', boot)
+    worker.log.info('Worker %s booted in %.2fs%s.', worker.pid, boot, detail)
+    worker.first_request = None
+
+# Function that runs in each worker as it exits, shutting down its job pool so the pool's processes and fork server
+# exit with it (See jobs.JobQueue.shutdown).
+def worker_exit(server, worker):
+    import app
+    app.job_queue.shutdown()
+
+# Function that runs in a worker before each request, recording when its first request started.
+def pre_request(worker, req):
+    if getattr(worker, 'first_request', None) is None:
+        worker.first_request = (req, time.perf_counter())
+
+# Function that runs in a worker after each request, reporting how long its first request took to serve.
+def post_request(worker, req, environ, resp):
+    first = getattr(worker, 'first_request', None)
+    if first is None or first[0] is not req:
+        return
+    from metrics import record_time
+    latency = time.perf_counter() - first[1]
+    record_time('first_request', latency)
+    worker.log.info('Worker %s served its first request (%s %s) in %.3fs, %.2fs after it was forked.', worker.pid,
+                    req.method, req.path, latency, time.time() - worker.forked_at)
+    worker.first_request = (None, 0.0)
@@ -0,0 +1,146 @@
+'''
+Daniel McNulty II
+
+Incremental daily-update mode for the contrarian strategy tester.
+'''
+
+# Import necessary libraries and functions.
+import json
+import os
+import numpy as np
+import pandas as pd
+from core import contrarian_portfolio_ret
+
+# Stateful contrarian strategy engine for a fixed list of tickers. Instead of recomputing the whole history, it takes in
+# one new day of closing prices at a time and returns that day's weights, collateral, and strategy return. It keeps the
+# previous day's closes and excess returns, which is all the next day's weights depend on, and running (Welford) mean
+# and variance accumulators of the strategy returns overall and by year, so each update costs O(tickers). The state can
+# be saved to and loaded from a JSON file between runs.
+class ContrarianState:
+    def __init__(self, tickers, trading_days):
+        self.tickers = list(tickers)
+        self.trading_days = float(trading_days)
+        self.last_date = None
+        self.last_close = None
+        self.last_excess = None
+        # Welford accumulators as [count, mean, sum of squared deviations from the mean], overall and by year.
+        self.overall = [0, 0.0, 0.0]
+        self.yearly = {}
+
+    # Function that creates a state from a DataFrame of historical closing prices (Dates x tickers), running the full
+    # contrarian strategy over the history once to seed it.
+    @classmethod
+    def from_closes(cls, closes, trading_days):
+        state = cls(closes.columns, trading_days)
+        daily_ret = closes.pct_change(1).iloc[1:]
+        daily_ret.index = pd.DatetimeIndex(daily_ret.index, name='Date')
+        if len(daily_ret) > 1:
+            strat = contrarian_portfolio_ret(daily_ret)[2]
+            ret = strat['Strategy Daily Return'].to_numpy(dtype=float)
+            years = pd.DatetimeIndex(strat['Date']).year
+            state.overall = _accumulator(ret)
+            state.yearly = {int(y): _accumulator(ret[years == y]) for y in np.unique(years)}
+        if len(daily_ret) > 0:
+            last_ret = daily_ret.iloc[-1].to_numpy(dtype=float)
+            state.last_excess = last_ret - np.nanmean(last_ret)
+        state.last_date = pd.Timestamp(closes.index[-1])
+        state.last_close = closes.iloc[-1].to_numpy(dtype=float)
+        return state
+
+    # Function that takes in the closing prices for one new day (date) and returns a Series holding that day's weight
+    # for each ticker, the collateral needed, and the strategy daily return. closes can be a Series indexed by ticker or
+    # a sequence in the same order as tickers. Returns None if there is not enough history yet to set weights.
+    def update(self, date, closes):
+        date = pd.Timestamp(date)
+        if self.last_date is not None and date <= self.last_date:
+            raise ValueError('Closing prices for {} are not after the last update ({}).'.format(date.date(),
+                                                                                           self.last_date.date()))
+        if isinstance(closes, pd.Series):
+            closes = closes[self.tickers]
+        closes = np.asarray(closes, dtype=float)
+
+        result = None
+        if self.last_close is not None:
+            ret = closes / self.last_close - 1
+            if self.last_excess is not None:
+                # Weights come from the previous day's excess returns, exactly as in contrarian_portfolio_ret.
+                weights = -self.last_excess / len(self.tickers)
+                collateral = np.abs(weights).sum() / 2
+                strat_ret = ret.dot(weights) / collateral if collateral != 0.0 else 0.0
+                _welford_add(self.overall, strat_ret)
+                _welford_add(self.yearly.setdefault(date.year, [0, 0.0, 0.0]), strat_ret)
+                result = pd.Series(np.append(weights, [collateral, strat_ret]), name=date.date(),
+                                   index=self.tickers + ['Collateral Needed', 'Strategy Daily Return'])
+            self.last_excess = ret - np.nanmean(ret)
+
+        self.last_date = date
+        self.last_close = closes
+        return result
+
+    # Function that returns the summary statistics of all strategy returns seen so far, in the same form as
+    # core.summary_stats.
+    def summary_stats(self):
+        return pd.DataFrame(self._stats_columns([self.overall]))
+
+    # Function that returns the yearly summary statistics of all strategy returns seen so far, in the same form as
+    # core.yearly_summaries.
+    def yearly_summaries(self):
+        years = sorted(self.yearly)
+        sum_stats = pd.DataFrame({'Date': years})
+        for name, values in self._stats_columns([self.yearly[y] for y in years]).items():
+            sum_stats[name] = values
+        sum_stats.index = pd.Index(years, name='Date')
+        return sum_stats
+
+    # Function that turns Welford accumulators into the summary statistics columns.
+    def _stats_columns(self, accumulators):
+        avg = np.array([a[1] if a[0] > 0 else np.nan for a in accumulators])
+        std = np.array([np.sqrt(a[2] / (a[0] - 1)) if a[0] > 1 else np.nan for a in accumulators])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sharpe = avg / std * np.sqrt(self.trading_days)
+        return {'Average Daily Return': avg,
+                'Standard Deviation of Daily Returns': std,
+                'Annualized Average Daily Return': avg * self.trading_days,
+                'Annualized Standard Deviation of Daily Returns': std * np.sqrt(self.trading_days),
+                'Annualized Sharpe Ratio': sharpe}
+
+    # Function that saves the state to a JSON file. The file is written to a temporary path first and then moved into
+    # place, so a failed nightly run never leaves a half written state behind.
+    def save(self, path):
+        state = {'tickers': self.tickers,
+                 'trading_days': self.trading_days,
+                 'last_date': None if self.last_date is None else str(self.last_date.date()),
+                 'last_close': None if self.last_close is None else self.last_close.tolist(),
+                 'last_excess': None if self.last_excess is None else self.last_excess.tolist(),
+                 'overall': self.overall,
+                 'yearly': {str(y): a for y, a in self.yearly.items()}}
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+    # Function that loads a state saved with save.
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            saved = json.load(f)
+        state = cls(saved['tickers'], saved['trading_days'])
+        state.last_date = None if saved['last_date'] is None else pd.Timestamp(saved['last_date'])
+        state.last_close = None if saved['last_close'] is None else np.array(saved['last_close'], dtype=float)
+        state.last_excess = None if saved['last_excess'] is None else np.array(saved['last_excess'], dtype=float)
+        state.overall = saved['overall']
+        state.yearly = {int(y): a for y, a in saved['yearly'].items()}
+        return state
+
+# Function that returns a Welford accumulator ([count, mean, sum of squared deviations]) for an array of values.
+def _accumulator(values):
+    if len(values) == 0:
+        return [0, 0.0, 0.0]
+    mean = float(np.mean(values))
+    return [int(len(values)), mean, float(np.sum((values - mean) ** 2))]
+
+# Function that adds one value to a Welford accumulator in place.
+def _welford_add(acc, value):
+    acc[0] += 1
+    delta = value - acc[1]
+    acc[1] += delta / acc[0]
+    acc[2] += delta * (value - acc[1])
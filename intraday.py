@@ -0,0 +1,303 @@
+'''
+Daniel McNulty II
+
+Intraday mode of the contrarian strategy tester. Runs the contrarian strategy on 1 or 5 minute bars read from local
+Parquet files, one time-ordered chunk of bars at a time, so the memory used depends on the chunk size and not on the
+length of the history. The strategy returns of each bar are streamed out chunk by chunk and summarized both per bar
+(annualized by the number of bars per year) and per day, in the same form as the daily strategy's statistics.
+
+Each ticker's bars are kept in their own file, <TICKER>.parquet, in one directory, with a Datetime column holding the
+time of each bar and a Close column holding its closing price, in time order. Run from the repository root:
+    python intraday.py tickers.txt --bars bars --bars-per-year 98280 --output results
+    python intraday.py tickers.txt --bars bars5 --bars-per-year 19656 --bar-returns --output results
+'''
+
+# Import necessary libraries and functions.
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+from core import summary_stats, period_summaries, _dynamic_universe_arrays, _period_labels, PERIODS
+from batch import FORMATS, read_tickers, write_table
+from export import stream_table
+
+# Names of the time and closing price columns of the bar files.
+TIME_COLUMN = 'Datetime'
+CLOSE_COLUMN = 'Close'
+
+# Default number of bar times worked on at once. At 1 minute bars, this is about 42 trading days of bars.
+CHUNK_ROWS = 2 ** 14
+
+# Function that returns the path of a ticker's bar file in directory.
+def bar_path(directory, ticker):
+    return os.path.join(directory, ticker + '.parquet')
+
+# Function that yields the closing prices of the bars in a Parquet file as Series indexed by time, batch_rows bars at a
+# time. Yields nothing if the file does not exist.
+def _read_bars(path, batch_rows):
+    if not os.path.exists(path):
+        return
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=[TIME_COLUMN, CLOSE_COLUMN]):
+        yield pd.Series(batch.column(CLOSE_COLUMN).to_numpy(zero_copy_only=False).astype(float),
+                        index=pd.DatetimeIndex(batch.column(TIME_COLUMN).to_pandas(), name=TIME_COLUMN))
+
+# Function that yields the closing prices of a list of tickers' bars (See bar_path) as DataFrames (bar times x tickers)
+# in time order, each covering up to about chunk_rows bar times. Each ticker's file is read chunk_rows bars at a time,
+# and each chunk covers the bars up to the earliest last bar read of any ticker with bars left to read, so every
+# ticker's bars up to that time are in the chunk. At most about 2 x chunk_rows bars of each ticker are held at once. As
+# in core.daily_return, prices are carried forward over bars a ticker has no price for (including across chunks), but
+# not past its last bar, so it leaves the universe then. Prices before a ticker's first bar are missing.
+def bar_closes(directory, tickers, chunk_rows=CHUNK_ROWS):
+    readers = [_read_bars(bar_path(directory, t), chunk_rows) for t in tickers]
+    buffers = [pd.Series(dtype=float) for _ in tickers]
+    done = [False] * len(tickers)
+    last_time = [None] * len(tickers)
+    last_close = np.full(len(tickers), np.nan)
+
+    while True:
+        # Read each ticker's bars until it has at least chunk_rows waiting, or none are left.
+        for i, reader in enumerate(readers):
+            while not done[i] and len(buffers[i]) < chunk_rows:
+                try:
+                    buffers[i] = pd.concat([buffers[i], next(reader)]) if len(buffers[i]) else next(reader)
+                except StopIteration:
+                    done[i] = True
+            if not buffers[i].index.is_monotonic_increasing or not buffers[i].index.is_unique or \
+               (len(buffers[i]) and last_time[i] is not None and buffers[i].index[0] <= last_time[i]):
+                raise ValueError('The bars of {} are not in time order.'.format(tickers[i]))
+        if not any(len(b) for b in buffers):
+            return
+
+        # Take every ticker's bars up to the chunk's cutoff.
+        reading = [b.index[-1] for b, d in zip(buffers, done) if not d]
+        cutoff = min(reading) if reading else max(b.index[-1] for b in buffers if len(b))
+        parts = {}
+        for i, t in enumerate(tickers):
+            n_taken = buffers[i].index.searchsorted(cutoff, side='right') if len(buffers[i]) else 0
+            parts[t], buffers[i] = buffers[i].iloc[:n_taken], buffers[i].iloc[n_taken:]
+            if n_taken:
+                last_time[i] = parts[t].index[-1]
+        closes = pd.concat({t: p for t, p in parts.items() if len(p)}, axis=1, sort=True).reindex(columns=tickers)
+
+        # Carry prices forward from the last chunk, then remove them after the last bar of tickers with no bars left.
+        filled = pd.DataFrame(np.vstack([last_close, closes.to_numpy(dtype=float)])).ffill().to_numpy(copy=True)[1:]
+        for i in range(len(tickers)):
+            if done[i] and not len(buffers[i]) and last_time[i] is not None:
+                filled[closes.index > last_time[i], i] = np.nan
+        last_close = filled[-1]
+        yield pd.DataFrame(filled, index=pd.DatetimeIndex(closes.index, name=TIME_COLUMN), columns=tickers)
+
+# Function that runs the contrarian strategy (See core.contrarian_portfolio_ret, with a dynamic universe) on the bars
+# of a list of tickers (See bar_closes), yielding the results for each chunk of bars in time order as a DataFrame with
+# the Datetime of each bar, the weight of each ticker, the Universe Size, the Collateral Needed, and the Strategy Bar
+# Return. The closing prices and returns of the last bar of each chunk are carried over to the next chunk, so its first
+# bar's return and weights are exactly those a run over the whole history would give. The return of the first bar of
+# each day is measured from the last bar of the day before, so it includes the overnight move.
+def contrarian_bar_ret(directory, tickers, chunk_rows=CHUNK_ROWS):
+    prev_close, prev_ret = None, None
+    for closes in bar_closes(directory, tickers, chunk_rows=chunk_rows):
+        values = closes.to_numpy()
+        times = closes.index
+
+        # The return of each bar in the chunk, with the first measured from the last bar of the chunk before.
+        if prev_close is None:
+            values, prev_close, times = values[1:], values[0], times[1:]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ret = values / np.vstack([prev_close, values[:-1]]) - 1
+        if len(values):
+            prev_close = values[-1]
+
+        # Run the strategy over the chunk's returns, with the last return of the chunk before setting the first bar's
+        # weights.
+        if prev_ret is not None:
+            ret = np.vstack([prev_ret, ret])
+        else:
+            times = times[1:]
+        if len(ret):
+            prev_ret = ret[-1]
+        if len(ret) < 2:
+            continue
+        weights, universe_size, collateral, strat_ret = _dynamic_universe_arrays(ret)[1:]
+
+        results_df = pd.DataFrame(weights, index=times, columns=tickers)
+        results_df['Universe Size'] = universe_size
+        results_df['Collateral Needed'] = collateral
+        results_df['Strategy Bar Return'] = strat_ret
+        yield results_df.reset_index()
+
+# Running summary of a stream of contrarian strategy bar returns (See contrarian_bar_ret), for bars_per_year bars and
+# trading_days trading days per year. Each day's bars are reduced to their count, mean, and sum of squared deviations
+# from the mean, and their compounded return, so it holds a few numbers per day whatever the number of bars. Days and
+# periods are combined by the pairwise (Chan et al.) update of those sums, which avoids the cancellation error of
+# summing squares.
+class IntradayStats:
+    def __init__(self, bars_per_year, trading_days=252):
+        self.bars_per_year = float(bars_per_year)
+        self.trading_days = float(trading_days)
+        # [count, mean, sum of squared deviations from the mean, growth] of the bar returns of each day.
+        self.days = {}
+
+    # Function that adds a chunk of strategy bar returns (See contrarian_bar_ret) to the summary.
+    def update(self, chunk):
+        ret = pd.Series(chunk['Strategy Bar Return'].to_numpy(dtype=float))
+        days = pd.DatetimeIndex(chunk[TIME_COLUMN]).date
+        grouped = ret.groupby(days).agg(['count', 'mean', 'var'])
+        grouped['growth'] = (ret + 1).groupby(days).prod()
+        for day, n, mean, var, growth in grouped.itertuples():
+            acc = self.days.setdefault(day, [0, 0.0, 0.0, 1.0])
+            m2 = var * (n - 1) if n > 1 else 0.0
+            total = acc[0] + n
+            delta = mean - acc[1]
+            acc[2] += m2 + delta ** 2 * acc[0] * n / total
+            acc[1] += delta * n / total
+            acc[0] = total
+            acc[3] *= growth
+
+    # Function that returns a DataFrame with the Date, number of Bars, and Strategy Daily Return (the compounded return
+    # of the day's bars) of each day seen so far, which the daily statistics functions of core.py take in.
+    def daily_returns(self):
+        days = sorted(self.days)
+        sums = np.array([self.days[d] for d in days]).reshape(-1, 4)
+        return pd.DataFrame({'Date': days, 'Bars': sums[:, 0].astype(int), 'Strategy Daily Return': sums[:, 3] - 1})
+
+    # Function that returns the summary statistics of the strategy's daily returns (See core.summary_stats).
+    def summary_stats(self, n_resamples=0, seed=0):
+        return summary_stats(self.daily_returns(), self.trading_days, n_resamples=n_resamples, seed=seed)
+
+    # Function that returns the summary statistics of the strategy's daily returns by period (See
+    # core.period_summaries).
+    def period_summaries(self, periods=('M', 'Q', 'Y'), n_resamples=0, seed=0, ci_periods=None):
+        return period_summaries(self.daily_returns(), self.trading_days, periods=periods, n_resamples=n_resamples,
+                                seed=seed, ci_periods=ci_periods)
+
+    # Function that returns the summary statistics of the strategy's bar returns, annualized by the number of bars per
+    # year: the Average Bar Return, Standard Deviation of Bar Returns, Annualized Average Bar Return, Annualized
+    # Standard Deviation of Bar Returns, and Annualized Sharpe Ratio.
+    def bar_summary_stats(self):
+        days = sorted(self.days)
+        return self._bar_stats(np.zeros(len(days), dtype=int), days).drop(columns='Code')
+
+    # Function that returns the summary statistics of the strategy's bar returns (See bar_summary_stats) by month
+    # ('M'), quarter ('Q'), and year ('Y'), or whichever of those are in periods, as a dictionary of a DataFrame for
+    # each period whose Date column holds the periods, as core.period_summaries does.
+    def bar_period_summaries(self, periods=('M', 'Q', 'Y')):
+        days = sorted(self.days)
+        dates = pd.DatetimeIndex(days)
+        summaries = {}
+        for period in periods:
+            per_year = PERIODS[period][1]
+            code = dates.year.to_numpy() * per_year + (dates.month.to_numpy() - 1) // (12 // per_year)
+            sum_stats = self._bar_stats(code, days)
+            sum_stats.insert(0, 'Date', _period_labels(sum_stats.pop('Code').to_numpy(), per_year))
+            summaries[period] = sum_stats
+        return summaries
+
+    # Function that combines the sums of the days (in order) into the sums of the groups given by code, one for each
+    # day, and returns the bar summary statistics of each group with its Code.
+    def _bar_stats(self, code, days):
+        sums = np.array([self.days[d] for d in days]).reshape(-1, 4)
+        n, mean, m2 = sums[:, 0], sums[:, 1], sums[:, 2]
+        present, group = np.unique(code, return_inverse=True)
+        total_n = np.bincount(group, n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            total_mean = np.bincount(group, n * mean) / total_n
+            total_m2 = np.bincount(group, m2) + np.bincount(group, n * (mean - total_mean[group]) ** 2)
+            std = np.sqrt(total_m2 / (total_n - 1))
+            sharpe = total_mean / std * np.sqrt(self.bars_per_year)
+        std[total_n < 2] = np.nan
+        sharpe[total_n < 2] = np.nan
+        return pd.DataFrame({'Code': present,
+                             'Bars': total_n.astype(int),
+                             'Average Bar Return': total_mean,
+                             'Standard Deviation of Bar Returns': std,
+                             'Annualized Average Bar Return': total_mean * self.bars_per_year,
+                             'Annualized Standard Deviation of Bar Returns': std * np.sqrt(self.bars_per_year),
+                             'Annualized Sharpe Ratio': sharpe})
+
+# Function that runs the contrarian strategy on the bars of a list of tickers kept in directory (See bar_path),
+# chunk_rows bar times at a time, and returns a dictionary of the resulting tables by name:
+#       - daily_returns: The compounded strategy return of each day.
+#       - summary_stats, monthly_summaries, quarterly_summaries, and yearly_summaries: The summary statistics of the
+#         strategy's daily returns, overall and for each month, quarter, and year, for trading_days trading days a year.
+#       - bar_summary_stats, bar_monthly_summaries, bar_quarterly_summaries, and bar_yearly_summaries: The summary
+#         statistics of the strategy's bar returns, overall and for each month, quarter, and year, for bars_per_year
+#         bars a year.
+# If bar_returns_path is given, the weights and strategy return of every bar are also written to that path in format fmt
+# (See export.EXPORT_FORMATS) as they are computed. If n_resamples is above 0, the summary_stats and yearly_summaries
+# tables include bootstrap confidence intervals (See core.bootstrap_ci).
+def run(tickers, directory, bars_per_year, trading_days=252, chunk_rows=CHUNK_ROWS, bar_returns_path=None,
+        fmt='parquet', n_resamples=0):
+    if len(tickers) <= 1:
+        raise ValueError('ERROR - More than 1 ticker must be used')
+    if sum(os.path.exists(bar_path(directory, t)) for t in tickers) <= 1:
+        raise ValueError('ERROR - Bars were found for fewer than 2 of the tickers in {}. Please confirm the tickers '
+                         'are correct and try again.'.format(directory))
+
+    # Summarize each chunk of strategy returns as it passes on to be written out, or dropped.
+    stats = IntradayStats(bars_per_year, trading_days)
+    def chunks():
+        for chunk in contrarian_bar_ret(directory, tickers, chunk_rows=chunk_rows):
+            stats.update(chunk)
+            yield chunk
+    if bar_returns_path is None:
+        for _ in chunks():
+            pass
+    else:
+        with open(bar_returns_path, 'wb') as f:
+            for data in stream_table(chunks(), fmt):
+                f.write(data)
+    if not stats.days:
+        raise ValueError('ERROR - Not enough bars were found to run the strategy.')
+
+    periods = stats.period_summaries(n_resamples=n_resamples, ci_periods=('Y',))
+    bar_periods = stats.bar_period_summaries()
+    return {'daily_returns': stats.daily_returns(),
+            'summary_stats': stats.summary_stats(n_resamples=n_resamples),
+            'monthly_summaries': periods['M'],
+            'quarterly_summaries': periods['Q'],
+            'yearly_summaries': periods['Y'],
+            'bar_summary_stats': stats.bar_summary_stats(),
+            'bar_monthly_summaries': bar_periods['M'],
+            'bar_quarterly_summaries': bar_periods['Q'],
+            'bar_yearly_summaries': bar_periods['Y']}
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the contrarian strategy on intraday bars.')
+    parser.add_argument('tickers', help='Path of a file of tickers separated by commas, spaces, or new lines.')
+    parser.add_argument('--bars', default=os.environ.get('INTRADAY_BAR_DIR', 'bars'),
+                        help='Directory of the <TICKER>.parquet bar files (default: %(default)s).')
+    parser.add_argument('--bars-per-year', type=float, required=True,
+                        help='Bars per year (ie. 98280 for 1 minute or 19656 for 5 minute bars of 6.5 hour sessions).')
+    parser.add_argument('--trading-days', type=float, default=252, help='Trading days per year (default: 252).')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help='Bar times worked on at once (default: %(default)s).')
+    parser.add_argument('--output', default='.', help='Directory to write the tables to (default: %(default)s).')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='parquet',
+                        help='Format of the tables written (default: %(default)s).')
+    parser.add_argument('--bar-returns', action='store_true',
+                        help='Also write the weights and strategy return of every bar, as they are computed.')
+    parser.add_argument('--resamples', type=int, default=0,
+                        help='Bootstrap resamples for confidence intervals of the summary statistics (default: none).')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    bar_returns_path = os.path.join(args.output, 'bar_returns' + FORMATS[args.format]) if args.bar_returns else None
+    try:
+        tables = run(read_tickers(args.tickers), args.bars, args.bars_per_year, args.trading_days,
+                     chunk_rows=args.chunk_rows, bar_returns_path=bar_returns_path, fmt=args.format,
+                     n_resamples=args.resamples)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    if bar_returns_path is not None:
+        print(bar_returns_path)
+    for name, df in tables.items():
+        path = os.path.join(args.output, name + FORMATS[args.format])
+        write_table(df, path, args.format)
+        print(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+'''
+Daniel McNulty II
+
+Module imported once by each web worker's job fork server (See jobs.JobQueue), before it starts any job process. It
+imports the app, and if PRELOAD_APP is set (See gunicorn.conf.py), loads the whole price store into memory (See
+app.preload), so every job process the fork server starts shares the app and the preloaded prices copy-on-write
+rather than importing the app again and reading its prices from disk. The prices are mapped from the snapshot of the
+store the gunicorn master wrote before forking the workers (named by PRICE_STORE_SNAPSHOT), so the fork servers of
+every worker share one copy of them, or are read from the store if there is no snapshot, with each fork server then
+holding its own copy.
+'''
+
+# Import necessary libraries and functions.
+import os
+import app
+
+if os.environ.get('PRELOAD_APP', '0') not in ('', '0'):
+    app.preload(os.environ.get('PRICE_STORE_SNAPSHOT') or None)
@@ -0,0 +1,237 @@
+'''
+Daniel McNulty II
+
+Background job queue for long strategy runs in the contrarian strategy tester.
+'''
+
+# Import necessary libraries and functions.
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+# The states a job can end in.
+FINISHED = ('done', 'failed', 'cancelled')
+
+# Exception raised inside a running job once it has been cancelled.
+class JobCancelled(Exception):
+    pass
+
+# Queue of jobs run in the background on a pool of processes (processes of them, by default one per CPU). The state of
+# every job is kept in a local SQLite database, so since every gunicorn worker opens the same database file, a job
+# submitted through one worker can be polled and cancelled through any other. Each web worker starts its own pool the
+# first time it submits a job, and only ever submits jobs and reads their state, so it stays free to serve other
+# requests while the jobs run. Finished jobs are removed keep seconds after they finish.
+#
+# A queued job only ever runs in the pool of the worker that submitted it, so a queued job whose submitting worker has
+# gone (ie. it was restarted) will never run, and is reported as failed. So is any job still queued max_queued seconds
+# after it was submitted, in case the worker's pool has stopped taking jobs. A job failed this way is not run even if
+# it does reach a pool process later.
+#
+# The pool's processes are started by a fork server where there is one, rather than forked from the web worker itself.
+# A threaded web worker (ie. gunicorn's gthread workers) may be in the middle of a SQLite call or holding another lock
+# in one thread while another thread starts a pool process, and a forked copy of that lock is never released, leaving
+# the job hung or failing with SQLite errors. Since pool processes then import the job's module afresh, fn must not
+# rely on state set up at runtime in the web worker. Modules named in preload (ie. the job's module) are imported once
+# by the fork server instead, and every pool process it starts shares them, along with anything they load when
+# imported, copy-on-write rather than importing them again.
+class JobQueue:
+    def __init__(self, path, processes=None, keep=24 * 3600, preload=(), max_queued=3600):
+        self.path = path
+        self.processes = processes
+        self.keep = keep
+        self.max_queued = max_queued
+        self.preload = list(preload)
+        self._pool = None
+        self._pool_pid = None
+        self._futures = {}
+        with _connect(path) as con:
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, stage TEXT, done INTEGER, '
+                        'total INTEGER, error TEXT, result BLOB, cancel INTEGER, pid INTEGER, submitter INTEGER, '
+                        'created REAL, updated REAL)')
+            # Databases created before the submitter column was added are given it.
+            try:
+                con.execute('ALTER TABLE jobs ADD COLUMN submitter INTEGER')
+            except sqlite3.OperationalError:
+                pass
+
+    # Function that returns this process's pool, starting a new one if there is none yet, the last one broke, or the
+    # queue was created before the process was forked from its parent (ie. by gunicorn's --preload).
+    def _executor(self):
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ProcessPoolExecutor(self.processes, mp_context=_pool_context(self.preload))
+            self._pool_pid = os.getpid()
+            self._futures = {}
+        return self._pool
+
+    # Function that starts the fork server this process's pool processes are started from, if there is one, so the
+    # modules in preload are imported now (ie. while a web worker boots) rather than when the first job is submitted. A
+    # fork server cannot be shared with forked children, so this must be called in each worker, after it is forked.
+    def start(self):
+        if _pool_context(self.preload).get_start_method() == 'forkserver':
+            from multiprocessing import forkserver
+            forkserver.ensure_running()
+
+    # Function that shuts down this process's pool, if it has one, so its processes exit rather than outliving the
+    # process (ie. a web worker exiting). Jobs still queued are cancelled, and running jobs are not waited for.
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+    # Function that queues fn to be run as fn(progress, *args) in the pool and returns the new job's id. fn and args
+    # must be picklable (ie. fn is a module level function). fn reports its progress and checks for cancellation through
+    # progress (See JobProgress), and its return value is kept as the job's result.
+    def submit(self, fn, *args):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with _connect(self.path) as con:
+            con.execute('DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated <= ?', FINISHED + (now - self.keep,))
+            con.execute("INSERT INTO jobs (id, status, stage, done, total, cancel, submitter, created, updated) "
+                        "VALUES (?, 'queued', 'queued', 0, 0, 0, ?, ?, ?)", (job_id, os.getpid(), now, now))
+        future = self._executor().submit(_run_job, self.path, job_id, fn, args)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._job_exited(job_id, f))
+        return job_id
+
+    # Function that marks a job failed if its process exited without finishing it (ie. it was killed), and starts a new
+    # pool for later jobs, since the pool breaks when one of its processes dies.
+    def _job_exited(self, job_id, future):
+        self._futures.pop(job_id, None)
+        if future.cancelled() or future.exception() is None:
+            return
+        _update(self.path, job_id, status='failed', error=str(future.exception()) or type(future.exception()).__name__)
+        self._pool = None
+
+    # Function that returns a dictionary of a job's id, status ('queued', 'running', 'done', 'failed', or
+    # 'cancelled'), stage, progress through the stage (done of total), error message, result, and the times it was
+    # created and last updated, or None if there is no such job. A running job whose process has gone, or a queued job
+    # that will never run (See JobQueue), is reported as failed.
+    def status(self, job_id):
+        columns = ('id', 'status', 'stage', 'done', 'total', 'error', 'result', 'pid', 'submitter', 'created',
+                   'updated')
+        with _connect(self.path) as con:
+            row = con.execute('SELECT {} FROM jobs WHERE id = ?'.format(', '.join(columns)), (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(columns, row))
+        if job['status'] == 'running' and not _alive(job['pid']):
+            job.update(status='failed', error='ERROR - The job stopped unexpectedly. Please try again.')
+            _update(self.path, job_id, status=job['status'], error=job['error'])
+        elif job['status'] == 'queued' and (not _alive(job['submitter']) or
+                                            time.time() - job['created'] > self.max_queued):
+            # Only fail the job if it has not started in the meantime.
+            error = 'ERROR - The job was never started. Please try again.'
+            with _connect(self.path) as con:
+                failed = con.execute("UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ? AND "
+                                     "status = 'queued'", (error, time.time(), job_id)).rowcount
+            if failed:
+                job.update(status='failed', error=error)
+        job['result'] = None if job['result'] is None else pickle.loads(job['result'])
+        return job
+
+    # Function that cancels a job. A queued job is cancelled straight away, while a running job stops the next time it
+    # reports its progress (See JobProgress). Finished jobs are left as they are.
+    def cancel(self, job_id):
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        with _connect(self.path) as con:
+            con.execute('UPDATE jobs SET cancel = 1 WHERE id = ?', (job_id,))
+            con.execute("UPDATE jobs SET status = 'cancelled', updated = ? WHERE id = ? AND status = 'queued'",
+                        (time.time(), job_id))
+
+# Progress reporter handed to a running job. The job calls stage when it moves on to a new stage and update as it works
+# through one (ie. with the number of tickers collected so far). Both raise JobCancelled if the job has been cancelled,
+# so the job stops at the next report. Updates are written at most once every interval seconds, except for the last
+# update of a stage.
+class JobProgress:
+    def __init__(self, path, job_id, interval=0.25):
+        self.path = path
+        self.job_id = job_id
+        self.interval = interval
+        self.stage_name = None
+        self.total = 0
+        self._written = 0.0
+
+    def stage(self, stage, done=0, total=0):
+        self.stage_name = stage
+        self.total = total
+        self._write(done, total)
+
+    def update(self, done, total=None):
+        if total is not None:
+            self.total = total
+        if done < self.total and time.monotonic() - self._written < self.interval:
+            return
+        self._write(done, self.total)
+
+    def _write(self, done, total):
+        self._written = time.monotonic()
+        with _connect(self.path) as con:
+            con.execute('UPDATE jobs SET stage = ?, done = ?, total = ?, updated = ? WHERE id = ?',
+                        (self.stage_name, done, total, time.time(), self.job_id))
+            cancelled = con.execute('SELECT cancel FROM jobs WHERE id = ?', (self.job_id,)).fetchone()[0]
+        if cancelled:
+            raise JobCancelled()
+
+# Function that runs a job in a pool process and records how it ended. Jobs cancelled or failed while queued are not
+# run.
+def _run_job(path, job_id, fn, args):
+    with _connect(path) as con:
+        if not con.execute("UPDATE jobs SET status = 'running', pid = ?, updated = ? WHERE id = ? AND "
+                           "status = 'queued' AND cancel = 0", (os.getpid(), time.time(), job_id)).rowcount:
+            return
+    try:
+        result = fn(JobProgress(path, job_id), *args)
+    except JobCancelled:
+        _update(path, job_id, status='cancelled')
+    except Exception as e:
+        _update(path, job_id, status='failed', error=str(e) or type(e).__name__)
+    else:
+        _update(path, job_id, status='done', stage='done',
+                result=sqlite3.Binary(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)))
+
+# Function that returns the multiprocessing context pool processes are started with: the fork server, importing the
+# modules in preload, where the platform has one (See JobQueue), otherwise the platform's default.
+def _pool_context(preload=()):
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        if preload:
+            context.set_forkserver_preload(list(preload))
+        return context
+    return multiprocessing.get_context()
+
+# Function that sets the input columns of a job's row, along with the time it was updated.
+def _update(path, job_id, **columns):
+    with _connect(path) as con:
+        con.execute('UPDATE jobs SET {}, updated = ? WHERE id = ?'.format(', '.join(c + ' = ?' for c in columns)),
+                    tuple(columns.values()) + (time.time(), job_id))
+
+# Function that returns whether the process with id pid is still running.
+def _alive(pid):
+    if pid is None:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# A new connection is opened for every operation, so the queue is safe to use from forked worker processes and from
+# multiple threads. Each operation runs in its own transaction.
+@contextmanager
+def _connect(path):
+    con = sqlite3.connect(path, timeout=30)
+    try:
+        with con:
+            yield con
+    finally:
+        con.close()
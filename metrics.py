@@ -0,0 +1,181 @@
+'''
+Daniel McNulty II
+
+Per-stage timing, payload size metrics, and request profiling for the contrarian strategy tester.
+'''
+
+# Import necessary libraries and functions.
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the stage timing histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Metrics collected by this process. Each gunicorn worker keeps its own, so every worker's /metrics should be scraped.
+_lock = threading.Lock()
+_stage_seconds = {}
+_payload_bytes = {}
+_collected = threading.local()
+
+# Function that records that the stage name took seconds seconds. The time is added to the stage's histogram and, when
+# called while handling a request, to the timings reported in that request's Server-Timing header.
+def record_time(name, seconds):
+    with _lock:
+        hist = _stage_seconds.setdefault(name, [0] * len(BUCKETS) + [0, 0.0])
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+        hist[-2] += 1
+        hist[-1] += seconds
+    timings = _request_timings()
+    if timings is not None:
+        timings.append((name, seconds))
+
+# Function that records a payload of size n_bytes for name (ie. the response of a callback output).
+def record_bytes(name, n_bytes):
+    with _lock:
+        sizes = _payload_bytes.setdefault(name, [0, 0])
+        sizes[0] += 1
+        sizes[1] += n_bytes
+
+# Context manager that times the code run inside it as the stage name.
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(name, time.perf_counter() - start)
+
+# Context manager that collects the timings recorded inside it (ie. by a background job, outside of any request) into
+# the list it yields, as (name, seconds) pairs.
+@contextmanager
+def collect():
+    _collected.timings = []
+    try:
+        yield _collected.timings
+    finally:
+        _collected.timings = None
+
+# Function that returns the list the current timings are collected into (See collect), or the timings list of the
+# request being handled, or None outside of both.
+def _request_timings():
+    timings = getattr(_collected, 'timings', None)
+    if timings is not None:
+        return timings
+    flask = sys.modules.get('flask')
+    if flask is None or not flask.has_request_context():
+        return None
+    return flask.g.setdefault('stage_timings', [])
+
+# Function that returns every metric collected by this process in the Prometheus text exposition format.
+def prometheus_text():
+    lines = ['# HELP contrarian_stage_seconds Time spent in each stage of a strategy run.',
+             '# TYPE contrarian_stage_seconds histogram']
+    with _lock:
+        for name, hist in sorted(_stage_seconds.items()):
+            for bound, count in zip(BUCKETS, hist):
+                lines.append('contrarian_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(name, bound, count))
+            lines.append('contrarian_stage_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(name, hist[-2]))
+            lines.append('contrarian_stage_seconds_sum{{stage="{}"}} {}'.format(name, hist[-1]))
+            lines.append('contrarian_stage_seconds_count{{stage="{}"}} {}'.format(name, hist[-2]))
+        lines += ['# HELP contrarian_payload_bytes Size of the payloads sent to the browser.',
+                  '# TYPE contrarian_payload_bytes summary']
+        for name, (count, total) in sorted(_payload_bytes.items()):
+            lines.append('contrarian_payload_bytes_sum{{output="{}"}} {}'.format(name, total))
+            lines.append('contrarian_payload_bytes_count{{output="{}"}} {}'.format(name, count))
+    return '\n'.join(lines) + '\n'
+
+# Sampling profiler for one thread. While running, a background thread records the call stack of the profiled thread
+# every interval seconds. The stacks are saved in the collapsed format (one 'outer;inner;... count' line per distinct
+# stack) read by flame graph tools such as flamegraph.pl and speedscope.
+class SamplingProfiler:
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    # Function that saves the sampled stacks to path in the collapsed format.
+    def save(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('{} {}\n'.format(stack, count))
+
+# Function that returns the size in bytes of each output ('id.property') in a Dash callback response body.
+def _output_sizes(body):
+    try:
+        response = json.loads(body).get('response', {})
+    except ValueError:
+        return {}
+    return {'{}.{}'.format(component_id, prop): len(json.dumps(value, separators=(',', ':')))
+            for component_id, props in response.items() for prop, value in props.items()}
+
+# Function that adds metrics to a Flask server (ie. a Dash app's server):
+#       - A /metrics route serving every metric collected by the process in the Prometheus text format.
+#       - A Server-Timing header on every response, listing the time spent in each stage while handling the request,
+#         plus the total.
+#       - The size of every Dash callback response, recorded by callback output.
+#       - If PROFILE_REQUESTS is set, any request with an X-Profile header is run under a SamplingProfiler and its
+#         profile saved to PROFILE_DIR. The response's X-Profile-File header holds the path of the saved profile.
+def init_app(server):
+    from flask import Response, g, request
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+    @server.before_request
+    def start_request():
+        g.request_start = time.perf_counter()
+        g.stage_timings = []
+        if os.environ.get('PROFILE_REQUESTS') and request.headers.get('X-Profile'):
+            g.profiler = SamplingProfiler().start()
+
+    @server.after_request
+    def finish_request(response):
+        total = time.perf_counter() - g.get('request_start', time.perf_counter())
+        timings = g.get('stage_timings', []) + [('total', total)]
+        response.headers['Server-Timing'] = ', '.join('{};dur={:.1f}'.format(name, seconds * 1000)
+                                                      for name, seconds in timings)
+
+        # Record the size of each output in Dash callback responses.
+        if request.path.endswith('_dash-update-component') and response.mimetype == 'application/json':
+            record_time('callback', total)
+            for output, n_bytes in _output_sizes(response.get_data()).items():
+                record_bytes(output, n_bytes)
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop()
+            profile_dir = os.environ.get('PROFILE_DIR', 'profiles')
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, 'profile-{}-{}.txt'.format(int(time.time() * 1000), os.getpid()))
+            profiler.save(path)
+            response.headers['X-Profile-File'] = path
+        return response
@@ -0,0 +1,144 @@
+'''
+Daniel McNulty II
+
+Compact, optionally memory-mapped daily returns panel for very large ticker universes.
+'''
+
+# Import necessary libraries and functions.
+import json
+import os
+import numpy as np
+import pandas as pd
+from price_store import YahooSource, fetch_histories
+
+# Daily returns held as one contiguous dates x tickers array (values), with a date index (dates) and a ticker index
+# (tickers). The values can be float32 to halve memory use, and can be backed by a memory-mapped file on disk so only
+# the parts in use are held in memory. Slicing by date returns a view of the same values without copying them.
+class ReturnsPanel:
+    def __init__(self, values, dates, tickers):
+        self.values = values
+        self.dates = pd.DatetimeIndex(dates, name='Date')
+        self.tickers = list(tickers)
+        self._ticker_pos = {t: i for i, t in enumerate(self.tickers)}
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __len__(self):
+        return len(self.dates)
+
+    # Function that creates a panel from a DataFrame of daily returns (Dates x tickers), such as one made by
+    # daily_return.
+    @classmethod
+    def from_frame(cls, daily_ret, dtype=np.float64):
+        return cls(np.ascontiguousarray(daily_ret.to_numpy(dtype=dtype)), daily_ret.index, daily_ret.columns)
+
+    # Function that creates an empty panel to be filled in, backed by a memory-mapped file in the directory path if
+    # one is given.
+    @classmethod
+    def empty(cls, dates, tickers, dtype=np.float64, path=None):
+        shape = (len(dates), len(tickers))
+        if path is None:
+            return cls(np.full(shape, np.nan, dtype=dtype), dates, tickers)
+        os.makedirs(path, exist_ok=True)
+        values = np.lib.format.open_memmap(os.path.join(path, 'values.npy'), mode='w+', dtype=dtype, shape=shape)
+        values[:] = np.nan
+        panel = cls(values, dates, tickers)
+        panel._save_index(path)
+        return panel
+
+    # Function that saves the panel to the directory path, as a .npy file of values along with its date and ticker
+    # indexes.
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'values.npy'), self.values)
+        self._save_index(path)
+
+    def _save_index(self, path):
+        np.save(os.path.join(path, 'dates.npy'), self.dates.values.astype('datetime64[ns]'))
+        with open(os.path.join(path, 'tickers.json'), 'w') as f:
+            json.dump(self.tickers, f)
+
+    # Function that opens a panel saved with save. By default its values are memory-mapped read only rather than read
+    # into memory.
+    @classmethod
+    def open(cls, path, mmap_mode='r'):
+        values = np.load(os.path.join(path, 'values.npy'), mmap_mode=mmap_mode)
+        dates = np.load(os.path.join(path, 'dates.npy'))
+        with open(os.path.join(path, 'tickers.json')) as f:
+            tickers = json.load(f)
+        return cls(values, dates, tickers)
+
+    # Function that returns the panel of dates from start_date (inclusive) to end_date (exclusive). The returned panel's
+    # values are a view of this panel's values.
+    def slice_dates(self, start_date=None, end_date=None):
+        start = 0 if start_date is None else self.dates.searchsorted(pd.Timestamp(start_date))
+        end = len(self.dates) if end_date is None else self.dates.searchsorted(pd.Timestamp(end_date))
+        return ReturnsPanel(self.values[start:end], self.dates[start:end], self.tickers)
+
+    # Function that returns the panel of the input tickers only. Selecting tickers copies their values.
+    def select(self, tickers):
+        return ReturnsPanel(self.values[:, [self._ticker_pos[t] for t in tickers]], self.dates, tickers)
+
+    # Function that returns the panel as a DataFrame of daily returns, like one made by daily_return.
+    def to_frame(self):
+        return pd.DataFrame(np.asarray(self.values), index=self.dates, columns=self.tickers)
+
+# Function that collects the closing prices for each ticker from start_date to end_date from a price source, like
+# daily_return, but writes the daily returns straight into a ReturnsPanel one ticker at a time instead of building a
+# DataFrame of all the closing prices and transposing it. The panel holds values of type dtype and, if path is given,
+# is backed by a memory-mapped file in that directory.
+def daily_return_panel(tickers, start_date, end_date, source=None, dtype=np.float32, path=None, max_workers=8):
+    if source is None:
+        source = YahooSource()
+    histories = fetch_histories(source, tickers, start_date, end_date, max_workers=max_workers)
+
+    # The panel covers every date any ticker has a closing price for, less the first, which has no return.
+    dates = pd.DatetimeIndex(sorted(set().union(*(h.index for h in histories.values()))), name='Date')
+    panel = ReturnsPanel.empty(dates[1:], tickers, dtype=dtype, path=path)
+    for i, t in enumerate(tickers):
+        # Carry prices forward over gaps, but not past the ticker's last closing price, as daily_return does.
+        close = histories[t].reindex(dates)
+        close = close.ffill().where(close.bfill().notna()).to_numpy(dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            panel.values[:, i] = close[1:] / close[:-1] - 1
+    return panel
+
+# Function that runs the contrarian strategy (See core.contrarian_portfolio_ret) over a ReturnsPanel, chunk_rows
+# dates at a time. Only one chunk of the panel is converted to float64 and worked on at once, so the memory used beyond
+# the panel and the results does not depend on the number of dates. Returns a DataFrame with the Date, Collateral
+# Needed, and Strategy Daily Return for each date after the first. If weights_out is given (an array, or memory-mapped
+# array, of shape (len(panel) - 1, number of tickers)), each date's weights are written into it as well.
+def contrarian_panel_ret(panel, chunk_rows=4096, weights_out=None):
+    n_dates, n_tickers = panel.shape
+    collateral = np.empty(max(n_dates - 1, 0))
+    strat_ret = np.empty(max(n_dates - 1, 0))
+
+    # Each chunk covers the returns of dates start + 1 to stop, plus the returns of the date before them, which set the
+    # first date's weights.
+    for start in range(0, max(n_dates - 1, 0), chunk_rows):
+        stop = min(start + chunk_rows, n_dates - 1)
+        ret = np.asarray(panel.values[start:stop + 1], dtype=np.float64)
+
+        # Excess returns over each date's average return, and from them the next date's weights.
+        valid = ~np.isnan(ret[:-1])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            row_mean = np.where(valid, ret[:-1], 0.0).sum(axis=1) / valid.sum(axis=1)
+        weights = ret[:-1] - row_mean[:, None]
+        weights *= -1.0 / n_tickers
+
+        # The collateral and strategy return for each date, with a return of 0 on dates needing no collateral.
+        chunk_collateral = np.abs(weights).sum(axis=1) / 2
+        no_collateral = chunk_collateral == 0.0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            chunk_ret = np.einsum('ij,ij->i', ret[1:], weights) / np.where(no_collateral, 1.0, chunk_collateral)
+        chunk_ret[no_collateral] = 0.0
+
+        collateral[start:stop] = chunk_collateral
+        strat_ret[start:stop] = chunk_ret
+        if weights_out is not None:
+            weights_out[start:stop] = weights
+
+    return pd.DataFrame({'Date': panel.dates[1:].date, 'Collateral Needed': collateral,
+                         'Strategy Daily Return': strat_ret})
@@ -0,0 +1,341 @@
+'''
+Daniel McNulty II
+
+Price sources, the on-disk price store, and concurrent price fetching used by the contrarian strategy tester.
+'''
+
+# Import necessary libraries and functions.
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import pandas as pd
+
+# Base class for anything that can provide historical closing prices. A source returns a Series of closing prices for
+# one ticker indexed by Date, covering the dates from start (inclusive) to end (exclusive), the same way Yahoo Finance
+# does.
+class PriceSource:
+    def history(self, ticker, start, end):
+        raise NotImplementedError
+
+# Source that collects closing prices from Yahoo Finance.
+class YahooSource(PriceSource):
+    def history(self, ticker, start, end):
+        import yfinance as yf
+        return _clean_close(yf.Ticker(ticker).history(start=start, end=end)['Close'])
+
+    # Collect the closing prices for several tickers with one bulk Yahoo Finance request. Tickers Yahoo Finance returns
+    # no data for are left out of the result, so they can be retried one at a time.
+    def histories(self, tickers, start, end):
+        import yfinance as yf
+        close = yf.download(list(tickers), start=start, end=end, auto_adjust=True, progress=False,
+                            threads=False)['Close']
+        if isinstance(close, pd.Series):
+            close = close.to_frame(tickers[0])
+        return {t: _clean_close(close[t].dropna()) for t in tickers if t in close and close[t].notna().any()}
+
+# Source that reads closing prices from a directory of local CSV files, one per ticker (ie. AAPL.csv), each with a Date
+# and a Close column. Used as an offline stand-in for Yahoo Finance.
+class CSVSource(PriceSource):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def history(self, ticker, start, end):
+        path = os.path.join(self.directory, '{}.csv'.format(ticker))
+        if not os.path.exists(path):
+            return pd.Series(dtype=float, name='Close', index=pd.DatetimeIndex([], name='Date'))
+        close = pd.read_csv(path, parse_dates=['Date'], index_col='Date')['Close']
+        close = _clean_close(close)
+        return close[(close.index >= pd.Timestamp(start)) & (close.index < pd.Timestamp(end))]
+
+# Source that wraps another source and adds an artificial delay to every request. Used to stand in for network latency
+# when measuring fetch performance offline.
+class DelayedSource(PriceSource):
+    def __init__(self, source, delay):
+        self.source = source
+        self.delay = delay
+
+    def history(self, ticker, start, end):
+        time.sleep(self.delay)
+        return self.source.history(ticker, start, end)
+
+# Local columnar price store. Keeps one Parquet file of closing prices per ticker along with a record of the date ranges
+# already collected for that ticker. Requests are served from disk, and only the gaps not already held are collected
+# from the underlying source. A PriceStore is itself a PriceSource, so it can be passed anywhere a source is expected.
+#
+# The whole store can also be preloaded into memory (See preload), as two read-only arrays holding every ticker's dates
+# and closing prices back to back. Preloaded in a process before it forks others (ie. a job fork server, See
+# job_preload.py), the arrays are shared by every forked process copy-on-write, since nothing ever writes to them.
+# Several processes preloading the store on their own (ie. the job fork servers of several web workers) would each hold
+# their own copy, so the arrays can instead be written once to a snapshot on disk (See snapshot) which each process
+# maps read-only (See preload), sharing one copy in the page cache. Requests covered by the preloaded prices are served
+# from memory, and any others from disk as usual. Prices collected after preloading are written to disk only, so a
+# forked process never changes the shared arrays.
+class PriceStore(PriceSource):
+    def __init__(self, directory, source=None):
+        self.directory = directory
+        self.source = source if source is not None else YahooSource()
+        self._preloaded = None
+        os.makedirs(directory, exist_ok=True)
+
+    def history(self, ticker, start, end):
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        close, ranges = self._read(ticker, start, end)
+
+        # Collect each missing gap from the source and merge it into the stored prices. Ranges reaching today or later
+        # are only recorded up to the start of today, since today's close may not be final yet.
+        gaps = _missing_ranges(ranges, start, end)
+        if gaps:
+            today = pd.Timestamp.today().normalize()
+            for gap_start, gap_end in gaps:
+                fetched = _clean_close(self.source.history(ticker, gap_start, gap_end))
+                close = fetched if close.empty else close.combine_first(fetched)
+                if min(gap_end, today) > gap_start:
+                    ranges.append((gap_start, min(gap_end, today)))
+            self._write(ticker, close, _merge_ranges(ranges))
+
+        return close[(close.index >= start) & (close.index < end)]
+
+    # Function that returns the merged date ranges already held for a ticker.
+    def ranges(self, ticker):
+        return self._read_file(ticker)[1]
+
+    def _paths(self, ticker):
+        base = os.path.join(self.directory, ticker.replace('/', '_'))
+        return base + '.parquet', base + '.ranges.json'
+
+    # Function that loads every ticker held on disk into memory (See PriceStore), replacing anything preloaded before.
+    # If snapshot is the directory of a snapshot of the store (See snapshot), its arrays are mapped read-only rather
+    # than read from the store, so every process preloading the same snapshot shares one copy of them. Returns the
+    # number of tickers and the number of bytes of prices and dates loaded.
+    def preload(self, snapshot=None):
+        if snapshot is None:
+            dates, values, index = self._read_all()
+            dates.flags.writeable = False
+            values.flags.writeable = False
+        else:
+            dates = np.asarray(np.load(os.path.join(snapshot, 'dates.npy'), mmap_mode='r'))
+            values = np.asarray(np.load(os.path.join(snapshot, 'values.npy'), mmap_mode='r'))
+            with open(os.path.join(snapshot, 'index.json')) as f:
+                index = {name: (first, stop, [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in ranges])
+                         for name, (first, stop, ranges) in json.load(f).items()}
+        self._preloaded = (dates, values, index)
+        return len(index), dates.nbytes + values.nbytes
+
+    # Function that writes every ticker held on disk, as preload would load it, to a snapshot in a new directory within
+    # the store: every ticker's dates and closing prices back to back in dates.npy and values.npy, and where each
+    # ticker's prices start and stop and the date ranges held for it in index.json. The snapshot is not updated as the
+    # store changes, and is removed by whoever made it. Returns the snapshot's directory, the number of tickers, and the
+    # number of bytes of prices and dates written.
+    def snapshot(self):
+        dates, values, index = self._read_all()
+        directory = tempfile.mkdtemp(prefix='.snapshot-', dir=self.directory)
+        np.save(os.path.join(directory, 'dates.npy'), dates)
+        np.save(os.path.join(directory, 'values.npy'), values)
+        with open(os.path.join(directory, 'index.json'), 'w') as f:
+            json.dump({name: [first, stop, [[str(s.date()), str(e.date())] for s, e in ranges]]
+                       for name, (first, stop, ranges) in index.items()}, f)
+        return directory, len(index), dates.nbytes + values.nbytes
+
+    # Function that reads every ticker held on disk, returning their dates and closing prices back to back in two
+    # arrays, and a dictionary of where each ticker's prices start and stop in them and the date ranges held for it.
+    def _read_all(self):
+        names = sorted(f[:-len('.ranges.json')] for f in os.listdir(self.directory) if f.endswith('.ranges.json'))
+        held = [(name, self._read_file(name)) for name in names]
+        held = [(name, close, ranges) for name, (close, ranges) in held if ranges]
+        dates = np.concatenate([close.index.values.astype('datetime64[ns]') for _, close, _ in held] or
+                               [np.empty(0, dtype='datetime64[ns]')])
+        values = np.concatenate([close.to_numpy(dtype=float) for _, close, _ in held] or [np.empty(0)])
+        stops = np.cumsum([len(close) for _, close, _ in held], dtype=int)
+        index = {name: (int(stop - len(close)), int(stop), ranges) for (name, close, ranges), stop in zip(held, stops)}
+        return dates, values, index
+
+    # Function that returns a ticker's closing prices and the merged date ranges held for it, from the preloaded prices
+    # if they cover the dates from start to end, otherwise from disk.
+    def _read(self, ticker, start, end):
+        if self._preloaded is not None:
+            dates, values, index = self._preloaded
+            held = index.get(ticker.replace('/', '_'))
+            if held is not None and not _missing_ranges(held[2], start, end):
+                first, stop, ranges = held
+                close = pd.Series(values[first:stop], name='Close',
+                                  index=pd.DatetimeIndex(dates[first:stop], name='Date'))
+                return close, list(ranges)
+        return self._read_file(ticker)
+
+    # Function that reads a ticker's closing prices and merged date ranges from disk.
+    def _read_file(self, ticker):
+        price_path, range_path = self._paths(ticker)
+        if not (os.path.exists(price_path) and os.path.exists(range_path)):
+            return pd.Series(dtype=float, name='Close', index=pd.DatetimeIndex([], name='Date')), []
+        close = pd.read_parquet(price_path)['Close']
+        with open(range_path) as f:
+            ranges = [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in json.load(f)]
+        return close, ranges
+
+    # Write the prices and ranges to temporary files first and then move them into place, so that another process
+    # reading the store never sees a partially written file. Each write gets its own temporary file names, since two
+    # threads of one process may write the same ticker at once (ie. a timed out fetch still running alongside its
+    # retry).
+    def _write(self, ticker, close, ranges):
+        price_path, range_path = self._paths(ticker)
+        tag = '.{}.tmp'.format(uuid.uuid4().hex)
+        close.sort_index().to_frame('Close').to_parquet(price_path + tag)
+        with open(range_path + tag, 'w') as f:
+            json.dump([[str(s.date()), str(e.date())] for s, e in ranges], f)
+        os.replace(price_path + tag, price_path)
+        os.replace(range_path + tag, range_path)
+
+# Exception raised when prices could not be collected for some tickers. Holds the error message for each failed ticker
+# in failed, the prices that were collected for the other tickers in results, and the error message of the bulk request
+# made first (See fetch_histories) in bulk_error, if it failed.
+class FetchError(Exception):
+    def __init__(self, failed, results, bulk_error=None):
+        self.failed = failed
+        self.results = results
+        self.bulk_error = bulk_error
+        super().__init__('ERROR - Could not collect prices for the following tickers: ' +
+                         ', '.join('{} ({})'.format(t, msg) for t, msg in failed.items()) + '.' +
+                         ('' if bulk_error is None else ' The bulk request failed too ({}).'.format(bulk_error)))
+
+# Function that collects the closing prices for each ticker in tickers from a source, several tickers at a time. If the
+# source supports bulk requests (has a histories method), all tickers are first requested at once and only those
+# missing from the bulk result are requested individually. Requests run on a pool of max_workers threads. The bulk
+# request is given timeout seconds, while an individual request that fails or runs longer than timeout seconds is
+# retried up to retries more times, waiting backoff, 2 * backoff, 4 * backoff, ... seconds between attempts. Tickers
+# not collected within deadline seconds in all fail, so a source that stops answering cannot hold up the caller
+# indefinitely. By default the deadline is the longest the requests could take if every attempt ran for its full
+# timeout. If progress is given, it is called with the number of tickers collected so far and the total number of
+# tickers each time more are collected. Returns a dictionary of ticker to closing prices, or raises a FetchError naming
+# every ticker that could not be collected.
+def fetch_histories(source, tickers, start, end, max_workers=8, timeout=30.0, retries=2, backoff=0.5, progress=None,
+                    deadline=None):
+    results = {}
+    unique = list(dict.fromkeys(tickers))
+    n_tickers = len(unique)
+    bulk = hasattr(source, 'histories') and n_tickers > 1
+    if deadline is None:
+        rounds = -(-n_tickers // max_workers)
+        deadline = (bulk + rounds * (retries + 1)) * timeout + sum(backoff * 2 ** n for n in range(retries))
+    stop = time.monotonic() + deadline
+
+    failed = {}
+    bulk_error = None
+    attempts = {t: 0 for t in unique}
+    started = {}
+    submitted = {}
+    # Each attempt records when it actually started running, so time spent queued for a thread does not count towards
+    # the timeout of a first attempt. A retry is timed from when it was submitted instead, since it may be queued behind
+    # threads still stuck on abandoned attempts that would otherwise keep it from ever starting.
+    def attempt(ticker, n):
+        started[(ticker, n)] = time.monotonic()
+        return source.history(ticker, start, end)
+
+    def submit(ticker):
+        submitted[(ticker, attempts[ticker])] = time.monotonic()
+        return pool.submit(attempt, ticker, attempts[ticker])
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        # Make the bulk request on the pool too, so it is held to the timeout and deadline like any other. If it fails
+        # or runs too long, its error is kept (See FetchError) and every ticker is requested individually.
+        if bulk:
+            future = pool.submit(source.histories, unique, start, end)
+            done, _ = wait([future], timeout=max(min(timeout, stop - time.monotonic()), 0.0))
+            if not done:
+                bulk_error = 'timed out after {:g}s'.format(timeout)
+            elif future.exception() is not None:
+                bulk_error = str(future.exception()) or type(future.exception()).__name__
+            else:
+                results.update(future.result())
+        if progress is not None:
+            progress(len(results), n_tickers)
+        todo = [t for t in unique if t not in results]
+        if not todo:
+            return results
+
+        running = {submit(t): t for t in todo}
+        waiting = []
+        while running or waiting:
+            # Give up on every ticker still outstanding once the deadline has passed.
+            now = time.monotonic()
+            if now > stop:
+                for t in list(running.values()) + [t for _, t in waiting]:
+                    failed[t] = 'gave up after {:g}s'.format(deadline)
+                break
+
+            # Resubmit any retries whose backoff has passed.
+            for ready_at, t in [w for w in waiting if w[0] <= now]:
+                waiting.remove((ready_at, t))
+                running[submit(t)] = t
+
+            done, _ = wait(list(running), timeout=0.05, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(running):
+                t = running[future]
+                key = (t, attempts[t])
+                begun = started.get(key, submitted[key] if attempts[t] else now)
+                if future in done:
+                    error = future.exception()
+                    if error is None:
+                        results[t] = future.result()
+                        del running[future]
+                        if progress is not None:
+                            progress(len(results), n_tickers)
+                        continue
+                    message = str(error) or type(error).__name__
+                elif now - begun > timeout:
+                    # Abandon attempts that ran past the timeout. The thread finishes in the background, but its result
+                    # is ignored.
+                    message = 'timed out after {:g}s'.format(timeout)
+                else:
+                    continue
+                del running[future]
+                if attempts[t] < retries:
+                    waiting.append((now + backoff * 2 ** attempts[t], t))
+                    attempts[t] += 1
+                else:
+                    failed[t] = message
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if failed:
+        raise FetchError(failed, results, bulk_error)
+    return results
+
+# Function that puts a Series of closing prices in the form the store expects: a timezone naive, day normalized, sorted
+# Date index without duplicates.
+def _clean_close(close):
+    close = close.astype(float).rename('Close')
+    index = pd.DatetimeIndex(close.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    close.index = index.normalize().rename('Date')
+    return close[~close.index.duplicated(keep='last')].sort_index()
+
+# Function that merges overlapping or touching (start, end) date ranges.
+def _merge_ranges(ranges):
+    merged = []
+    for s, e in sorted(ranges):
+        if merged and s <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return merged
+
+# Function that returns the parts of [start, end) not covered by the input ranges.
+def _missing_ranges(ranges, start, end):
+    gaps = []
+    cursor = start
+    for s, e in _merge_ranges(ranges):
+        if e <= cursor or s >= end:
+            continue
+        if s > cursor:
+            gaps.append((cursor, s))
+        cursor = max(cursor, e)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
@@ -0,0 +1,79 @@
+'''
+Daniel McNulty II
+
+Result cache shared by every worker process of the contrarian strategy tester.
+'''
+
+# Import necessary libraries and functions.
+import hashlib
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# Size bounded, least recently used cache of Python objects stored in a local SQLite database. Since every gunicorn
+# worker opens the same database file, a result cached by one worker can be served by all the others. Entries can be
+# given a time to live (ttl, in seconds), after which they are treated as missing. When the total size of the cached
+# entries goes over max_bytes, the least recently used entries are evicted.
+class ResultCache:
+    def __init__(self, path, max_bytes=512 * 1024 ** 2):
+        self.path = path
+        self.max_bytes = max_bytes
+        with self._connect() as con:
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, '
+                        'accessed REAL, expires REAL)')
+            con.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+
+    # A new connection is opened for every operation, so the cache is safe to use from forked worker processes and
+    # from multiple threads. Each operation runs in its own transaction.
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    # Function that returns the value cached under key, or default if there is no unexpired entry for it.
+    def get(self, key, default=None):
+        now = time.time()
+        with self._connect() as con:
+            row = con.execute('SELECT value, expires FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return default
+            if row[1] is not None and row[1] <= now:
+                con.execute('DELETE FROM entries WHERE key = ?', (key,))
+                return default
+            con.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(row[0])
+
+    # Function that caches value under key, optionally expiring after ttl seconds, then evicts the least recently used
+    # entries until the cache fits within max_bytes.
+    def set(self, key, value, ttl=None):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._connect() as con:
+            con.execute('REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                        (key, sqlite3.Binary(blob), len(blob), now, None if ttl is None else now + ttl))
+            con.execute('DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?', (now,))
+            total = con.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total > self.max_bytes:
+                evicted = 0
+                for old_key, size in con.execute('SELECT key, size FROM entries WHERE key != ? ORDER BY accessed',
+                                                 (key,)).fetchall():
+                    if total - evicted <= self.max_bytes:
+                        break
+                    con.execute('DELETE FROM entries WHERE key = ?', (old_key,))
+                    evicted += size
+
+    # Function that removes every entry from the cache.
+    def clear(self):
+        with self._connect() as con:
+            con.execute('DELETE FROM entries')
+
+# Function that builds a cache key from a name and any number of values, which must have stable string forms (ie.
+# strings, numbers, dates, and tuples of them).
+def cache_key(name, *values):
+    return name + ':' + hashlib.sha1(repr(values).encode()).hexdigest()
@@ -0,0 +1,110 @@
+'''
+Daniel McNulty II
+
+Parameter sweeps of the contrarian strategy over many ticker universes, date windows, and trading days per year.
+'''
+
+# Import necessary libraries and functions.
+import itertools
+import os
+from multiprocessing import Pool, shared_memory
+import numpy as np
+import pandas as pd
+from core import daily_return, contrarian_portfolio_ret, summary_stats
+
+# Function that builds a list of sweep configurations from every combination of the input ticker sets, (start date,
+# end date) windows, and trading days per year values.
+def config_grid(ticker_sets, windows, trading_days=(252,)):
+    return [{'tickers': list(t), 'start_date': s, 'end_date': e, 'trading_days': d}
+            for t, (s, e), d in itertools.product(ticker_sets, windows, trading_days)]
+
+# Function that returns rolling (start date, end date) windows of length window, moved forward by step, covering the
+# dates from start_date to end_date. window and step are pandas DateOffsets (ie. pd.DateOffset(years=2)).
+def rolling_windows(start_date, end_date, window, step):
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    windows = []
+    while start + window <= end:
+        windows.append((start.date(), (start + window).date()))
+        start = start + step
+    return windows
+
+# Function that runs the contrarian strategy and summary statistics for every configuration in configs and returns a
+# tidy DataFrame with one row per configuration. Each configuration is a dictionary with tickers, start_date, end_date,
+# and trading_days entries (See config_grid). The daily returns for every ticker over the full date range are loaded
+# once, either from the daily_ret input or with daily_return from source. The returns are placed in shared memory so
+# that the worker processes read them without each getting a pickled copy. If processes is 1, the sweep runs
+# in the current process.
+def sweep(configs, daily_ret=None, source=None, processes=None):
+    # Load the returns panel once, covering the union of all the configurations' tickers and dates.
+    if daily_ret is None:
+        tickers = list(dict.fromkeys(t for c in configs for t in c['tickers']))
+        start = min(pd.Timestamp(c['start_date']) for c in configs)
+        end = max(pd.Timestamp(c['end_date']) for c in configs)
+        daily_ret = daily_return(tickers, start, end, source=source)
+    values = np.ascontiguousarray(daily_ret.to_numpy(dtype=float))
+    dates = daily_ret.index.values
+    tickers = list(daily_ret.columns)
+
+    if processes == 1:
+        _attach_panel(values, dates, tickers)
+        rows = [_run_config(c) for c in configs]
+    else:
+        # Copy the returns panel into a shared memory block that every worker process attaches to.
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        try:
+            np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+            processes = processes or os.cpu_count() or 1
+            with Pool(processes, initializer=_attach_shared_panel,
+                      initargs=(shm.name, values.shape, values.dtype.str, dates, tickers)) as pool:
+                rows = pool.map(_run_config, configs, chunksize=max(1, len(configs) // (4 * processes)))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    return pd.DataFrame(rows)
+
+# The returns panel each process runs its configurations against, set by _attach_panel or _attach_shared_panel.
+_panel = {}
+
+def _attach_panel(values, dates, tickers):
+    _panel['values'] = values
+    _panel['dates'] = dates
+    _panel['tickers'] = {t: i for i, t in enumerate(tickers)}
+
+# Worker process initializer which attaches to the shared memory block holding the returns panel. The block is kept
+# open for the life of the worker.
+def _attach_shared_panel(name, shape, dtype, dates, tickers):
+    shm = shared_memory.SharedMemory(name=name)
+    _panel['shm'] = shm
+    _attach_panel(np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf), dates, tickers)
+
+# Function that runs the contrarian strategy and summary statistics for one sweep configuration against the attached
+# returns panel and returns the results as a dictionary. The panel covers the union of every configuration's tickers
+# and dates, so a ticker's returns can be missing within a configuration's window wherever the panel holds dates the
+# ticker has no closing prices for (ie. before it listed or after it delisted, on dates other tickers or windows brought
+# in). Any configuration with missing returns is run as a dynamic universe (See contrarian_portfolio_ret), so those
+# days are skipped for that ticker rather than making every statistic NaN.
+def _run_config(config):
+    # Each return is dated on the close it ends at, so the first return on or after the start date is computed from the
+    # close before the window. Like daily_return over the same window, the configuration starts from the return after
+    # its first closing price instead. The panel's own first return is kept, as its earlier close is not in the panel.
+    dates = _panel['dates']
+    first = np.searchsorted(dates, np.datetime64(pd.Timestamp(config['start_date'])))
+    rows = slice(first + 1 if first > 0 else first,
+                 np.searchsorted(dates, np.datetime64(pd.Timestamp(config['end_date']))))
+    cols = [_panel['tickers'][t] for t in config['tickers']]
+
+    row = {'Tickers': ','.join(config['tickers']),
+           'Start Date': pd.Timestamp(config['start_date']).date(),
+           'End Date': pd.Timestamp(config['end_date']).date(),
+           'Trading Days per Year': config['trading_days'],
+           'Days': max(rows.stop - rows.start, 0)}
+    if row['Days'] < 2:
+        return row
+
+    values = _panel['values'][rows][:, cols]
+    dr = pd.DataFrame(values, index=pd.DatetimeIndex(dates[rows], name='Date'), columns=config['tickers'])
+    stats = summary_stats(contrarian_portfolio_ret(dr, dynamic_universe=bool(np.isnan(values).any()))[2],
+                          config['trading_days'])
+    row.update(stats.iloc[0].to_dict())
+    return row
@@ -0,0 +1,84 @@
+'''
+Daniel McNulty II
+
+Seeded synthetic market data for testing and benchmarking the contrarian strategy tester without a network connection.
+'''
+
+# Import necessary libraries and functions.
+import zlib
+import numpy as np
+import pandas as pd
+from price_store import PriceSource
+
+# Function that generates a DataFrame of synthetic closing prices (Dates x tickers) for n_tickers tickers over n_days
+# business days starting from start. Prices follow a geometric random walk with daily volatility vol, with a common
+# market factor so the tickers are correlated. If gap_fraction is above 0, that fraction of the tickers start late or
+# stop early (ie. IPOs and delistings), and that fraction of the remaining prices are missing at random. The same seed
+# always gives the same prices.
+def synthetic_closes(n_tickers, n_days, seed=0, gap_fraction=0.0, start='2000-01-03', vol=0.02):
+    dates = pd.bdate_range(start, periods=n_days, name='Date')
+    tickers = ['T{:04d}'.format(i) for i in range(n_tickers)]
+    return pd.DataFrame(_synthetic_values(seed, n_days, n_tickers, gap_fraction, vol), index=dates, columns=tickers)
+
+# Function that generates the synthetic closing prices for synthetic_closes as an array.
+def _synthetic_values(seed, n_days, n_tickers, gap_fraction, vol):
+    rng = np.random.default_rng(seed)
+
+    # Daily returns are half market factor and half ticker specific noise.
+    market = rng.normal(0.0, vol / np.sqrt(2), size=(n_days, 1))
+    noise = rng.normal(0.0, vol / np.sqrt(2), size=(n_days, n_tickers))
+    closes = 100.0 * np.exp(np.cumsum(market + noise, axis=0))
+
+    if gap_fraction > 0:
+        # Cut the start or end off the history of some tickers, then drop some prices at random.
+        cut = rng.random(n_tickers) < gap_fraction
+        for i in np.flatnonzero(cut):
+            at = rng.integers(1, max(n_days - 1, 2))
+            if rng.random() < 0.5:
+                closes[:at, i] = np.nan
+            else:
+                closes[at:, i] = np.nan
+        closes[rng.random((n_days, n_tickers)) < gap_fraction] = np.nan
+
+    return closes
+
+# Price source that serves synthetic closing prices, for use in place of Yahoo Finance. Every ticker's prices are
+# generated from seed and the ticker name alone over a fixed calendar of n_days business days starting from start, so
+# any ticker name works and repeat requests always return the same prices. Unlike synthetic_closes, each ticker's prices
+# are generated independently, so they share no market factor. Wrap it in a DelayedSource to add network latency.
+class SyntheticSource(PriceSource):
+    def __init__(self, n_days=7500, seed=0, gap_fraction=0.0, start='1990-01-01'):
+        self.n_days = n_days
+        self.seed = seed
+        self.gap_fraction = gap_fraction
+        self.start = start
+        self.dates = pd.bdate_range(start, periods=n_days, name='Date')
+
+    def history(self, ticker, start, end):
+        values = _synthetic_values((self.seed, zlib.crc32(ticker.encode())), self.n_days, 1, self.gap_fraction, 0.02)
+        close = pd.Series(values[:, 0], index=self.dates, name='Close').dropna()
+        return close[(close.index >= pd.Timestamp(start)) & (close.index < pd.Timestamp(end))]
+
+# Function that writes synthetic intraday bars for n_tickers tickers over n_days business days starting from start to
+# directory, as one Parquet file per ticker in the form read by intraday.py (a Datetime and a Close column). Each day
+# has a bar every minutes minutes from 9:30 to 16:00 (the close of the first bar is at 9:30 + minutes), and the prices
+# follow a geometric random walk with daily volatility vol spread over the day's bars. Tickers are generated and
+# written one at a time, and each file is written in row groups of row_group_rows bars. Returns the list of tickers.
+def write_synthetic_bars(directory, n_tickers, n_days, minutes=1, seed=0, gap_fraction=0.0, start='2020-01-02',
+                         vol=0.02, row_group_rows=2 ** 16):
+    import os
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    os.makedirs(directory, exist_ok=True)
+    offsets = pd.timedelta_range(pd.Timedelta(hours=9, minutes=30 + minutes), pd.Timedelta(hours=16),
+                                 freq='{}min'.format(minutes))
+    days = pd.bdate_range(start, periods=n_days)
+    times = (days.values[:, None] + offsets.values[None, :]).ravel()
+    tickers = ['T{:04d}'.format(i) for i in range(n_tickers)]
+    for t in tickers:
+        close = _synthetic_values((seed, zlib.crc32(t.encode())), len(times), 1, gap_fraction,
+                                  vol / np.sqrt(len(offsets)))[:, 0]
+        present = ~np.isnan(close)
+        table = pa.table({'Datetime': times[present], 'Close': close[present]})
+        pq.write_table(table, os.path.join(directory, t + '.parquet'), row_group_size=row_group_rows)
+    return tickers
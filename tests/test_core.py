@@ -0,0 +1,80 @@
+'''
+Daniel McNulty II
+
+Offline tests of the contrarian strategy tester's computational core in core.
+'''
+
+# Import necessary libraries and functions.
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import daily_return, contrarian_portfolio_ret, coverage_report, period_summaries
+from synthetic import SyntheticSource, synthetic_closes
+
+# Test that a date range holding no trading days reports every ticker as having no data rather than failing.
+def test_coverage_report_no_dates():
+    source = SyntheticSource(n_days=2000, start='2000-01-03')
+    dr = daily_return(['T0000', 'T0001', 'T0002'], '2005-01-08', '2005-01-10', source=source)
+    report = coverage_report(dr)
+    assert len(dr) == 0
+    assert list(report['Ticker']) == ['T0000', 'T0001', 'T0002']
+    assert (report['Status'] == 'No data').all()
+    assert (report['Days Live'] == 0).all()
+
+# Test that the single pass period summaries match a pandas groupby of the returns by month, quarter, and year, with
+# missing returns (one on its own and a whole month of them) only affecting their own periods.
+def test_period_summaries_match_groupby():
+    dates = pd.bdate_range('2010-01-01', '2012-12-31')
+    ret = np.random.default_rng(1).normal(0.0005, 0.01, len(dates))
+    ret[300] = np.nan
+    ret[(dates.year == 2012) & (dates.month == 3)] = np.nan
+    summaries = period_summaries(pd.DataFrame({'Date': dates.date, 'Strategy Daily Return': ret}), 252)
+    for period in ('M', 'Q', 'Y'):
+        groups = pd.Series(ret, index=dates).groupby(dates.to_period(period))
+        result = summaries[period]
+        assert len(result) == groups.ngroups
+        np.testing.assert_allclose(result['Average Daily Return'], groups.mean(), rtol=0, atol=1e-15)
+        np.testing.assert_allclose(result['Standard Deviation of Daily Returns'], groups.std(), rtol=0, atol=1e-15)
+    assert summaries['Y']['Average Daily Return'].notna().all()
+    assert summaries['M']['Average Daily Return'].isna().sum() == 1
+
+# Function that returns a panel of synthetic daily returns (Dates x tickers), with gap_fraction of the tickers entering
+# or leaving part way through and that fraction of the other returns missing.
+def _returns_panel(gap_fraction=0.0, n_tickers=12, n_days=400):
+    closes = synthetic_closes(n_tickers, n_days, seed=3, gap_fraction=gap_fraction)
+    return closes.pct_change(fill_method=None).iloc[1:]
+
+# Test that the numpy and pandas contrarian portfolio engines return the same daily returns, excess returns, and
+# weights, collateral, and strategy returns, on panels with and without missing returns.
+def test_contrarian_engines_match():
+    for gap_fraction in (0.0, 0.1):
+        dr = _returns_panel(gap_fraction)
+        for numpy_df, pandas_df in zip(contrarian_portfolio_ret(dr, engine='numpy'),
+                                       contrarian_portfolio_ret(dr, engine='pandas')):
+            pd.testing.assert_frame_equal(numpy_df, pandas_df, check_exact=False, rtol=0, atol=1e-15)
+
+# Test that the dynamic universe engine matches the static one on a panel without missing returns, and a row by row
+# reference on one with tickers entering and leaving: each day's weights spread over the tickers live the day before,
+# and a live ticker's missing return on the day it is held counting as 0.
+def test_dynamic_universe_matches_reference():
+    dr = _returns_panel()
+    static = contrarian_portfolio_ret(dr)[2]
+    dynamic = contrarian_portfolio_ret(dr, dynamic_universe=True)[2]
+    np.testing.assert_allclose(dynamic['Strategy Daily Return'], static['Strategy Daily Return'], rtol=0, atol=1e-15)
+    assert (dynamic['Universe Size'] == dr.shape[1]).all()
+
+    dr = _returns_panel(0.3)
+    results = contrarian_portfolio_ret(dr, dynamic_universe=True)[2]
+    expected = []
+    for t in range(1, len(dr)):
+        live = dr.iloc[t - 1].dropna()
+        weights = -(live - live.mean()) / len(live)
+        collateral = weights.abs().sum() / 2
+        held = (weights * dr.iloc[t][live.index].fillna(0.0)).sum()
+        expected.append(held / collateral if collateral else 0.0)
+    np.testing.assert_allclose(results['Strategy Daily Return'], expected, rtol=0, atol=1e-14)
+    np.testing.assert_array_equal(results['Universe Size'], dr.notna().sum(axis=1).to_numpy()[:-1])
@@ -0,0 +1,39 @@
+'''
+Daniel McNulty II
+
+Offline tests of the server-side paging, sorting, and filtering of the dashboard's DataTables in functions.
+'''
+
+# Import necessary libraries and functions.
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions import page_frame
+
+# Function that returns a table like the summary statistics by month, with a Date column of Month labels.
+def _summary_table():
+    return pd.DataFrame({'Date': ['2020-{:02d}'.format(m) for m in range(1, 13)],
+                         'Average Daily Return': np.linspace(-0.01, 0.01, 12),
+                         'Annualized Average Daily Return': np.linspace(-2.5, 2.5, 12)})
+
+# Test that a filter on a column whose name contains an operator (ie. 'Average' contains 'ge ') is applied rather than
+# split inside the column name and dropped.
+def test_page_frame_filters_column_names_containing_operators():
+    df = _summary_table()
+    rows, _ = page_frame(df, 0, 100, filter_query='{Average Daily Return} > 0')
+    assert len(rows) == 6
+    rows, _ = page_frame(df, 0, 100, filter_query='{Annualized Average Daily Return} le -1')
+    assert len(rows) == 4
+
+# Test that filter parts which cannot be compared with their column are skipped, and that Date columns holding dates
+# are compared with the value read as a date.
+def test_page_frame_skips_filters_that_cannot_apply():
+    df = _summary_table()
+    assert len(page_frame(df, 0, 100, filter_query='{Average Daily Return} > abc')[0]) == 12
+    assert len(page_frame(df, 0, 100, filter_query='{Date} > 2020-06')[0]) == 6
+    dates = pd.DataFrame({'Date': pd.bdate_range('2019-12-30', periods=10).date, 'AAPL': np.arange(10.0)})
+    assert len(page_frame(dates, 0, 100, filter_query='{Date} > 2020')[0]) == 7
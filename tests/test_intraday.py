@@ -0,0 +1,63 @@
+'''
+Daniel McNulty II
+
+Offline tests of the intraday mode of the contrarian strategy tester in intraday.
+'''
+
+# Import necessary libraries and functions.
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import contrarian_portfolio_ret
+from intraday import bar_closes, bar_path, contrarian_bar_ret
+from synthetic import write_synthetic_bars
+
+# Function that writes synthetic 5 minute bars with missing bars to directory, plus a ticker (LATE) that only trades
+# in the middle of the history, so the universe changes size, and returns the list of tickers.
+def _write_bars(directory):
+    tickers = write_synthetic_bars(directory, n_tickers=6, n_days=4, minutes=5, seed=5, gap_fraction=0.1)
+    late = pd.read_parquet(bar_path(directory, tickers[0]))
+    late.iloc[60:200].to_parquet(bar_path(directory, 'LATE'), index=False)
+    return tickers + ['LATE']
+
+# Function that returns the closing prices of every bar of a list of tickers read whole, carried forward over missing
+# bars but not past each ticker's last bar.
+def _whole_closes(directory, tickers):
+    closes = pd.concat({t: pd.read_parquet(bar_path(directory, t)).set_index('Datetime')['Close'] for t in tickers},
+                       axis=1, sort=True)
+    last = closes.apply(pd.Series.last_valid_index)
+    filled = closes.ffill()
+    for t in tickers:
+        filled.loc[filled.index > last[t], t] = np.nan
+    return filled
+
+# Test that the chunked closing prices match the prices read whole, whatever the chunk size.
+def test_bar_closes_match_whole_read(tmp_path):
+    tickers = _write_bars(tmp_path)
+    whole = _whole_closes(tmp_path, tickers)
+    for chunk_rows in (7, 50, 100000):
+        chunked = pd.concat(list(bar_closes(tmp_path, tickers, chunk_rows=chunk_rows)))
+        np.testing.assert_array_equal(chunked.to_numpy(), whole.to_numpy())
+        assert (chunked.index == whole.index).all()
+
+# Test that the chunked strategy results are the same whatever the chunk size, and match the daily engine run over
+# the returns of every bar at once.
+def test_contrarian_bar_ret_chunk_sizes_match(tmp_path):
+    tickers = _write_bars(tmp_path)
+    runs = [pd.concat(list(contrarian_bar_ret(tmp_path, tickers, chunk_rows=chunk_rows)), ignore_index=True)
+            for chunk_rows in (7, 50, 100000)]
+    for run in runs[1:]:
+        pd.testing.assert_frame_equal(run, runs[0])
+
+    # The daily engine keeps only the date of each row, so the bar times are checked against the returns' index.
+    ret = _whole_closes(tmp_path, tickers).pct_change(fill_method=None).iloc[1:].rename_axis('Date')
+    expected = contrarian_portfolio_ret(ret, dynamic_universe=True)[2]
+    assert list(runs[0].columns[1:-1]) == list(expected.columns[1:-1])
+    assert (runs[0]['Datetime'].to_numpy() == ret.index[1:].to_numpy()).all()
+    np.testing.assert_allclose(runs[0].iloc[:, 1:].to_numpy(dtype=float), expected.iloc[:, 1:].to_numpy(dtype=float),
+                               rtol=1e-12, atol=1e-15)
+    assert runs[0]['Universe Size'].min() < runs[0]['Universe Size'].max()
@@ -0,0 +1,123 @@
+'''
+Daniel McNulty II
+
+Offline tests of the concurrent price fetching in price_store.
+'''
+
+# Import necessary libraries and functions.
+import os
+import sys
+import threading
+import time
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_store import DelayedSource, FetchError, PriceSource, PriceStore, fetch_histories
+from synthetic import SyntheticSource
+
+# Test that a source which hangs on every request fails the fetch soon after the timeouts, rather than leaving retries
+# queued forever behind the threads still stuck on abandoned attempts.
+def test_fetch_histories_hung_source_fails_promptly():
+    source = DelayedSource(SyntheticSource(n_days=300, start='2000-01-03'), delay=4.0)
+    begun = time.monotonic()
+    with pytest.raises(FetchError) as error:
+        fetch_histories(source, ['T0000', 'T0001', 'T0002'], '2000-01-03', '2001-01-01', max_workers=2, timeout=0.2,
+                        retries=2, backoff=0.05)
+    assert time.monotonic() - begun < 2.0
+    assert set(error.value.failed) == {'T0000', 'T0001', 'T0002'}
+
+# Test that an explicit deadline caps the whole fetch.
+def test_fetch_histories_deadline():
+    source = DelayedSource(SyntheticSource(n_days=300, start='2000-01-03'), delay=4.0)
+    begun = time.monotonic()
+    with pytest.raises(FetchError) as error:
+        fetch_histories(source, ['T0000'], '2000-01-03', '2001-01-01', timeout=10.0, deadline=0.3)
+    assert time.monotonic() - begun < 1.0
+    assert 'gave up' in error.value.failed['T0000']
+
+# Test that a slow but working source is still collected in full when requests queue for threads.
+def test_fetch_histories_slow_source():
+    tickers = ['T{:04d}'.format(i) for i in range(6)]
+    source = DelayedSource(SyntheticSource(n_days=300, start='2000-01-03'), delay=0.1)
+    results = fetch_histories(source, tickers, '2000-01-03', '2001-01-01', max_workers=2, timeout=0.5)
+    assert sorted(results) == tickers
+    assert all(len(close) > 0 for close in results.values())
+
+# Source that serves individual requests from another source but whose bulk requests (See fetch_histories) either hang
+# for delay seconds or raise an error.
+class BulkSource(PriceSource):
+    def __init__(self, source, delay=None):
+        self.source = source
+        self.delay = delay
+
+    def history(self, ticker, start, end):
+        return self.source.history(ticker, start, end)
+
+    def histories(self, tickers, start, end):
+        if self.delay is None:
+            raise RuntimeError('bulk request refused')
+        time.sleep(self.delay)
+        return {t: self.source.history(t, start, end) for t in tickers}
+
+# Test that a hung bulk request is held to the timeout, and the tickers are then collected individually.
+def test_fetch_histories_hung_bulk_request():
+    source = BulkSource(SyntheticSource(n_days=300, start='2000-01-03'), delay=4.0)
+    begun = time.monotonic()
+    results = fetch_histories(source, ['T0000', 'T0001'], '2000-01-03', '2001-01-01', timeout=0.2)
+    assert time.monotonic() - begun < 1.0
+    assert sorted(results) == ['T0000', 'T0001']
+
+# Test that the error of a failed bulk request is kept on the FetchError rather than swallowed.
+def test_fetch_histories_bulk_error_recorded():
+    source = BulkSource(DelayedSource(SyntheticSource(n_days=300, start='2000-01-03'), delay=4.0))
+    with pytest.raises(FetchError) as error:
+        fetch_histories(source, ['T0000', 'T0001'], '2000-01-03', '2001-01-01', timeout=0.2, retries=0)
+    assert error.value.bulk_error == 'bulk request refused'
+    assert 'bulk request refused' in str(error.value)
+
+# Test that several threads writing the same ticker to a price store at once never trip over each other's temporary
+# files, and leave a complete, readable copy in place.
+def test_price_store_concurrent_writes(tmp_path):
+    store = PriceStore(str(tmp_path), SyntheticSource(n_days=300, start='2000-01-03'))
+    close = store.source.history('T0000', '2000-01-03', '2001-01-01')
+    ranges = [(close.index[0], close.index[-1])]
+    errors = []
+    barrier = threading.Barrier(8)
+
+    def write():
+        barrier.wait()
+        try:
+            for _ in range(20):
+                store._write('T0000', close, ranges)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert store.history('T0000', '2000-01-03', close.index[-1]).equals(close[:-1])
+    assert not [f for f in os.listdir(str(tmp_path)) if f.endswith('.tmp')]
+
+# Test that a store preloaded from a snapshot serves the same prices as one preloaded from disk, from read-only
+# arrays mapped from the snapshot's files, and still reads dates the snapshot does not hold from disk.
+def test_price_store_snapshot_preload(tmp_path):
+    store = PriceStore(str(tmp_path), SyntheticSource(n_days=600, start='2000-01-03'))
+    for ticker in ('T0000', 'T0001', 'T0002'):
+        store.history(ticker, '2000-01-03', '2001-01-01')
+    snapshot, n_tickers, n_bytes = store.snapshot()
+    read = PriceStore(str(tmp_path), store.source)
+    mapped = PriceStore(str(tmp_path), store.source)
+    assert read.preload() == mapped.preload(snapshot) == (n_tickers, n_bytes)
+    assert n_tickers == 3
+    assert not mapped._preloaded[1].flags.writeable
+    assert isinstance(mapped._preloaded[1].base, np.memmap)
+    for ticker in ('T0000', 'T0001', 'T0002'):
+        expected = read.history(ticker, '2000-03-01', '2000-09-01')
+        assert mapped.history(ticker, '2000-03-01', '2000-09-01').equals(expected)
+    longer = mapped.history('T0000', '2000-03-01', '2002-01-01')
+    assert longer.index[-1] > read.history('T0000', '2000-03-01', '2001-01-01').index[-1]